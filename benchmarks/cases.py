@@ -0,0 +1,158 @@
+import importlib
+import os
+import tempfile
+import time
+from typing import Dict, Any
+
+from core.db_utils import (
+    BatchWriter,
+    get_connection,
+    init_retail_schema,
+    init_mfg_schema,
+    init_edu_schema,
+    insert_row,
+    insert_many,
+)
+from core.sheets_append import SheetBuffer, SheetWriter, load_worksheets
+from core.sinks import FakeSpreadsheet, FakeWorksheet
+from core.value_pools import FakerPool
+from benchmarks.datasets import write_seed_csvs
+
+# domain -> (simulator module, schema init, its init_*_ids and load_*_memory names)
+DOMAINS = {
+    "retail": ("domains.retail_simulator", init_retail_schema, "init_retail_ids", "load_retail_memory"),
+    "manufacturing": ("domains.manufacturing_simulator", init_mfg_schema, "init_mfg_ids", "load_mfg_memory"),
+    "education": ("domains.education_simulator", init_edu_schema, "init_edu_ids", "load_edu_memory"),
+}
+
+# records generated before the clock starts, so entity pools aren't empty
+WARMUP = 1000
+
+
+def _throughput(count: int, seconds: float, unit: str) -> Dict[str, Any]:
+    return {"value": count / seconds if seconds > 0 else 0.0, "unit": unit, "seconds": seconds}
+
+
+def _open_domain(domain: str, tmp: str):
+    """
+    Fresh SQLite DB for `domain` with the simulator module, its in-memory
+    state (empty), BatchWriter and IdAllocator, as main.py sets them up.
+    """
+    module, init_schema, init_ids, load_memory = DOMAINS[domain]
+    sim = importlib.import_module(module)
+    db_path = os.path.join(tmp, f"{domain}.db")
+    conn = get_connection(db_path)
+    init_schema(conn)
+    ids = getattr(sim, init_ids)(db_path)
+    db = BatchWriter(conn)
+    sim.seed_streams(0)
+    # fill the Faker pools now: a one-off startup cost the timed runs
+    # would otherwise count against the steady state
+    for pool in vars(sim).values():
+        if isinstance(pool, FakerPool):
+            pool.build()
+    return sim, conn, db, ids, getattr(sim, load_memory)(conn)
+
+
+def generate_records(domain: str, n: int) -> Dict[str, Any]:
+    """
+    Scalar path: one generate_records() call per record.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        sim, conn, db, ids, (a, b) = _open_domain(domain, tmp)
+        for _ in range(WARMUP):
+            sim.generate_records(a, b, db, ids)
+        start = time.perf_counter()
+        for _ in range(n):
+            sim.generate_records(a, b, db, ids)
+        db.flush()
+        seconds = time.perf_counter() - start
+        db.close()
+        ids.close()
+        conn.close()
+    return _throughput(n, seconds, "records/s")
+
+
+def generate_batch(domain: str, n: int, batch_size: int = 10_000, sqlite: bool = True) -> Dict[str, Any]:
+    """
+    Vectorized path: generate_batch() in chunks of `batch_size` records;
+    with sqlite=False, its db=None path that writes nothing to SQLite.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        sim, conn, db, ids, (a, b) = _open_domain(domain, tmp)
+        writer = db if sqlite else None
+        sim.generate_batch(WARMUP, a, b, writer, ids)
+        start = time.perf_counter()
+        done = 0
+        while done < n:
+            k = min(batch_size, n - done)
+            sim.generate_batch(k, a, b, writer, ids)
+            done += k
+        db.flush()
+        seconds = time.perf_counter() - start
+        db.close()
+        ids.close()
+        conn.close()
+    return _throughput(n, seconds, "records/s")
+
+
+def sqlite_insert(mode: str, n: int, chunk: int = 500) -> Dict[str, Any]:
+    """
+    Rows/s into retail_mem with insert_row (one commit per row) or
+    insert_many (one executemany + commit per `chunk` rows).
+    """
+    rows = [{"sale_id": f"S{i:07d}", "inv_id": f"I{i:07d}"} for i in range(n)]
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = get_connection(os.path.join(tmp, "insert.db"))
+        init_retail_schema(conn)
+        start = time.perf_counter()
+        if mode == "insert_row":
+            for r in rows:
+                insert_row(conn, "retail_mem", r)
+        else:
+            for i in range(0, n, chunk):
+                insert_many(conn, "retail_mem", rows[i:i + chunk])
+        seconds = time.perf_counter() - start
+        conn.close()
+    return _throughput(n, seconds, "rows/s")
+
+
+def sheet_buffer(n: int, buffer_size: int = 5, background: bool = False) -> Dict[str, Any]:
+    """
+    Rows/s through a SheetBuffer into an in-memory FakeWorksheet, flushing
+    inline or through the background SheetWriter. Measures the buffering
+    and retry wrapper overhead only; there is no network round trip.
+    """
+    ws = FakeWorksheet(0, "bench")
+    writer = SheetWriter() if background else None
+    buf = SheetBuffer(ws, buffer_size, writer)
+    row = ["S0000001", "P0001", "STR001", "2023-01-01", 3, 0.25, 249.75, 749.25]
+    start = time.perf_counter()
+    for _ in range(n):
+        buf.add(row)
+    buf.close()
+    if writer is not None:
+        writer.close()
+    seconds = time.perf_counter() - start
+    assert len(ws.values) == n
+    return _throughput(n, seconds, "rows/s")
+
+
+def seeding(domain: str, rows: int) -> Dict[str, Any]:
+    """
+    Seconds for init_from_csv_and_seed_db over synthetic CSVs of `rows`
+    rows each into a fresh DB, as a run with a non-sheets sink seeds (no
+    upload). Writing the CSVs isn't timed.
+    """
+    module, init_schema, _, _ = DOMAINS[domain]
+    sim = importlib.import_module(module)
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {"csv_paths": write_seed_csvs(domain, rows, tmp)}
+        conn = get_connection(os.path.join(tmp, f"{domain}.db"))
+        init_schema(conn)
+        ws_map = load_worksheets(FakeSpreadsheet(), {k: k for k in sim.TABLES})
+        start = time.perf_counter()
+        sim.init_from_csv_and_seed_db(config, ws_map, conn, upload=False)
+        seconds = time.perf_counter() - start
+        conn.close()
+    return {"value": seconds, "unit": "s", "seconds": seconds, "rows_per_sec": rows / seconds}
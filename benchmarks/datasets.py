@@ -0,0 +1,130 @@
+import os
+from typing import Dict, Callable
+
+import numpy as np
+import pandas as pd
+
+from core.batch_utils import format_ids, rand_dates, choice
+
+
+def _ids(prefix: str, nums: np.ndarray, width: int) -> np.ndarray:
+    return format_ids(prefix, nums, width)
+
+
+def _names(rng: np.random.Generator, n: int) -> np.ndarray:
+    first = ["Asha", "Ravi", "Meera", "Arjun", "Kavya", "Rohan", "Nisha", "Vikram"]
+    last = ["Sharma", "Iyer", "Reddy", "Patel", "Nair", "Gupta", "Das", "Singh"]
+    return np.char.add(np.char.add(choice(rng, first, n), " "), choice(rng, last, n))
+
+
+# worksheet key -> fn(rng, row numbers) returning those rows' CSV columns, as
+# init_from_csv_and_seed_db reads them
+RETAIL_CSVS: Dict[str, Callable] = {
+    "product": lambda rng, nums: {
+        "Product_ID": _ids("P", nums, 4),
+        "Product_Name": np.char.add("Item_", nums.astype(str)),
+        "Category": choice(rng, ["Beverages", "Snacks", "Dairy", "Personal Care"], len(nums)),
+        "Sub_Category": choice(rng, ["Tea", "Chips", "Milk", "Soap"], len(nums)),
+        "Brand": choice(rng, ["EcoFoods", "DailyMart", "FreshCO"], len(nums)),
+        "Cost_Price": np.round(rng.uniform(20.0, 200.0, len(nums)), 2),
+        "Selling_Price": np.round(rng.uniform(200.0, 800.0, len(nums)), 2),
+        "Shelf_Life_Days": rng.integers(60, 366, len(nums)),
+    },
+    "store": lambda rng, nums: {
+        "Store_ID": _ids("STR", nums, 3),
+        "Store_Name": choice(rng, ["CityMart Superstore", "GreenLeaf Market"], len(nums)),
+        "Location": choice(rng, ["Pune", "Mumbai", "Chennai"], len(nums)),
+        "Manager_Name": _names(rng, len(nums)),
+        "Store_Type": choice(rng, ["Small", "Medium", "Large"], len(nums)),
+    },
+    "sales": lambda rng, nums: {
+        "Sale_ID": _ids("S", nums, 4),
+        "Product_ID": _ids("P", nums, 4),
+        "Store_ID": _ids("STR", nums, 3),
+        "Date": rand_dates(rng, len(nums)),
+        "Units_Sold": rng.integers(1, 21, len(nums)),
+        "Discount": np.round(rng.uniform(0.10, 0.50, len(nums)), 2),
+        "Final_Price": np.round(rng.uniform(200.0, 800.0, len(nums)), 2),
+        "Revenue": np.round(rng.uniform(200.0, 16000.0, len(nums)), 2),
+    },
+    "inventory": lambda rng, nums: {
+        "Inventory_ID": _ids("I", nums, 4),
+        "Product_ID": _ids("P", nums, 4),
+        "Opening": rng.integers(50, 201, len(nums)),
+        "Received": rng.integers(10, 51, len(nums)),
+        "Sold": rng.integers(1, 21, len(nums)),
+        "Closing": rng.integers(40, 250, len(nums)),
+    },
+}
+
+MFG_CSVS: Dict[str, Callable] = {
+    "equipment": lambda rng, nums: {
+        "Equipment_ID": _ids("EQT", nums, 3),
+        "Equipment_Name": np.char.add("Machine_", nums.astype(str)),
+        "Equipment_Type": choice(rng, ["Press", "Lathe", "CNC"], len(nums)),
+        "Manufacturer": choice(rng, ["ABB", "Siemens", "Bosch"], len(nums)),
+        "Installation_Date": rand_dates(rng, len(nums)),
+        "Maintenance_Cycle_Days": rng.integers(30, 181, len(nums)),
+        "Location": choice(rng, ["Plant A", "Plant B"], len(nums)),
+        "Capacity_per_Hour": rng.integers(50, 501, len(nums)),
+        "Criticality_Score": rng.integers(1, 6, len(nums)),
+    },
+    "technician": lambda rng, nums: {
+        "Technician_ID": _ids("T", nums, 3),
+        "Name": _names(rng, len(nums)),
+        "Age": rng.integers(22, 60, len(nums)),
+        "Phone": rng.integers(6_000_000_000, 9_999_999_999, len(nums)),
+        "Level": choice(rng, ["Junior", "Senior", "Lead"], len(nums)),
+    },
+    "downtime": lambda rng, nums: {"Downtime_ID": _ids("DT", nums, 3)},
+    "maintenance": lambda rng, nums: {"Maintenance_ID": _ids("MT", nums, 3)},
+}
+
+EDU_CSVS: Dict[str, Callable] = {
+    "student": lambda rng, nums: {
+        "Student_ID": _ids("S", nums, 4),
+        "Name": _names(rng, len(nums)),
+        "Age": rng.integers(15, 30, len(nums)),
+        "Gender": choice(rng, ["Male", "Female"], len(nums)),
+        "Course_Enrolled": choice(rng, ["Maths", "Physics", "History"], len(nums)),
+        "Enrollment_Date": rand_dates(rng, len(nums)),
+        "Learning_Style": choice(rng, ["Visual", "Auditory", "Kinesthetic"], len(nums)),
+        "Prior_Grade": choice(rng, ["A", "B", "C", "D"], len(nums)),
+    },
+    "module": lambda rng, nums: {
+        "Module_ID": _ids("M", nums, 3),
+        "Module_Name": np.char.add("Module", nums.astype(str)),
+        "Course_Name": choice(rng, ["Maths", "Physics", "History"], len(nums)),
+        "Difficulty_Level": rng.integers(1, 6, len(nums)),
+        "Module_Type": choice(rng, ["Quiz", "Video", "Reading"], len(nums)),
+    },
+    "progress": lambda rng, nums: {"Record_ID": _ids("R", nums, 4)},
+    "resource": lambda rng, nums: {"Resource_ID": _ids("RU", nums, 4)},
+}
+
+SEED_CSVS = {
+    "retail": RETAIL_CSVS,
+    "manufacturing": MFG_CSVS,
+    "education": EDU_CSVS,
+}
+
+
+def write_seed_csvs(domain: str, n_rows: int, out_dir: str, seed: int = 0,
+                    chunk_rows: int = 50_000) -> Dict[str, str]:
+    """
+    Write synthetic seed CSVs with `n_rows` rows each for `domain`, in the
+    layout init_from_csv_and_seed_db expects, `chunk_rows` rows at a time
+    (so the seeding benchmark's peak RSS is seeding's, not this). Returns
+    the csv_paths config.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for key, make in SEED_CSVS[domain].items():
+        path = os.path.join(out_dir, f"{key}.csv")
+        for start in range(0, max(n_rows, 1), chunk_rows):
+            nums = np.arange(start + 1, min(start + chunk_rows, n_rows) + 1)
+            pd.DataFrame(make(rng, nums)).to_csv(path, index=False, mode="a" if start else "w",
+                                                 header=not start)
+        paths[key] = path
+    return paths
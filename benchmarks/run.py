@@ -0,0 +1,197 @@
+"""
+Benchmark suite. Run from the repo root:
+
+    python -m benchmarks.run run --output bench.json
+    python -m benchmarks.run run --suite batch,sqlite --baseline bench.json
+    python -m benchmarks.run compare bench.json new.json --threshold 0.10
+
+Every case runs in a fresh process, so peak RSS is per case. Each one is
+repeated --repeat times and the best run is kept, which filters out most
+scheduling noise.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import time
+from typing import Dict, List, Any, Tuple
+
+from benchmarks import cases
+
+SUITES = ["generate", "batch", "sqlite", "sheets", "seeding"]
+DOMAINS = list(cases.DOMAINS)
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process in MB (None where the resource
+    module isn't available, i.e. Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_case(fn_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    result = getattr(cases, fn_name)(**params)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def build_cases(args) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """
+    (name, cases function, params) for every selected benchmark.
+    """
+    suites = args.suite.split(",")
+    domains = args.domain.split(",")
+    plan = []
+    if "generate" in suites:
+        for d in domains:
+            plan.append((f"generate_records/{d}", "generate_records", {"domain": d, "n": args.records}))
+    if "batch" in suites:
+        for d in domains:
+            plan.append((f"generate_batch/{d}", "generate_batch",
+                         {"domain": d, "n": args.batch_records, "batch_size": args.batch_size}))
+            plan.append((f"generate_batch/{d}/no_sqlite", "generate_batch",
+                         {"domain": d, "n": args.batch_records, "batch_size": args.batch_size,
+                          "sqlite": False}))
+    if "sqlite" in suites:
+        plan.append(("sqlite/insert_row", "sqlite_insert", {"mode": "insert_row", "n": args.insert_rows}))
+        plan.append(("sqlite/insert_many", "sqlite_insert", {"mode": "insert_many", "n": args.insert_rows}))
+    if "sheets" in suites:
+        plan.append(("sheets/sheet_buffer", "sheet_buffer", {"n": args.sheet_rows}))
+        plan.append(("sheets/sheet_buffer_background", "sheet_buffer",
+                     {"n": args.sheet_rows, "background": True}))
+    if "seeding" in suites:
+        for d in domains:
+            for rows in (int(s) for s in args.seed_sizes.split(",")):
+                plan.append((f"seeding/{d}/{rows}", "seeding", {"domain": d, "rows": rows}))
+    return plan
+
+
+def best_of(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # seconds: lower is better, everything else is a rate
+    pick = min if runs[0]["unit"] == "s" else max
+    best = dict(pick(runs, key=lambda r: r["value"]))
+    best["runs"] = [r["value"] for r in runs]
+    return best
+
+
+def run_benchmarks(args) -> Dict[str, Any]:
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name, fn_name, params in build_cases(args):
+        runs = []
+        for _ in range(max(1, args.repeat)):
+            with ctx.Pool(1) as pool:
+                runs.append(pool.apply(_run_case, (fn_name, params)))
+        r = best_of(runs)
+        r["params"] = params
+        results[name] = r
+        rss = f"{r['peak_rss_mb']:,.0f} MB" if r["peak_rss_mb"] is not None else "n/a"
+        print(f"{name:40s} {r['value']:>14,.1f} {r['unit']:10s} peak RSS {rss}")
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any],
+            threshold: float = 0.10, rss_threshold: float = 0.20) -> List[str]:
+    """
+    Print current vs baseline for every benchmark present in both and
+    return the regressions: throughput down (or seconds up) by more than
+    `threshold`, or peak RSS up by more than `rss_threshold`.
+    """
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        change = (cur["value"] - base["value"]) / base["value"] if base["value"] else 0.0
+        # seconds: lower is better, everything else is a rate
+        worse = change > threshold if cur["unit"] == "s" else change < -threshold
+        flag = "REGRESSION" if worse else ""
+        print(f"{name:40s} {base['value']:>14,.1f} -> {cur['value']:>14,.1f} {cur['unit']:10s} "
+              f"{change:+7.1%} {flag}")
+        if worse:
+            regressions.append(f"{name}: {change:+.1%} {cur['unit']}")
+        if base.get("peak_rss_mb") and cur.get("peak_rss_mb") is not None:
+            rss_change = (cur["peak_rss_mb"] - base["peak_rss_mb"]) / base["peak_rss_mb"]
+            if rss_change > rss_threshold:
+                print(f"{'':40s} peak RSS {base['peak_rss_mb']:,.0f} -> {cur['peak_rss_mb']:,.0f} MB "
+                      f"{rss_change:+7.1%} REGRESSION")
+                regressions.append(f"{name}: peak RSS {rss_change:+.1%}")
+    return regressions
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def report(regressions: List[str]) -> int:
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for r in regressions:
+            print(f"  {r}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run benchmarks and write JSON results")
+    run.add_argument("--suite", default=",".join(SUITES), help=f"Comma-separated: {','.join(SUITES)}")
+    run.add_argument("--domain", default=",".join(DOMAINS), help="Comma-separated domains")
+    run.add_argument("--records", type=int, default=20_000, help="Records per generate_records run")
+    run.add_argument("--batch-records", type=int, default=200_000, help="Records per generate_batch run")
+    run.add_argument("--batch-size", type=int, default=10_000, help="Records per generate_batch call")
+    run.add_argument("--insert-rows", type=int, default=20_000, help="Rows per SQLite insert run")
+    run.add_argument("--sheet-rows", type=int, default=200_000, help="Rows per SheetBuffer run")
+    run.add_argument("--seed-sizes", default="10000,100000,1000000",
+                     help="Comma-separated CSV row counts for the seeding runs")
+    run.add_argument("--repeat", type=int, default=3, help="Runs per case, the best one is kept")
+    run.add_argument("--output", default="bench.json", help="Where to write the results")
+    run.add_argument("--baseline", help="Compare against this saved result file")
+    run.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown (0.10 = 10%%)")
+    run.add_argument("--rss-threshold", type=float, default=0.20, help="Allowed peak RSS growth")
+
+    cmp_ = sub.add_parser("compare", help="Compare two result files")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("current")
+    cmp_.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown (0.10 = 10%%)")
+    cmp_.add_argument("--rss-threshold", type=float, default=0.20, help="Allowed peak RSS growth")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        regressions = compare(load_results(args.baseline), load_results(args.current),
+                              args.threshold, args.rss_threshold)
+        sys.exit(report(regressions))
+
+    results = run_benchmarks(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        print()
+        regressions = compare(load_results(args.baseline), results, args.threshold, args.rss_threshold)
+        sys.exit(report(regressions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+from typing import Any, Sequence, Tuple, Union
+
+import numpy as np
+
+
+# 10**1 .. 10**18, the digit count thresholds of an int64
+POW10 = 10 ** np.arange(1, 19, dtype=np.int64)
+
+
+def format_ids(prefix: Union[str, np.ndarray], nums: np.ndarray, width: int) -> np.ndarray:
+    """
+    Vectorized f"{prefix}{num:0{width}d}" for non-negative nums: the digits
+    are written straight into a UCS4 character matrix, one pass per digit
+    position, and the matrix is viewed as a "U" array (shorter IDs end in
+    NULs, which the dtype drops). `prefix` is one string or a "U" array
+    with one per num.
+    """
+    nums = np.asarray(nums, dtype=np.int64)
+    n = len(nums)
+    lengths = np.maximum(np.searchsorted(POW10, nums, side="right") + 1, width)
+    if isinstance(prefix, str):
+        head = np.array([ord(c) for c in prefix], dtype=np.uint32)
+        starts = len(head)
+    else:
+        prefix = np.asarray(prefix, dtype=str)
+        head = np.ascontiguousarray(prefix).view(np.uint32).reshape(n, prefix.dtype.itemsize // 4)
+        starts = np.count_nonzero(head, axis=1)
+    size = head.shape[-1] + (int(lengths.max()) if n else max(width, 1))
+    chars = np.zeros((n, size), dtype=np.uint32)
+    chars[:, :head.shape[-1]] = head
+    last = lengths + starts - 1
+    rows = np.arange(n)
+    rest = nums.copy()
+    for k in range(size - head.shape[-1]):
+        live = lengths > k
+        if live.all():
+            chars[rows, last - k] = rest % 10 + ord("0")
+        else:
+            chars[rows[live], last[live] - k] = rest[live] % 10 + ord("0")
+        rest //= 10
+    return chars.view(f"U{size}").ravel()
+
+
+def id_array(ids: range) -> np.ndarray:
+    """
+    IDs from IdAllocator.take() as an int64 array.
+    """
+    return np.arange(ids.start, ids.stop, ids.step, dtype=np.int64)
+
+
+def rand_dates(rng: np.random.Generator, n: int,
+               start: str = "2023-01-01", days: int = 600) -> np.ndarray:
+    """
+    n "%Y-%m-%d" strings drawn uniformly from [start, start + days].
+    """
+    table = (np.datetime64(start, "D") + np.arange(days + 1)).astype(str)
+    return table[rng.integers(0, days + 1, n)]
+
+
+def choice(rng: np.random.Generator, values: Sequence[Any], n: int) -> np.ndarray:
+    return np.asarray(values)[rng.integers(0, len(values), n)]
+
+
+def pick_entities(rng: np.random.Generator, n: int, n_existing: int,
+                  prob_new: float, sampler=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Batch version of the get_or_create_* rule: each draw creates a new entity
+    with probability prob_new (or when none exist yet), otherwise picks
+    among the existing entities plus those created earlier in the batch,
+    uniformly or by the popularity of a weighted sampler (see
+    core/sampling.py). Returns (index into existing + new entities, is_new
+    mask).
+    """
+    is_new = rng.random(n) < prob_new
+    if n_existing == 0 and n > 0:
+        is_new[0] = True
+    created_before = np.cumsum(is_new) - is_new
+    pool = n_existing + created_before
+    if sampler is None or sampler.skew is None:
+        picked = (rng.random(n) * pool).astype(np.int64)
+    else:
+        picked = sampler.draws(rng, np.maximum(pool, 1))
+    idx = np.where(is_new, pool, picked)
+    return idx, is_new
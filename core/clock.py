@@ -0,0 +1,176 @@
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+# rendering of every event timestamp; sorts lexicographically in time order
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
+
+# defaults of the YAML `clock` section
+CLOCK_SETTINGS = {
+    "start": "2023-01-01",       # virtual time of the first event of a fresh DB, or "now"
+    "interarrival": "exponential",  # fixed | exponential | uniform
+    "mean_seconds": 600.0,       # gap between events (fixed, exponential)
+    "min_seconds": 0.0,          # gap bounds (uniform)
+    "max_seconds": 1200.0,
+    "speed": None,               # virtual seconds per wall second, instead of gaps
+    "checkpoint_events": 1000,   # persist the clock every this many events
+}
+INTERARRIVALS = ("fixed", "exponential", "uniform")
+
+
+def init_clock_schema(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS sim_clock (domain TEXT PRIMARY KEY, now REAL NOT NULL)")
+    conn.commit()
+
+
+def format_time(t: float) -> str:
+    return (EPOCH + timedelta(seconds=t)).strftime(TIME_FORMAT)
+
+
+def format_times(t: np.ndarray) -> np.ndarray:
+    """
+    Vectorized format_time: only the distinct days go through
+    datetime_as_string (a batch of event times spans a few), the time of
+    day is written as digits into a UCS4 character matrix, which is then
+    viewed as a "U19" array.
+    """
+    days, seconds = np.divmod(np.floor(t).astype(np.int64), 86400)
+    day_values, day_idx = np.unique(days, return_inverse=True)
+    # "YYYY-MM-DD"; datetime itself stops at year 9999
+    dates = np.datetime_as_string(day_values.astype("datetime64[D]")).astype("U10")
+    chars = np.empty((len(days), 19), dtype=np.uint32)
+    chars[:, :10] = dates.view(np.uint32).reshape(-1, 10)[day_idx.ravel()]
+    chars[:, 10] = ord(" ")
+    chars[:, 13] = chars[:, 16] = ord(":")
+    for col, value in ((11, seconds // 3600), (14, seconds // 60 % 60), (17, seconds % 60)):
+        chars[:, col] = value // 10 + ord("0")
+        chars[:, col + 1] = value % 10 + ord("0")
+    return chars.view("U19").ravel()
+
+
+def _parse_start(value: Any) -> float:
+    if value == "now":
+        return time.time()
+    if isinstance(value, datetime):
+        start = value
+    else:
+        start = datetime.fromisoformat(str(value))
+    return (start - EPOCH).total_seconds()
+
+
+class SimClock:
+    """
+    Virtual time of one domain's event stream, in seconds since 1970 (UTC).
+    Each event (tick) advances it by an inter-arrival gap drawn from the
+    domain's own random stream (so --seed runs repeat exactly) or, with
+    `speed`, follows the wall clock accelerated by that factor. It never
+    goes backwards, so outputs stamped from it are in time order as
+    appended.
+
+    The clock is kept in the domain DB's sim_clock table (every
+    `checkpoint_events` events and at close) and a restart continues from
+    there. A crash can repeat up to one checkpoint interval of timestamps.
+    Sharded workers each run a clock with the gaps scaled by the worker
+    count, so together they keep the configured event rate; each shard's
+    output is in order, a merged file is ordered per shard.
+    """
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self.conn = None
+        self.configure()
+
+    def configure(self, settings: Optional[Dict[str, Any]] = None, workers: int = 1):
+        opts = {**CLOCK_SETTINGS, **(settings or {})}
+        if opts["interarrival"] not in INTERARRIVALS:
+            raise ValueError(f"clock.interarrival must be one of {', '.join(INTERARRIVALS)}, "
+                             f"not {opts['interarrival']!r}")
+        self.start = _parse_start(opts["start"])
+        self.interarrival = opts["interarrival"]
+        self.mean = float(opts["mean_seconds"]) * workers
+        self.low = float(opts["min_seconds"]) * workers
+        self.high = float(opts["max_seconds"]) * workers
+        self.speed = None if opts["speed"] is None else float(opts["speed"])
+        self.checkpoint_events = int(opts["checkpoint_events"])
+        self.now = self.start
+        self.events = 0
+        self.wall_base = time.monotonic()
+        self.virtual_base = self.now
+
+    def open(self, conn):
+        """
+        Continue from the time saved in `conn` (the domain DB), if later.
+        """
+        self.conn = conn
+        init_clock_schema(conn)
+        row = conn.execute("SELECT now FROM sim_clock WHERE domain = ?", (self.domain,)).fetchone()
+        if row is not None:
+            self.now = max(self.now, row[0])
+        self.wall_base = time.monotonic()
+        self.virtual_base = self.now
+
+    def save(self):
+        if self.conn is None:
+            return
+        self.conn.execute(
+            "INSERT INTO sim_clock (domain, now) VALUES (?, ?) "
+            "ON CONFLICT(domain) DO UPDATE SET now = MAX(now, excluded.now)",
+            (self.domain, self.now),
+        )
+        self.conn.commit()
+
+    def _counted(self, n: int):
+        before = self.events
+        self.events += n
+        if self.checkpoint_events > 0 and before // self.checkpoint_events != self.events // self.checkpoint_events:
+            self.save()
+
+    def tick(self, rand) -> float:
+        """
+        Advance by one event, drawing the gap from `rand` (random.Random);
+        returns the event's time.
+        """
+        if self.speed is not None:
+            t = self.virtual_base + (time.monotonic() - self.wall_base) * self.speed
+        elif self.interarrival == "exponential":
+            t = self.now + rand.expovariate(1.0 / self.mean)
+        elif self.interarrival == "uniform":
+            t = self.now + rand.uniform(self.low, self.high)
+        else:
+            t = self.now + self.mean
+        self.now = max(self.now, t)
+        self._counted(1)
+        return self.now
+
+    def stamp(self, rand) -> str:
+        return format_time(self.tick(rand))
+
+    def ticks(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        """
+        Vectorized tick: times of the next n events (float64, ascending).
+        """
+        if self.speed is not None:
+            t = np.full(n, self.virtual_base + (time.monotonic() - self.wall_base) * self.speed)
+        else:
+            if self.interarrival == "exponential":
+                gaps = rng.exponential(self.mean, n)
+            elif self.interarrival == "uniform":
+                gaps = rng.uniform(self.low, self.high, n)
+            else:
+                gaps = np.full(n, self.mean)
+            t = self.now + np.cumsum(gaps)
+        t = np.maximum(t, self.now)
+        if n:
+            self.now = float(t[-1])
+        self._counted(n)
+        return t
+
+    def stamps(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        return format_times(self.ticks(rng, n))
+
+    def close(self):
+        self.save()
+        self.conn = None
@@ -1,10 +1,24 @@
+import atexit
 import sqlite3
-from typing import List, Dict, Any, Tuple
+import time
+from typing import List, Dict, Any, Tuple, Optional
 
+from core import metrics
 
-def get_connection(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
+# Applied to every connection; YAML `sqlite.pragmas` entries override them,
+# e.g. {synchronous: FULL, cache_size: -65536, mmap_size: 268435456}
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+}
+
+
+def get_connection(db_path: str, pragmas: Optional[Dict[str, Any]] = None) -> sqlite3.Connection:
+    # generous busy timeout: sharded workers take turns on the write lock
+    conn = sqlite3.connect(db_path, timeout=60)
     conn.row_factory = sqlite3.Row
+    for key, value in {**DEFAULT_PRAGMAS, **(pragmas or {})}.items():
+        conn.execute(f"PRAGMA {key} = {value}")
     return conn
 
 
@@ -40,6 +54,18 @@ def init_retail_schema(conn: sqlite3.Connection):
         inv_id TEXT
     )
     """)
+    cur.execute("CREATE INDEX IF NOT EXISTS retail_mem_sale_id ON retail_mem (sale_id)")
+
+    # InventoryLedger checkpoints (core/inventory.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS retail_inventory (
+        pid TEXT,
+        sid TEXT,
+        stock INTEGER NOT NULL,
+        pending INTEGER NOT NULL,
+        PRIMARY KEY (pid, sid)
+    )
+    """)
 
     conn.commit()
 
@@ -77,6 +103,7 @@ def init_mfg_schema(conn: sqlite3.Connection):
         maintenance_id TEXT
     )
     """)
+    cur.execute("CREATE INDEX IF NOT EXISTS mfg_mem_downtime_id ON mfg_mem (downtime_id)")
 
     conn.commit()
 
@@ -113,10 +140,156 @@ def init_edu_schema(conn: sqlite3.Connection):
         resource_id TEXT
     )
     """)
+    cur.execute("CREATE INDEX IF NOT EXISTS edu_mem_record_id ON edu_mem (record_id)")
+
+    conn.commit()
+
+
+def init_sequence_schema(conn: sqlite3.Connection):
+    cur = conn.cursor()
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS id_sequences (
+        name TEXT PRIMARY KEY,
+        next_val INTEGER NOT NULL
+    )
+    """)
 
     conn.commit()
 
 
+class IdAllocator:
+    """
+    Hands out integer IDs from counters persisted in the id_sequences table.
+
+    Each call to the database reserves a whole block of IDs inside a
+    BEGIN IMMEDIATE transaction, so several processes sharing one DB file
+    never receive overlapping ranges. Unused IDs of a block are skipped
+    after a restart, which leaves gaps but never reuses an ID.
+
+    Sharded workers use stride mode instead (workers > 1): worker `shard`
+    gets bases[name] + k * workers + shard for its k-th ID, from a snapshot
+    of the counters taken by the parent. That keeps every worker's IDs
+    disjoint and independent of scheduling, so seeded runs are repeatable.
+    next_val is still pushed past the IDs handed out, one block at a time.
+    """
+
+    def __init__(self, db_path: str, block_size: int = 100, shard: int = 0,
+                 workers: int = 1, bases: Optional[Dict[str, int]] = None):
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.block_size = max(1, int(block_size))
+        self.shard = shard
+        self.workers = workers
+        self.bases = bases or {}
+        init_sequence_schema(self.conn)
+        self.names: Dict[str, str] = {}
+        self.blocks: Dict[str, Tuple[int, int]] = {}
+        self.issued: Dict[str, int] = {}
+        self.limits: Dict[str, int] = {}
+
+    def register(self, key: str, table: str, column: str, prefix: str):
+        """
+        Map `key` to the sequence for table.column. A new sequence starts
+        after the highest numeric suffix already stored in that column,
+        which is the only time the existing rows are scanned.
+        """
+        name = f"{table}.{column}"
+        self.names[key] = name
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute("SELECT 1 FROM id_sequences WHERE name = ?", (name,))
+            if cur.fetchone() is None:
+                cur.execute(
+                    f"SELECT MAX(CAST(SUBSTR({column}, ?) AS INTEGER)) FROM {table}",
+                    (len(prefix) + 1,)
+                )
+                last = cur.fetchone()[0] or 0
+                cur.execute(
+                    "INSERT INTO id_sequences (name, next_val) VALUES (?, ?)",
+                    (name, last + 1)
+                )
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        Current next_val of every sequence, the `bases` for stride mode.
+        """
+        cur = self.conn.cursor()
+        cur.execute("SELECT name, next_val FROM id_sequences")
+        return {name: val for name, val in cur.fetchall()}
+
+    def _claim(self, name: str, count: int) -> int:
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute("SELECT next_val FROM id_sequences WHERE name = ?", (name,))
+            start = cur.fetchone()[0]
+            cur.execute(
+                "UPDATE id_sequences SET next_val = ? WHERE name = ?",
+                (start + count, name)
+            )
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        return start
+
+    def _advance(self, name: str, upto: int):
+        self.conn.execute(
+            "UPDATE id_sequences SET next_val = MAX(next_val, ?) WHERE name = ?",
+            (upto, name)
+        )
+
+    def _take_strided(self, name: str, count: int) -> range:
+        k = self.issued.get(name, 0)
+        self.issued[name] = k + count
+        if k + count > self.limits.get(name, 0):
+            self.limits[name] = k + count + self.block_size
+            self._advance(name, self.bases[name] + self.limits[name] * self.workers)
+        first = self.bases[name] + k * self.workers + self.shard
+        return range(first, first + count * self.workers, self.workers)
+
+    def next(self, key: str) -> int:
+        name = self.names[key]
+        if self.workers > 1:
+            return self._take_strided(name, 1)[0]
+        nxt, end = self.blocks.get(name, (0, 0))
+        if nxt >= end:
+            nxt = self._claim(name, self.block_size)
+            end = nxt + self.block_size
+        self.blocks[name] = (nxt + 1, end)
+        return nxt
+
+    def take(self, key: str, count: int) -> range:
+        """
+        `count` IDs at once: consecutive normally, strided in stride mode.
+        """
+        if count <= 0:
+            return range(0)
+        name = self.names[key]
+        if self.workers > 1:
+            return self._take_strided(name, count)
+        start = self._claim(name, count)
+        return range(start, start + count)
+
+    def close(self):
+        self.conn.close()
+
+
+def table_is_empty(conn: sqlite3.Connection, table: str) -> bool:
+    cur = conn.cursor()
+    cur.execute(f"SELECT 1 FROM {table} LIMIT 1")
+    return cur.fetchone() is None
+
+
+def count_rows(conn: sqlite3.Connection, table: str) -> int:
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
 def fetch_all(conn: sqlite3.Connection, table: str) -> List[Dict[str, Any]]:
     cur = conn.cursor()
     cur.execute(f"SELECT * FROM {table}")
@@ -124,6 +297,40 @@ def fetch_all(conn: sqlite3.Connection, table: str) -> List[Dict[str, Any]]:
     return [dict(r) for r in rows]
 
 
+def max_rowid(conn: sqlite3.Connection, table: str) -> int:
+    cur = conn.cursor()
+    cur.execute(f"SELECT MAX(rowid) FROM {table}")
+    return cur.fetchone()[0] or 0
+
+
+def fetch_since(conn: sqlite3.Connection, table: str, after_rowid: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Rows inserted after `after_rowid`, and the new high rowid.
+    """
+    cur = conn.cursor()
+    cur.execute(f"SELECT rowid AS _rowid, * FROM {table} WHERE rowid > ? ORDER BY rowid", (after_rowid,))
+    rows = []
+    last = after_rowid
+    for r in cur.fetchall():
+        d = dict(r)
+        last = d.pop("_rowid")
+        rows.append(d)
+    return rows, last
+
+
+def lookup_one(conn: sqlite3.Connection, table: str, key_column: str,
+               value_column: str, key: Any) -> Optional[Any]:
+    """
+    value_column of the row whose key_column equals key (an indexed lookup
+    on the mapping tables), or None. Rows still queued in a BatchWriter
+    aren't visible until it flushes.
+    """
+    cur = conn.cursor()
+    cur.execute(f"SELECT {value_column} FROM {table} WHERE {key_column} = ? LIMIT 1", (key,))
+    row = cur.fetchone()
+    return None if row is None else row[0]
+
+
 def insert_row(conn: sqlite3.Connection, table: str, data: Dict[str, Any]):
     cur = conn.cursor()
     cols = ", ".join(data.keys())
@@ -145,3 +352,102 @@ def insert_many(conn: sqlite3.Connection, table: str, rows: List[Dict[str, Any]]
         values
     )
     conn.commit()
+
+
+def insert_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, Any], commit: bool = True):
+    """
+    Column-oriented insert_many: columns maps column name -> array/list.
+    With commit=False the rows join the caller's open transaction.
+    """
+    if not columns:
+        return
+    cols = list(columns.keys())
+    values = [c.tolist() if hasattr(c, "tolist") else list(c) for c in columns.values()]
+    if not values[0]:
+        return
+    col_str = ", ".join(cols)
+    placeholder_str = ", ".join(["?"] * len(cols))
+    cur = conn.cursor()
+    cur.executemany(
+        f"INSERT OR REPLACE INTO {table} ({col_str}) VALUES ({placeholder_str})",
+        zip(*values)
+    )
+    if commit:
+        conn.commit()
+
+
+class BatchWriter:
+    """
+    Group-commit layer over a connection: rows are queued per table and
+    written with one executemany + commit once `max_rows` rows are pending
+    or the oldest pending row is `max_delay` seconds old. Pending rows are
+    flushed at interpreter exit as well, but callers should close() it.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, max_rows: int = 500, max_delay: float = 1.0):
+        self.conn = conn
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.pending: Dict[Tuple[str, Tuple[str, ...]], List[tuple]] = {}
+        self.count = 0
+        self.oldest: Optional[float] = None
+        atexit.register(self.flush)
+        self.gauge = lambda: self.count
+        metrics.SQLITE_PENDING.track(self.gauge)
+
+    def insert(self, table: str, data: Dict[str, Any]):
+        key = (table, tuple(data.keys()))
+        self.pending.setdefault(key, []).append(tuple(data.values()))
+        self.count += 1
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.poll()
+
+    def insert_columns(self, table: str, columns: Dict[str, Any]):
+        """
+        Queue a column-oriented batch (column name -> array/list).
+        """
+        values = [c.tolist() if hasattr(c, "tolist") else list(c) for c in columns.values()]
+        if not values or not values[0]:
+            return
+        key = (table, tuple(columns.keys()))
+        self.pending.setdefault(key, []).extend(zip(*values))
+        self.count += len(values[0])
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.poll()
+
+    def poll(self):
+        """
+        Flush if the size or time threshold has been reached.
+        """
+        if self.count >= self.max_rows or (
+            self.oldest is not None and time.monotonic() - self.oldest >= self.max_delay
+        ):
+            self.flush()
+
+    def flush(self):
+        if not self.count:
+            return
+        start = time.perf_counter()
+        cur = self.conn.cursor()
+        for (table, cols), rows in self.pending.items():
+            if not rows:
+                continue
+            col_str = ", ".join(cols)
+            placeholder_str = ", ".join(["?"] * len(cols))
+            cur.executemany(
+                f"INSERT OR REPLACE INTO {table} ({col_str}) VALUES ({placeholder_str})",
+                rows
+            )
+        self.conn.commit()
+        metrics.SQLITE_COMMIT_SECONDS.observe(time.perf_counter() - start)
+        metrics.SQLITE_ROWS.inc(self.count)
+        self.pending = {}
+        self.count = 0
+        self.oldest = None
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+        metrics.SQLITE_PENDING.untrack(self.gauge)
@@ -0,0 +1,410 @@
+import re
+import sqlite3
+from array import array
+from dataclasses import fields
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from core.batch_utils import format_ids
+
+# array typecode per dataclass annotation; str fields (other than the key)
+# are stored as int32 codes into a per-column table of distinct values
+NUMERIC_TYPECODES = {int: "q", float: "d"}
+NUMPY_DTYPES = {"q": np.int64, "d": np.float64, "i": np.int32, "H": np.uint16}
+
+# entity IDs are kept as their number plus a code into a table of
+# (prefix, zero-padded width) formats, e.g. "P0042" -> 42, ("P", 4);
+# format code 0 marks an ID of any other shape, kept as is
+ID_PATTERN = re.compile(r"(\D*)(\d{1,18})\Z")
+
+
+def _numbers(values: Iterable[Any], dtype) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    values as a `dtype` array, NULLs (None) as 0 / NaN, plus a bool mask of
+    the NULLs (None when there are none).
+    """
+    values = values if isinstance(values, np.ndarray) else list(values)
+    try:
+        return np.asarray(values, dtype=dtype), None
+    except TypeError:
+        null = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        blank = np.nan if dtype == np.float64 else 0
+        return np.asarray([blank if v is None else v for v in values], dtype=dtype), null
+
+
+class TextColumn:
+    """
+    Strings of one per-entity text column (names, phones) packed into one
+    UTF-8 buffer with their end offsets: ~len + 8 bytes per value instead of
+    a str object each. take() decodes many at once with NumPy while every
+    value is ASCII.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array("q")
+        self.ascii = True
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def __getitem__(self, i: int) -> str:
+        start = self.ends[i - 1] if i else 0
+        return self.data[start:self.ends[i]].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self.ends)):
+            yield self[i]
+
+    def append(self, value: str):
+        encoded = value.encode("utf-8")
+        self.ascii = self.ascii and len(encoded) == len(value)
+        self.data += encoded
+        self.ends.append(len(self.data))
+
+    def extend(self, values: List[str]):
+        joined = "".join(values)
+        encoded = joined.encode("utf-8")
+        if len(encoded) == len(joined):
+            lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+        else:
+            self.ascii = False
+            lengths = np.fromiter((len(v.encode("utf-8")) for v in values), dtype=np.int64, count=len(values))
+        self.ends.frombytes((np.cumsum(lengths) + len(self.data)).tobytes())
+        self.data += encoded
+
+    def take(self, idx: np.ndarray) -> np.ndarray:
+        ends = np.frombuffer(self.ends, dtype=np.int64)
+        stop = ends[idx]
+        start = np.where(idx > 0, ends[idx - 1], 0)
+        if not self.ascii:
+            return np.array([self.data[a:b].decode("utf-8") for a, b in zip(start.tolist(), stop.tolist())],
+                            dtype=str)
+        width = int((stop - start).max()) if len(idx) else 0
+        if width == 0:
+            return np.full(len(idx), "", dtype="U1")
+        buf = np.frombuffer(self.data, dtype=np.uint8)
+        pos = start[:, None] + np.arange(width)
+        # ASCII bytes are their own code points; bytes past a value's end
+        # become NULs, which the "U" dtype drops
+        chars = np.where(pos < stop[:, None], buf[np.minimum(pos, len(buf) - 1)], 0).astype(np.uint32)
+        return chars.view(f"U{width}").ravel()
+
+
+class EntityView:
+    """
+    Lightweight read-only row of an EntityStore. Each store makes a subclass
+    with one property per dataclass field reading the store's columns, so
+    sampling an entity allocates one small object instead of a dict plus
+    a dataclass.
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store: "EntityStore", index: int):
+        self.store = store
+        self.index = index
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: self.store.value(name, self.index) for name in self.store.names}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+def _field_property(store: "EntityStore", name: str) -> property:
+    if name == store.key:
+        return property(lambda v: v.store.entity_id(v.index))
+    if name in store.texts:
+        return property(lambda v: v.store.texts[name][v.index])
+    if name in store.codes:
+        cats = store.categories[name]
+        return property(lambda v: cats[v.store.arrays[name][v.index]])
+    return property(lambda v: None if v.store.is_null(name, v.index) else v.store.arrays[name][v.index])
+
+
+class EntityStore:
+    """
+    Struct-of-arrays store for one entity table, typed from its dataclass:
+    int/float fields are packed array.array columns, str fields are
+    interned categorical codes (or TextColumns for the per-entity `text`
+    fields, where interning saves nothing), and the key field is an ID
+    number plus a format code (see ID_PATTERN), formatted back on read.
+    append() is amortized O(1); len() and store[i] make
+    random.choice(store) an O(1) sample returning an EntityView. Batch code
+    reads columns through take(), vectorized over the packed arrays, and
+    appends with extend_columns(), which does no per-value Python work
+    beyond the text columns' join. The ID -> index map behind get() and
+    `in` is built on first use. NULLs in an int column are stored as 0 and
+    flagged in a per-column mask, so they read back as None (take(): NaN)
+    rather than as a real 0; float NULLs are stored as NaN.
+    """
+
+    def __init__(self, model, key: str, text: Iterable[str] = ()):
+        self.model = model
+        self.key = key
+        self.names = [f.name for f in fields(model)]
+        self.nums = array("q")
+        self.id_codes = array("H")
+        self.formats: List[Optional[Tuple[str, int]]] = [None]
+        self.format_codes: Dict[Tuple[str, int], int] = {}
+        # IDs with format code 0, by index
+        self.odd_ids: Dict[int, str] = {}
+        self.index: Optional[Dict[str, int]] = None
+        self.arrays: Dict[str, array] = {}
+        self.texts: Dict[str, TextColumn] = {}
+        self.categories: Dict[str, List[str]] = {}
+        self.codes: Dict[str, Dict[str, int]] = {}
+        # int column -> 1 byte per row, 1 where the value is NULL; made on
+        # the column's first NULL and only as long as its last one
+        self.nulls: Dict[str, bytearray] = {}
+        for f in fields(model):
+            if f.name == key:
+                continue
+            if f.name in text:
+                self.texts[f.name] = TextColumn()
+            elif f.type in NUMERIC_TYPECODES:
+                self.arrays[f.name] = array(NUMERIC_TYPECODES[f.type])
+            else:
+                self.arrays[f.name] = array("i")
+                self.categories[f.name] = []
+                self.codes[f.name] = {}
+        self.view = type(f"{model.__name__}View", (EntityView,), {
+            "__slots__": (), **{name: _field_property(self, name) for name in self.names}
+        })
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, table: str, model, key: str,
+             text: Iterable[str] = (), chunk: int = 10_000) -> "EntityStore":
+        """
+        Store holding every row of `table`, read in chunks of `chunk` rows.
+        Reports how many NULLs each int column loaded.
+        """
+        store = cls(model, key, text)
+        cur = conn.cursor()
+        cur.execute(f"SELECT {', '.join(store.names)} FROM {table}")
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            store.extend_columns({name: [r[i] for r in rows] for i, name in enumerate(store.names)})
+        for name, mask in store.nulls.items():
+            print(f"{table}: {mask.count(1):,} blank {name} values, kept as NULL")
+        return store
+
+    def __len__(self) -> int:
+        return len(self.nums)
+
+    def __getitem__(self, i: int) -> EntityView:
+        if i < 0:
+            i += len(self.nums)
+        if not 0 <= i < len(self.nums):
+            raise IndexError(i)
+        return self.view(self, i)
+
+    def _format_code(self, prefix: str, width: int) -> int:
+        code = self.format_codes.get((prefix, width))
+        if code is None:
+            code = len(self.formats)
+            if code > 0xFFFF:
+                raise ValueError(f"more than {0xFFFF} ID formats in {self.model.__name__}")
+            self.format_codes[(prefix, width)] = code
+            self.formats.append((prefix, width))
+        return code
+
+    def _parse_id(self, entity_id: str) -> Tuple[int, int]:
+        """
+        (number, format code) of an ID; (0, 0) when it isn't prefix + digits.
+        """
+        m = ID_PATTERN.match(entity_id)
+        if m is None:
+            return 0, 0
+        prefix, digits = m.groups()
+        # zero-padded to its length, or unpadded
+        return int(digits), self._format_code(prefix, len(digits) if digits[0] == "0" else 0)
+
+    def entity_id(self, i: int) -> str:
+        code = self.id_codes[i]
+        if code == 0:
+            return self.odd_ids[i]
+        prefix, width = self.formats[code]
+        return f"{prefix}{self.nums[i]:0{width}d}"
+
+    def _index(self) -> Dict[str, int]:
+        if self.index is None:
+            self.index = {self.entity_id(i): i for i in range(len(self.nums))}
+        return self.index
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._index()
+
+    def get(self, entity_id: str) -> Optional[EntityView]:
+        i = self._index().get(entity_id)
+        return None if i is None else self.view(self, i)
+
+    def indexes(self, entity_ids: Iterable[str]) -> np.ndarray:
+        """
+        Index of every ID in `entity_ids` (-1 if unknown), by binary search
+        over the ID numbers, without building the get() map.
+        """
+        entity_ids = [str(x) for x in entity_ids]
+        out = np.full(len(entity_ids), -1, dtype=np.int64)
+        nums = np.frombuffer(self.nums, dtype=np.int64)
+        codes = np.frombuffer(self.id_codes, dtype=np.uint16)
+        odd = {entity_id: i for i, entity_id in self.odd_ids.items()}
+        widths: Dict[str, List[Tuple[int, int]]] = {}
+        for code, (prefix, width) in enumerate(self.formats[1:], 1):
+            widths.setdefault(prefix, []).append((width, code))
+        wanted: Dict[int, List[Tuple[int, int]]] = {}
+        for j, entity_id in enumerate(entity_ids):
+            m = ID_PATTERN.match(entity_id)
+            if m is None:
+                out[j] = odd.get(entity_id, -1)
+                continue
+            prefix, digits = m.groups()
+            # a zero-padded ID has its own width, an unpadded one fits any up to its length
+            for width, code in widths.get(prefix, ()):
+                if width == len(digits) if digits[0] == "0" else width <= len(digits):
+                    wanted.setdefault(code, []).append((j, int(digits)))
+        for code, pairs in wanted.items():
+            rows = np.flatnonzero(codes == code)
+            order = np.argsort(nums[rows], kind="stable")
+            sorted_nums = nums[rows][order]
+            where = np.array([j for j, _ in pairs], dtype=np.int64)
+            want = np.array([num for _, num in pairs], dtype=np.int64)
+            pos = np.minimum(np.searchsorted(sorted_nums, want), max(len(rows) - 1, 0))
+            found = (sorted_nums[pos] == want) if len(rows) else np.zeros(len(want), dtype=bool)
+            out[where[found]] = rows[order[pos[found]]]
+        return out
+
+    def is_null(self, name: str, i: int) -> bool:
+        mask = self.nulls.get(name)
+        return mask is not None and i < len(mask) and mask[i] == 1
+
+    def _mark_nulls(self, name: str, start: int, null: np.ndarray):
+        last = int(np.flatnonzero(null)[-1])
+        mask = self.nulls.setdefault(name, bytearray())
+        mask.extend(bytes(start - len(mask)))
+        mask.extend(null[:last + 1].astype(np.uint8).tobytes())
+
+    def _code(self, name: str, value: Any) -> int:
+        value = str(value)
+        codes = self.codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.categories[name])
+            self.categories[name].append(value)
+        return code
+
+    def append(self, row: Dict[str, Any]) -> int:
+        """
+        Append one entity (a dict of field -> value); returns its index.
+        """
+        i = len(self.nums)
+        for name, arr in self.arrays.items():
+            value = row[name]
+            if name in self.codes:
+                value = self._code(name, value)
+            elif value is None:
+                value = 0 if arr.typecode == "q" else float("nan")
+                if arr.typecode == "q":
+                    self._mark_nulls(name, i, np.ones(1, dtype=bool))
+            arr.append(value)
+        for name, values in self.texts.items():
+            values.append(str(row[name]))
+        entity_id = str(row[self.key])
+        num, code = self._parse_id(entity_id)
+        if code == 0:
+            self.odd_ids[i] = entity_id
+        self.nums.append(num)
+        self.id_codes.append(code)
+        if self.index is not None:
+            self.index[entity_id] = i
+        return i
+
+    def extend_columns(self, columns: Dict[str, Iterable[Any]],
+                       id_format: Optional[Tuple[str, int]] = None):
+        """
+        Append a column-oriented batch (as returned by generate_batch). With
+        id_format=(prefix, width), the key column holds ID numbers instead
+        of IDs, formatted as f"{prefix}{num:0{width}d}".
+        """
+        start = len(self.nums)
+        if id_format is not None:
+            nums = np.asarray(columns[self.key], dtype=np.int64)
+            codes = np.full(len(nums), self._format_code(*id_format), dtype=np.uint16)
+        else:
+            ids = [str(x) for x in np.asarray(columns[self.key]).tolist()]
+            parsed = [self._parse_id(entity_id) for entity_id in ids]
+            nums = np.array([p[0] for p in parsed], dtype=np.int64)
+            codes = np.array([p[1] for p in parsed], dtype=np.uint16)
+            for j in np.flatnonzero(codes == 0).tolist():
+                self.odd_ids[start + j] = ids[j]
+        if not len(nums):
+            return
+        for name, arr in self.arrays.items():
+            if name in self.codes:
+                values, inverse = np.unique(np.asarray(columns[name]).astype(str), return_inverse=True)
+                values = values.tolist()
+                # known values in one C-level pass, new ones interned one by one
+                known = list(map(self.codes[name].get, values))
+                if None in known:
+                    known = [self._code(name, v) if c is None else c for v, c in zip(values, known)]
+                lookup = np.array(known, dtype=np.int32)
+                arr.frombytes(lookup[inverse.ravel()].tobytes())
+            else:
+                values, null = _numbers(columns[name], NUMPY_DTYPES[arr.typecode])
+                if null is not None and null.any() and arr.typecode == "q":
+                    self._mark_nulls(name, start, null)
+                arr.frombytes(values.tobytes())
+        for name, values in self.texts.items():
+            values.extend([str(v) for v in np.asarray(columns[name]).tolist()])
+        self.nums.frombytes(nums.tobytes())
+        self.id_codes.frombytes(codes.tobytes())
+        if self.index is not None:
+            for i in range(start, len(self.nums)):
+                self.index[self.entity_id(i)] = i
+
+    def value(self, name: str, i: int) -> Any:
+        return getattr(self.view(self, i), name)
+
+    def _take_ids(self, idx: np.ndarray) -> np.ndarray:
+        nums = np.frombuffer(self.nums, dtype=np.int64)[idx]
+        codes = np.frombuffer(self.id_codes, dtype=np.uint16)[idx]
+        present = np.unique(codes).tolist()
+        if len(present) == 1 and present[0] != 0:
+            prefix, width = self.formats[present[0]]
+            return format_ids(prefix, nums, width)
+        parts = []
+        for code in present:
+            sel = np.flatnonzero(codes == code)
+            if code == 0:
+                parts.append((sel, np.array([self.odd_ids[i] for i in idx[sel].tolist()], dtype=str)))
+            else:
+                prefix, width = self.formats[code]
+                parts.append((sel, format_ids(prefix, nums[sel], width)))
+        out = np.empty(len(idx), dtype=f"U{max([p.dtype.itemsize // 4 for _, p in parts] or [1])}")
+        for sel, part in parts:
+            out[sel] = part
+        return out
+
+    def take(self, name: str, idx: np.ndarray) -> np.ndarray:
+        """
+        Vectorized value(): `name` for every index in `idx`.
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        if name == self.key:
+            return self._take_ids(idx)
+        if name in self.texts:
+            return self.texts[name].take(idx)
+        arr = self.arrays[name]
+        values = np.frombuffer(arr, dtype=NUMPY_DTYPES[arr.typecode])[idx]
+        cats = self.categories.get(name)
+        if cats is None:
+            mask = self.nulls.get(name)
+            if mask is None:
+                return values
+            null = np.frombuffer(mask, dtype=np.uint8)[np.minimum(idx, len(mask) - 1)].astype(bool) & (idx < len(mask))
+            return np.where(null, np.nan, values) if null.any() else values
+        return np.asarray(cats)[values]
@@ -0,0 +1,279 @@
+from array import array
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+# defaults of the YAML `inventory` section
+INVENTORY_SETTINGS = {
+    "enabled": True,                # false: independent random stock per sale (allows --workers)
+    "initial_stock": [50, 200],     # stock of a (product, store) pair on its first sale, uniform
+    "reorder_point": 40,            # order when closing stock falls to this...
+    "reorder_qty": 150,             # ...this many units, received with the pair's next movement
+    "checkpoint_movements": 10000,  # save changed balances to the DB this often
+}
+
+# a pair's key is product index * STORE_SPAN + store index
+STORE_SPAN = 1 << 32
+# pairs added one at a time are merged into the sorted keys at this many
+MERGE_RECENT = 4096
+
+
+class InventoryLedger:
+    """
+    Stock of every (product, store) pair, one int slot each in two packed
+    int64 columns: the stock on hand and the units on order. A pair is
+    keyed by its product and store indexes in their EntityStores
+    (product * STORE_SPAN + store); the keys are kept sorted with their
+    slots, so a batch resolves its pairs with one np.searchsorted. A
+    movement (one sale) receives the pending order, sells what it can
+    (never below zero) and, if closing stock is at or below
+    `reorder_point`, orders `reorder_qty` for the pair's next movement; so
+    each pair's opening stock is its previous closing stock. moves()
+    applies a batch with NumPy, in rounds over the pairs' 1st, 2nd, ...
+    movement in the batch.
+
+    Changed slots are upserted into the retail_inventory table every
+    `checkpoint_movements` movements and at close; open() loads them back,
+    so a restart continues the balances (a crash loses at most one
+    checkpoint interval of movements, which the next run redoes from the
+    older balance). With `enabled: false` there is no ledger: every sale
+    draws an independent opening and received stock.
+    """
+
+    def __init__(self):
+        self.conn = None
+        self.products = None
+        self.stores = None
+        self.configure()
+        self.reset()
+
+    def configure(self, settings: Optional[Dict[str, Any]] = None):
+        opts = {**INVENTORY_SETTINGS, **(settings or {})}
+        low, high = (int(v) for v in opts["initial_stock"])
+        if not 0 <= low <= high:
+            raise ValueError(f"inventory.initial_stock must be [low, high] with 0 <= low <= high, "
+                             f"not {opts['initial_stock']!r}")
+        if int(opts["reorder_qty"]) <= 0:
+            raise ValueError(f"inventory.reorder_qty must be positive, not {opts['reorder_qty']!r}")
+        self.enabled = bool(opts["enabled"])
+        self.initial = (low, high)
+        self.reorder_point = int(opts["reorder_point"])
+        self.reorder_qty = int(opts["reorder_qty"])
+        self.checkpoint_movements = int(opts["checkpoint_movements"])
+
+    def reset(self):
+        # slot -> key, and the keys sorted with their slots
+        self.keys = array("q")
+        self.sorted_keys = np.empty(0, dtype=np.int64)
+        self.sorted_slots = np.empty(0, dtype=np.int64)
+        # pairs added by move() since the last merge, key -> slot
+        self.recent: Dict[int, int] = {}
+        self.on_hand = array("q")
+        self.on_order = array("q")
+        self.dirty = bytearray()
+        self.movements = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _add(self, keys: np.ndarray, stock: np.ndarray, pending: np.ndarray):
+        """
+        Append slots for `keys` (new, distinct) and insert them into the
+        sorted keys.
+        """
+        first = len(self.keys)
+        self.keys.frombytes(keys.astype(np.int64).tobytes())
+        self.on_hand.frombytes(stock.astype(np.int64).tobytes())
+        self.on_order.frombytes(pending.astype(np.int64).tobytes())
+        self.dirty.extend(bytes(len(keys)))
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        pos = np.searchsorted(self.sorted_keys, keys)
+        self.sorted_keys = np.insert(self.sorted_keys, pos, keys)
+        self.sorted_slots = np.insert(self.sorted_slots, pos, first + order)
+
+    def _merge(self):
+        if not self.recent:
+            return
+        keys = np.fromiter(self.recent.keys(), dtype=np.int64, count=len(self.recent))
+        slots = np.fromiter(self.recent.values(), dtype=np.int64, count=len(self.recent))
+        order = np.argsort(keys)
+        pos = np.searchsorted(self.sorted_keys, keys[order])
+        self.sorted_keys = np.insert(self.sorted_keys, pos, keys[order])
+        self.sorted_slots = np.insert(self.sorted_slots, pos, slots[order])
+        self.recent.clear()
+
+    def _find(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Slot of every key, -1 for pairs not in the ledger.
+        """
+        self._merge()
+        if len(self.sorted_keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.sorted_keys, keys), len(self.sorted_keys) - 1)
+        return np.where(self.sorted_keys[pos] == keys, self.sorted_slots[pos], -1)
+
+    def _slot(self, key: int) -> int:
+        slot = self.recent.get(key)
+        if slot is None:
+            pos = int(np.searchsorted(self.sorted_keys, key))
+            if pos < len(self.sorted_keys) and self.sorted_keys[pos] == key:
+                return int(self.sorted_slots[pos])
+        return -1 if slot is None else slot
+
+    def open(self, conn, products, stores):
+        """
+        Load the balances saved in `conn` (the retail DB) for the pairs of
+        `products` and `stores`, the EntityStores whose indexes key the
+        ledger.
+        """
+        self.conn = conn
+        self.products = products
+        self.stores = stores
+        self.reset()
+        rows = conn.execute("SELECT pid, sid, stock, pending FROM retail_inventory").fetchall()
+        if not rows:
+            return
+        pids, sids, stock, pending = zip(*rows)
+        p = products.indexes(pids)
+        s = stores.indexes(sids)
+        # balances of entities the DB no longer has are dropped
+        known = (p >= 0) & (s >= 0)
+        self._add((p * STORE_SPAN + s)[known], np.asarray(stock, dtype=np.int64)[known],
+                  np.asarray(pending, dtype=np.int64)[known])
+
+    def save(self):
+        if self.conn is None or self.products is None:
+            return
+        dirty = np.frombuffer(self.dirty, dtype=np.uint8)
+        slots = np.flatnonzero(dirty)
+        del dirty
+        if len(slots) == 0:
+            return
+        keys = np.frombuffer(self.keys, dtype=np.int64)[slots]
+        pids = self.products.take("pid", keys // STORE_SPAN)
+        sids = self.stores.take("sid", keys % STORE_SPAN)
+        self.conn.executemany(
+            "INSERT INTO retail_inventory (pid, sid, stock, pending) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(pid, sid) DO UPDATE SET stock = excluded.stock, pending = excluded.pending",
+            zip(pids.tolist(), sids.tolist(),
+                np.frombuffer(self.on_hand, dtype=np.int64)[slots].tolist(),
+                np.frombuffer(self.on_order, dtype=np.int64)[slots].tolist()),
+        )
+        self.conn.commit()
+        self.dirty[:] = bytes(len(self.dirty))
+
+    def _counted(self, n: int):
+        before = self.movements
+        self.movements += n
+        if self.checkpoint_movements > 0 and before // self.checkpoint_movements != self.movements // self.checkpoint_movements:
+            self.save()
+
+    def stock(self, pid: str, sid: str) -> Optional[int]:
+        """
+        Units on hand for the pair, None if it never sold.
+        """
+        product = self.products.get(pid) if self.products is not None else None
+        store = self.stores.get(sid) if self.stores is not None else None
+        if product is None or store is None:
+            return None
+        slot = self._slot(product.index * STORE_SPAN + store.index)
+        return None if slot < 0 else self.on_hand[slot]
+
+    def move(self, rand, product: int, store: int, units: int) -> Tuple[int, int, int, int]:
+        """
+        Sell up to `units` of the product at the store (their EntityStore
+        indexes), drawing a new pair's initial stock from `rand`
+        (random.Random); returns (opening, received, sold, closing).
+        """
+        if not self.enabled:
+            opening = rand.randint(50, 200)
+            received = rand.randint(10, 50)
+            return opening, received, units, opening + received - units
+        key = product * STORE_SPAN + store
+        slot = self._slot(key)
+        if slot < 0:
+            slot = len(self.keys)
+            self.keys.append(key)
+            self.on_hand.append(rand.randint(*self.initial))
+            self.on_order.append(0)
+            self.dirty.append(0)
+            self.recent[key] = slot
+            if len(self.recent) >= MERGE_RECENT:
+                self._merge()
+        opening = self.on_hand[slot]
+        received = self.on_order[slot]
+        sold = min(units, opening + received)
+        closing = opening + received - sold
+        self.on_hand[slot] = closing
+        self.on_order[slot] = self.reorder_qty if closing <= self.reorder_point else 0
+        self.dirty[slot] = 1
+        self._counted(1)
+        return opening, received, sold, closing
+
+    def lookup(self, rng: np.random.Generator, products: np.ndarray, stores: np.ndarray) -> np.ndarray:
+        """
+        Slot of every (products[i], stores[i]) index pair, adding new pairs
+        (in order of first sale) with initial stock drawn from `rng`.
+        """
+        keys = products.astype(np.int64) * STORE_SPAN + stores
+        slots = self._find(keys)
+        missing = slots < 0
+        if missing.any():
+            new, first = np.unique(keys[missing], return_index=True)
+            new = new[np.argsort(first)]
+            low, high = self.initial
+            self._add(new, rng.integers(low, high + 1, len(new)), np.zeros(len(new), dtype=np.int64))
+            slots[missing] = self._find(keys[missing])
+        return slots
+
+    def moves(self, rng: np.random.Generator, products: np.ndarray, stores: np.ndarray,
+              units: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Vectorized move for a batch of sales in order, by product and store
+        index; returns the columns opening, received, sold and closing.
+        """
+        n = len(units)
+        if not self.enabled:
+            opening = rng.integers(50, 201, n)
+            received = rng.integers(10, 51, n)
+            return {"opening": opening, "received": received, "sold": units,
+                    "closing": opening + received - units}
+        slots = self.lookup(rng, products, stores)
+        out = {name: np.empty(n, dtype=np.int64) for name in ("opening", "received", "sold", "closing")}
+        if n == 0:
+            return out
+        # rank of each sale among the batch's sales of its pair
+        order = np.argsort(slots, kind="stable")
+        ordered = slots[order]
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+        # rounds of distinct pairs, each applied in one go
+        by_round = np.argsort(rank, kind="stable")
+        bounds = np.r_[0, np.cumsum(np.bincount(rank))]
+        on_hand = np.frombuffer(self.on_hand, dtype=np.int64)
+        on_order = np.frombuffer(self.on_order, dtype=np.int64)
+        dirty = np.frombuffer(self.dirty, dtype=np.uint8)
+        for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            idx = by_round[lo:hi]
+            s = slots[idx]
+            opening = on_hand[s]
+            received = on_order[s]
+            sold = np.minimum(units[idx], opening + received)
+            closing = opening + received - sold
+            on_hand[s] = closing
+            on_order[s] = np.where(closing <= self.reorder_point, self.reorder_qty, 0)
+            out["opening"][idx] = opening
+            out["received"][idx] = received
+            out["sold"][idx] = sold
+            out["closing"][idx] = closing
+        dirty[slots] = 1
+        # release the views, the columns cannot grow while exported
+        del on_hand, on_order, dirty
+        self._counted(n)
+        return out
+
+    def close(self):
+        self.save()
+        self.conn = None
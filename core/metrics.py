@@ -0,0 +1,289 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+# latency buckets in seconds, 50us .. 30s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# payload buckets (rows or bytes)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10_000, 50_000, 100_000, 1_000_000, 10_000_000)
+
+
+class Metric:
+    """
+    One metric family: children per label values, created on first use.
+    Hot paths keep a reference to their child (labels() once, then inc()
+    or observe() per event), so recording is an attribute update or two.
+    Updates from different threads aren't locked; each metric here is
+    written from one thread, readers only take snapshots.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.children: Dict[Tuple[str, ...], Any] = {}
+        # the child of an unlabeled metric, exposed (as zero) from the start
+        self.default = None if labelnames else self.labels()
+        REGISTRY.append(self)
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = self._child()
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """
+        (sample name, labels, value) triples in Prometheus order.
+        """
+        out = []
+        for key, child in list(self.children.items()):
+            out.extend(child.samples(self.name, dict(zip(self.labelnames, key))))
+        return out
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": self.kind,
+            "help": self.help,
+            "values": [{"labels": dict(zip(self.labelnames, key)), **child.snapshot()}
+                       for key, child in list(self.children.items())],
+        }
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: float = 1):
+        self.value += n
+
+    def samples(self, name, labels):
+        return [(f"{name}_total", labels, self.value)]
+
+    def snapshot(self):
+        return {"value": self.value}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, n: float = 1):
+        self.default.inc(n)
+
+
+class _GaugeChild:
+    __slots__ = ("value", "functions")
+
+    def __init__(self):
+        self.value = 0.0
+        self.functions: List[Callable[[], float]] = []
+
+    def set(self, value: float):
+        self.value = value
+
+    def track(self, fn: Callable[[], float]):
+        """
+        Add fn() (read at scrape time) to the gauge, e.g. a queue's size.
+        """
+        self.functions.append(fn)
+
+    def untrack(self, fn: Callable[[], float]):
+        """
+        Stop reading fn, e.g. when its queue is closed.
+        """
+        if fn in self.functions:
+            self.functions.remove(fn)
+
+    def get(self) -> float:
+        return self.value + sum(fn() for fn in self.functions)
+
+    def samples(self, name, labels):
+        return [(name, labels, self.get())]
+
+    def snapshot(self):
+        return {"value": self.get()}
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _GaugeChild()
+
+    def track(self, fn: Callable[[], float]):
+        self.default.track(fn)
+
+    def untrack(self, fn: Callable[[], float]):
+        self.default.untrack(fn)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _cumulative(self):
+        total = 0
+        for bound, n in zip(self.bounds + (float("inf"),), self.counts):
+            total += n
+            yield bound, total
+
+    def samples(self, name, labels):
+        out = [(f"{name}_bucket", {**labels, "le": "+Inf" if b == float("inf") else repr(b)}, n)
+               for b, n in self._cumulative()]
+        out.append((f"{name}_sum", labels, self.sum))
+        out.append((f"{name}_count", labels, self.count))
+        return out
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {("+Inf" if b == float("inf") else repr(b)): n for b, n in self._cumulative()},
+        }
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, labelnames)
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.default.observe(value)
+
+
+REGISTRY: List[Metric] = []
+
+GENERATE_SECONDS = Histogram("sim_generate_seconds", "Time to generate one record (step)", ("domain",))
+SINK_ROWS = Counter("sink_rows", "Rows handed to an output sink", ("table",))
+SQLITE_COMMIT_SECONDS = Histogram("sqlite_commit_seconds", "BatchWriter executemany + commit latency")
+SQLITE_ROWS = Counter("sqlite_rows", "Rows committed by BatchWriter")
+SQLITE_PENDING = Gauge("sqlite_pending_rows", "Rows queued in BatchWriters, not yet committed")
+SHEETS_FLUSH_SECONDS = Histogram("sheets_flush_seconds",
+                                 "Sheet buffer flush time (enqueue, or the whole request when synchronous)")
+SHEETS_FLUSH_ROWS = Histogram("sheets_flush_rows", "Rows per sheet buffer flush", buckets=SIZE_BUCKETS)
+SHEETS_FLUSH_BYTES = Histogram("sheets_flush_bytes", "Approximate payload bytes per sheet buffer flush",
+                               buckets=SIZE_BUCKETS)
+SHEETS_REQUEST_SECONDS = Histogram("sheets_request_seconds", "Latency of one Sheets API request attempt")
+SHEETS_RETRIES = Counter("sheets_retries", "Sheets API request attempts after the first")
+SHEETS_FAILED = Counter("sheets_failed_batches", "Sheets batches given up on after retries")
+SHEETS_QUEUE = Gauge("sheets_queue_depth", "Batches waiting in the background SheetWriter queue")
+SPOOL_PENDING = Gauge("spool_pending_rows", "Journaled rows not yet acknowledged by the sheet")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                     for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def render() -> str:
+    """
+    Every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Dict[str, Any]:
+    return {"time": time.time(), "metrics": {m.name: m.snapshot() for m in REGISTRY}}
+
+
+def dump_json(path: str):
+    """
+    Write snapshot() to `path` atomically.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, indent=1)
+    os.replace(tmp, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_started = False
+
+
+def start(settings: Optional[Dict[str, Any]], shard: Optional[int] = None):
+    """
+    Expose the metrics per the YAML `metrics` section, once per process:
+    `port` (and `host`, default 127.0.0.1) serves /metrics over HTTP,
+    `json_path` is rewritten every `json_every` seconds and at exit.
+    Worker N of --workers uses port + N + 1 and its own JSON file.
+    """
+    global _started
+    if _started or not settings:
+        return
+    _started = True
+    from core.sinks import shard_path
+
+    port = settings.get("port")
+    if port is not None:
+        port = int(port) + (0 if shard is None else shard + 1)
+        server = ThreadingHTTPServer((settings.get("host", "127.0.0.1"), port), _Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    path = settings.get("json_path")
+    if path:
+        path = shard_path(path, shard)
+        every = float(settings.get("json_every", 10.0))
+
+        def loop():
+            while True:
+                time.sleep(every)
+                dump_json(path)
+
+        threading.Thread(target=loop, name="metrics-json", daemon=True).start()
+        atexit.register(dump_json, path)
@@ -0,0 +1,92 @@
+import time
+from typing import Optional
+
+# longest idle stretch between poll_buffers() calls of a paced run loop
+POLL_SECONDS = 0.25
+
+
+class RateLimiter:
+    """
+    Token bucket pacing acquire() calls to `rate` per second.
+    rate <= 0 disables pacing (run as fast as possible).
+    The bucket holds at most ~100 ms worth of tokens so high rates don't
+    degrade into one sleep() per record, while low rates stay smooth.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = burst if burst is not None else max(1.0, self.rate / 10)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def reserve(self, n: int = 1) -> float:
+        """
+        Take n tokens, possibly on credit; returns the seconds to wait
+        before using them (0 when they were available). For callers that
+        sleep their own way, e.g. asyncio.sleep.
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= n
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self, n: int = 1):
+        wait = self.reserve(n)
+        if wait > 0:
+            time.sleep(wait)
+
+
+def poll_buffers(buffers):
+    """
+    Run the time-based flush check (poll()) of every buffer that has one,
+    e.g. BatchWriter's batch_seconds and SpreadsheetBuffer's
+    flush_latency, which add() alone only checks when a record arrives.
+    """
+    for buf in buffers:
+        poll = getattr(buf, "poll", None)
+        if poll is not None:
+            poll()
+
+
+def sleep_polling(seconds: float, buffers):
+    """
+    time.sleep(seconds) in slices of at most POLL_SECONDS, polling
+    `buffers` after each, so slow paced runs still flush on time.
+    """
+    while seconds > 0:
+        step = min(seconds, POLL_SECONDS)
+        time.sleep(step)
+        seconds -= step
+        poll_buffers(buffers)
+
+
+class ProgressReporter:
+    """
+    Prints one progress line every `interval` seconds instead of one line
+    per record, so stdout never becomes the bottleneck.
+    """
+
+    def __init__(self, name: str, interval: float = 5.0):
+        self.name = name
+        self.interval = interval
+        self.count = 0
+        self.start = time.monotonic()
+        self.last_time = self.start
+        self.last_count = 0
+
+    def tick(self, n: int = 1):
+        self.count += n
+        now = time.monotonic()
+        if self.interval > 0 and now - self.last_time >= self.interval:
+            rate = (self.count - self.last_count) / (now - self.last_time)
+            print(f"[{self.name}] {self.count:,} records | {rate:,.1f} rec/s")
+            self.last_time = now
+            self.last_count = self.count
+
+    def done(self):
+        elapsed = time.monotonic() - self.start
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        print(f"[{self.name}] {self.count:,} records in {elapsed:,.1f}s | {rate:,.1f} rec/s avg")
@@ -0,0 +1,203 @@
+import atexit
+import cProfile
+import functools
+import os
+import random
+import sys
+import threading
+import time
+from array import array
+from typing import Dict, List, Callable, Optional
+
+import numpy as np
+
+# pipeline stages in report order; "other" is step time outside them
+STAGES = ("entity", "ids", "build", "db_queue", "db_commit", "buffer_add", "sink_flush", "other")
+# per-record samples kept per stage and domain (reservoir), enough for p99
+MAX_SAMPLES = 100_000
+
+
+class StageProfiler:
+    """
+    Exclusive wall time per pipeline stage and record. Stage functions are
+    wrapped (see install); time spent in a nested stage is charged to that
+    stage only, e.g. a BatchWriter commit triggered by an insert counts as
+    db_commit, not db_queue. Each record's per-stage totals are sampled so
+    the report can show percentiles per record, not just averages.
+    Only calls on the thread running the loop are timed.
+    """
+
+    def __init__(self):
+        self.domain: Optional[str] = None
+        self.thread = threading.get_ident()
+        self.stack: List[float] = []
+        self.current: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.samples: Dict[str, Dict[str, array]] = {}
+        self.totals: Dict[str, Dict[str, float]] = {}
+        self.records: Dict[str, int] = {}
+        self.rand = random.Random(0)
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            if self.domain is None or threading.get_ident() != self.thread:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            self.stack.append(0.0)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.current[stage] += elapsed - self.stack.pop()
+                if self.stack:
+                    self.stack[-1] += elapsed
+        timed.__profiled__ = True
+        return timed
+
+    def record(self, name: str, step: Callable) -> Callable:
+        """
+        Wrap a run loop's step so each call is one profiled record of `name`.
+        """
+        samples = self.samples.setdefault(name, {stage: array("d") for stage in STAGES})
+        totals = self.totals.setdefault(name, dict.fromkeys(STAGES, 0.0))
+        self.records.setdefault(name, 0)
+        other = self.wrap("other", step)
+
+        def profiled_step():
+            self.domain = name
+            self.thread = threading.get_ident()
+            self.current = dict.fromkeys(STAGES, 0.0)
+            try:
+                return other()
+            finally:
+                self.domain = None
+                n = self.records[name] = self.records[name] + 1
+                # reservoir sampling keeps a uniform sample of all records
+                slot = n - 1 if n <= MAX_SAMPLES else self.rand.randrange(n)
+                for stage, t in self.current.items():
+                    totals[stage] += t
+                    if slot < MAX_SAMPLES:
+                        if slot == len(samples[stage]):
+                            samples[stage].append(t)
+                        else:
+                            samples[stage][slot] = t
+
+        return profiled_step
+
+    def report(self, name: str) -> str:
+        n = self.records.get(name, 0)
+        if not n:
+            return f"[{name}] profile: no records"
+        totals = self.totals[name]
+        total = sum(totals.values()) or 1e-12
+        lines = [
+            f"[{name}] profile: {n:,} records, {total:,.3f}s in the loop "
+            f"({total / n * 1e6:,.1f} us/record)",
+            f"  {'stage':<11} {'share':>6} {'mean us':>9} {'p50 us':>9} {'p90 us':>9} {'p99 us':>9} {'max us':>10}",
+        ]
+        for stage in STAGES:
+            values = np.frombuffer(self.samples[name][stage], dtype=np.float64) * 1e6
+            p50, p90, p99 = np.percentile(values, [50, 90, 99]) if len(values) else (0.0, 0.0, 0.0)
+            lines.append(
+                f"  {stage:<11} {totals[stage] / total:>6.1%} {totals[stage] / n * 1e6:>9.1f} "
+                f"{p50:>9.1f} {p90:>9.1f} {p99:>9.1f} {values.max() if len(values) else 0.0:>10.1f}"
+            )
+        return "\n".join(lines)
+
+
+PROFILER = StageProfiler()
+
+
+def _patch(owner, attr: str, stage: str):
+    fn = getattr(owner, attr)
+    if not getattr(fn, "__profiled__", False):
+        setattr(owner, attr, PROFILER.wrap(stage, fn))
+
+
+def install(sim):
+    """
+    Time the pipeline stages of simulator module `sim` and of the shared
+    classes (ID allocation, SQLite batching, sinks). Idempotent.
+    """
+    from core.db_utils import BatchWriter, IdAllocator
+    from core.sheets_append import SheetBuffer, SpreadsheetBuffer
+    from core.sinks import MeteredSink, SQLiteSink, ParquetSink, CSVSink, NDJSONSink
+
+    for attr in dir(sim):
+        if attr.startswith("get_or_create_"):
+            _patch(sim, attr, "entity")
+    _patch(sim, "generate_records", "build")
+    _patch(IdAllocator, "next", "ids")
+    _patch(IdAllocator, "take", "ids")
+    _patch(BatchWriter, "insert", "db_queue")
+    _patch(BatchWriter, "insert_columns", "db_queue")
+    _patch(BatchWriter, "flush", "db_commit")
+    _patch(MeteredSink, "add", "buffer_add")
+    _patch(MeteredSink, "add_columns", "buffer_add")
+    for cls in (SheetBuffer, SpreadsheetBuffer, SQLiteSink, CSVSink, NDJSONSink):
+        _patch(cls, "flush", "sink_flush")
+    _patch(ParquetSink, "_write_group", "sink_flush")
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread every `interval` seconds and counts
+    the distinct stacks, written as "frame;frame;... count" lines: the
+    collapsed format flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                stack = ";".join(reversed(names))
+                self.counts[stack] = self.counts.get(stack, 0) + 1
+
+    def write(self, path: str):
+        self.running = False
+        self.thread.join()
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in sorted(self.counts.items()):
+                f.write(f"{stack} {n}\n")
+
+
+_capturing = False
+
+
+def capture(prefix: str, shard: Optional[int] = None):
+    """
+    Run cProfile and the stack sampler on this thread until exit, then
+    write <prefix>.pstats and <prefix>.collapsed (<prefix>.wN.* for
+    worker N). Once per process.
+    """
+    global _capturing
+    if _capturing:
+        return
+    _capturing = True
+    if shard is not None:
+        prefix = f"{prefix}.w{shard}"
+    prof = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident())
+    prof.enable()
+
+    def finish():
+        prof.disable()
+        prof.dump_stats(prefix + ".pstats")
+        sampler.write(prefix + ".collapsed")
+        print(f"Profile written to {prefix}.pstats and {prefix}.collapsed")
+
+    atexit.register(finish)
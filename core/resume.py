@@ -0,0 +1,176 @@
+import os
+import re
+from dataclasses import fields
+from typing import Dict, List, Any, Optional, Tuple
+
+from core.db_utils import max_rowid
+
+# column A cells read per request when scanning a sheet's tail
+TAIL_PAGE = 1000
+# numeric suffix of an ID (P0042 -> 42)
+ID_NUMBER = re.compile(r"(\d+)\Z")
+
+
+def _column_a(ws, first: int, last: int) -> List[str]:
+    """
+    Column A of rows first..last, with trailing empty cells dropped.
+    """
+    values = [r[0] if r else "" for r in ws.get_values(f"A{first}:A{last}")]
+    while values and not values[-1]:
+        values.pop()
+    return values
+
+
+def last_row(ws, page: int = TAIL_PAGE) -> int:
+    """
+    Last row with a value in column A, found by reading pages upwards from
+    the end of the grid (ws.row_count, known from the worksheet metadata).
+    Appends grow the grid only as far as needed, so this is usually one
+    request. Returns 0 for an empty sheet.
+    """
+    end = ws.row_count
+    while end > 0:
+        first = max(1, end - page + 1)
+        values = _column_a(ws, first, end)
+        if values:
+            return first + len(values) - 1
+        end = first - 1
+    return 0
+
+
+def tail_ids(ws, after: int, page: int = TAIL_PAGE) -> List[str]:
+    """
+    Column A below row `after`, down to the first empty row, `page` rows
+    per request: O(rows appended since `after`), not O(sheet size).
+    """
+    ids: List[str] = []
+    row = after + 1
+    while True:
+        values = _column_a(ws, row, row + page - 1)
+        ids.extend(values)
+        if len(values) < page:
+            return ids
+        row += page
+
+
+def reconcile(ws, rows: List[List[Any]], mark: Optional[int]) -> Tuple[List[List[Any]], int]:
+    """
+    Split rows recovered from the spool into those missing from the sheet,
+    comparing IDs (column A) with the sheet's tail below the row watermark
+    `mark`. Without a watermark the tail is the last len(rows) rows. Returns
+    the missing rows and the sheet's new last row.
+    """
+    if mark is None:
+        mark = max(0, last_row(ws) - len(rows))
+    tail = tail_ids(ws, mark)
+    present = set(tail)
+    return [r for r in rows if str(r[0]) not in present], mark + len(tail)
+
+
+def batch_landed(ws, last_id: str, mark: Optional[int], n_rows: int) -> bool:
+    """
+    Whether an append whose last row has ID `last_id` already reached the
+    sheet, so a retry after a timeout doesn't write it twice. Reads the
+    tail below the watermark (or the last n_rows rows without one).
+    """
+    if mark is None:
+        mark = max(0, last_row(ws) - n_rows)
+    return last_id in tail_ids(ws, mark)
+
+
+def file_tail(path: str, block: int = 1 << 16) -> Optional[str]:
+    """
+    Last complete line of a file sink, dropping a torn partial line left by
+    a crash (the file is truncated to its last newline). Reads only the
+    end of the file. Returns None for a missing or empty file.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        pos = size
+        tail = b""
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+            if tail.count(b"\n") >= 2 or (pos == 0 and b"\n" in tail):
+                break
+        if not tail:
+            return None
+        cut = tail.rfind(b"\n") + 1
+        if cut < len(tail):
+            f.truncate(pos + cut)
+            tail = tail[:cut]
+        lines = tail.splitlines()
+        return lines[-1].decode("utf-8") if lines else None
+
+
+def init_resume_schema(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS sink_marks (path TEXT PRIMARY KEY, base INTEGER NOT NULL)")
+    conn.commit()
+
+
+def _id_number(entity_id: Any) -> Optional[int]:
+    m = ID_NUMBER.search(str(entity_id))
+    return int(m.group(1)) if m else None
+
+
+def _file_start(conn, sink, table: str, column: str) -> Optional[int]:
+    """
+    Rowid of `table` after which the rows of `sink`'s file start to be
+    missing, None if none are. A file with rows continues from its last ID
+    (sink.last_id), found by reading the table backwards from its end:
+    O(gap). A file without rows continues from the rowid recorded when it
+    was created; a new file records the table's current end.
+    """
+    if sink.created:
+        conn.execute("INSERT OR REPLACE INTO sink_marks (path, base) VALUES (?, ?)",
+                     (sink.path, max_rowid(conn, table)))
+        conn.commit()
+        return None
+    if sink.last_id is None:
+        row = conn.execute("SELECT base FROM sink_marks WHERE path = ?", (sink.path,)).fetchone()
+        return None if row is None else row[0]
+    mark = _id_number(sink.last_id)
+    if mark is None:
+        return None
+    start = 0
+    for rowid, entity_id in conn.execute(f"SELECT rowid, {column} FROM {table} ORDER BY rowid DESC"):
+        num = _id_number(entity_id)
+        if num is not None and num <= mark:
+            start = rowid
+            break
+    return start
+
+
+def resume_files(conn, sim, sinks: Dict[str, Any]) -> int:
+    """
+    Close the gap a crash leaves between the domain DB and its CSV/NDJSON
+    sinks (`sinks`: key -> sink of one process, not a --workers shard).
+    Each file's high-water mark is the ID of its last complete row
+    (sink.last_id); IDs grow with the rowid of the rows behind them.
+    Entity rows the DB committed past the mark are re-emitted from their
+    table. Fact rows are not kept in the DB, so the mem pairs past both
+    facts' marks are dropped instead, keeping the mapping in step with the
+    files. Returns the number of rows re-emitted.
+    """
+    init_resume_schema(conn)
+    files = {key: getattr(sink, "sink", sink) for key, sink in sinks.items()}
+    emitted = 0
+    for key, (table, model, _) in sim.SEED_TABLES.items():
+        start = _file_start(conn, files[key], table, sim.ID_SEQUENCES[key][1])
+        if start is None:
+            continue
+        names = ", ".join(f.name for f in fields(model))
+        for row in conn.execute(f"SELECT {names} FROM {table} WHERE rowid > ? ORDER BY rowid", (start,)):
+            sinks[key].add(list(row))
+            emitted += 1
+
+    mem_table, *pairs = sim.SEED_MAPPING
+    starts = [_file_start(conn, files[key], mem_table, column) for key, _, column in pairs]
+    if None not in starts:
+        conn.execute(f"DELETE FROM {mem_table} WHERE rowid > ?", (max(starts),))
+        conn.commit()
+    return emitted
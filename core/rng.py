@@ -0,0 +1,29 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Fixed spawn-key slot per domain, so adding a domain never shifts the others
+DOMAIN_STREAMS = ("retail", "manufacturing", "education")
+
+
+def domain_seed_sequence(seed: int, domain: str, shard: Optional[int] = None) -> np.random.SeedSequence:
+    """
+    SeedSequence for one (domain, worker) pair: the same thing as
+    SeedSequence(seed).spawn(...)[domain].spawn(...)[shard], built directly
+    from the spawn key. A single-process run uses the worker 0 stream.
+    """
+    return np.random.SeedSequence(seed, spawn_key=(DOMAIN_STREAMS.index(domain), shard or 0))
+
+
+def derive_streams(seed: int, domain: str, shard: Optional[int] = None) -> Tuple[int, int, np.random.Generator]:
+    """
+    Independent streams for one (domain, worker): a seed for the simulator's
+    random.Random, a seed for its Faker instance and a NumPy Generator.
+    Every domain module draws from its own module-level rand, fake and
+    np_rng, which its seed_streams() reseeds from these for reproducible
+    runs.
+    """
+    py_ss, faker_ss, np_ss = domain_seed_sequence(seed, domain, shard).spawn(3)
+    py_seed = int(py_ss.generate_state(1, np.uint64)[0])
+    faker_seed = int(faker_ss.generate_state(1, np.uint64)[0])
+    return py_seed, faker_seed, np.random.default_rng(np_ss)
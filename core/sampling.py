@@ -0,0 +1,264 @@
+import bisect
+from typing import Dict, List, Any, Optional, Sequence
+
+import numpy as np
+
+from core.batch_utils import choice
+
+# entities in the first alias block of an EntitySampler, later blocks double
+FIRST_BLOCK = 64
+
+
+class AliasTable:
+    """
+    Vose's alias method over fixed weights: O(n) to build, then every draw
+    is one uniform index plus one coin flip, whatever the skew.
+    """
+
+    def __init__(self, weights: Sequence[float]):
+        w = np.asarray(weights, dtype=np.float64)
+        if len(w) == 0 or (w < 0).any() or w.sum() <= 0:
+            raise ValueError("weights must be non-negative with a positive sum")
+        n = len(w)
+        scaled = (w * (n / w.sum())).tolist()
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            g = large[-1]
+            prob[s] = scaled[s]
+            alias[s] = g
+            scaled[g] -= 1.0 - scaled[s]
+            if scaled[g] < 1.0:
+                small.append(large.pop())
+        self.n = n
+        self.prob = prob
+        self.alias = alias
+        self.prob_array = np.array(prob)
+        self.alias_array = np.array(alias, dtype=np.int64)
+
+    def draw(self, rand) -> int:
+        i = int(rand.random() * self.n)
+        return i if rand.random() < self.prob[i] else self.alias[i]
+
+    def draws(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        i = rng.integers(0, self.n, n)
+        return np.where(rng.random(n) < self.prob_array[i], i, self.alias_array[i])
+
+
+def _zipf(spec: Dict[str, Any]) -> Optional[float]:
+    s = spec.get("zipf")
+    return None if s is None or float(s) == 0.0 else float(s)
+
+
+class Choice:
+    """
+    Draws from a constant list (CATEGORY, ROOT_CAUSE, ...), uniformly unless
+    weighted by configure(). Uniform draws use exactly the calls they
+    replace (rand.choice, batch_utils.choice), so unweighted runs keep
+    their random streams.
+    """
+
+    def __init__(self, name: str, values: Sequence[Any]):
+        self.name = name
+        self.values = list(values)
+        self.array = np.asarray(self.values)
+        self.table: Optional[AliasTable] = None
+
+    def configure(self, spec: Optional[Dict[str, Any]]):
+        """
+        spec: {"zipf": s} (the i-th listed value has weight 1/i^s),
+        {"weights": [w, ...]} in listed order, {"weights": {value: w}}
+        (unlisted values get 0) or None for uniform.
+        """
+        self.table = None
+        if not spec:
+            return
+        weights = spec.get("weights")
+        if isinstance(weights, dict):
+            weights = [float(weights.get(v, 0.0)) for v in self.values]
+        elif weights is not None:
+            if len(weights) != len(self.values):
+                raise ValueError(f"sampling.{self.name}: {len(weights)} weights for {len(self.values)} values")
+        else:
+            s = _zipf(spec)
+            if s is None:
+                return
+            weights = np.arange(1, len(self.values) + 1, dtype=np.float64) ** -s
+        self.table = AliasTable(weights)
+
+    def draw(self, rand) -> Any:
+        if self.table is None:
+            return rand.choice(self.values)
+        return self.values[self.table.draw(rand)]
+
+    def indexes(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        """
+        Positions in the list of n draws.
+        """
+        if self.table is None:
+            return rng.integers(0, len(self.values), n)
+        return self.table.draws(rng, n)
+
+    def draws(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        if self.table is None:
+            return choice(rng, self.values, n)
+        return self.array[self.table.draws(rng, n)]
+
+
+class EntitySampler:
+    """
+    Popularity of a growing entity pool: with {"zipf": s} the k-th entity
+    (in load/creation order, so seeded entities are the hot ones) has weight
+    1/k^s. Weights never change once an entity exists, so the pool is cut
+    into blocks of doubling size (64, 64, 128, 256, ...) and each block gets
+    its own alias table when it fills up, built once. A draw picks a block
+    by cumulative weight (few blocks, hot ones first), then an entity with
+    that block's table; entities of the block still filling are drawn by
+    rejection (uniform index, accepted with probability w(j)/w(block start),
+    at least 2^-s). Amortized O(1) per appended entity and per draw.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # None: uniform, drawn exactly as before weighting existed
+        self.skew: Optional[float] = None
+        self.reset()
+
+    def reset(self):
+        self.tables: List[AliasTable] = []
+        # first index of every complete block, then of the filling one
+        self.starts: List[int] = [0]
+        # weight up to the end of each complete block
+        self.cum: List[float] = []
+        self.size = 0
+        self.filling = 0.0
+        self.total = 0.0
+
+    def configure(self, spec: Optional[Dict[str, Any]]):
+        if spec and "weights" in spec:
+            raise ValueError(f"sampling.{self.name}: entity pools take zipf, not weights")
+        self.skew = _zipf(spec or {})
+        self.reset()
+
+    def _grow(self, size: int):
+        while self.size < size:
+            start = self.starts[-1]
+            end = FIRST_BLOCK if start == 0 else 2 * start
+            upto = min(size, end)
+            if upto == self.size + 1:
+                # the usual case, one new entity
+                self.filling += upto ** -self.skew
+            elif upto - self.size < 32:
+                self.filling += sum(k ** -self.skew for k in range(self.size + 1, upto + 1))
+            else:
+                self.filling += float(np.sum(np.arange(self.size + 1, upto + 1, dtype=np.float64) ** -self.skew))
+            self.size = upto
+            if upto == end:
+                self.tables.append(AliasTable(np.arange(start + 1, end + 1, dtype=np.float64) ** -self.skew))
+                self.cum.append((self.cum[-1] if self.cum else 0.0) + self.filling)
+                self.filling = 0.0
+                self.starts.append(end)
+        self.total = (self.cum[-1] if self.cum else 0.0) + self.filling
+
+    def draw(self, rand, size: int) -> int:
+        """
+        Index in [0, size) by popularity. One random number picks both the
+        block and, from its remainder, the alias slot and coin flip.
+        """
+        if size > self.size:
+            self._grow(size)
+        while True:
+            u = rand.random() * self.total
+            b = bisect.bisect_right(self.cum, u)
+            if b < len(self.tables):
+                low = self.cum[b - 1] if b else 0.0
+                table = self.tables[b]
+                x = (u - low) / (self.cum[b] - low) * table.n
+                i = min(int(x), table.n - 1)
+                j = self.starts[b] + (i if x - i < table.prob[i] else table.alias[i])
+            else:
+                start = self.starts[-1]
+                top = (start + 1) ** -self.skew
+                while True:
+                    j = start + int(rand.random() * (self.size - start))
+                    if rand.random() * top < (j + 1) ** -self.skew:
+                        break
+            if j < size:
+                return j
+
+    def pick(self, rand, entities):
+        """
+        An entity of `entities` (an EntityStore or list): rand.choice when
+        uniform.
+        """
+        if self.skew is None:
+            return rand.choice(entities)
+        return entities[self.draw(rand, len(entities))]
+
+    def draws(self, rng: np.random.Generator, sizes: np.ndarray) -> np.ndarray:
+        """
+        Vectorized draw: one index in [0, sizes[i]) per element (sizes >= 1).
+        Draws over the largest size and redraws those past their own size,
+        which are the least popular entities, so redraws are rare.
+        """
+        sizes = np.asarray(sizes, dtype=np.int64)
+        out = np.empty(len(sizes), dtype=np.int64)
+        if len(sizes) and sizes.max() > self.size:
+            self._grow(int(sizes.max()))
+        todo = np.arange(len(sizes))
+        while len(todo):
+            k = self._draws(rng, len(todo))
+            ok = k < sizes[todo]
+            out[todo[ok]] = k[ok]
+            todo = todo[~ok]
+        return out
+
+    def _draws(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        out = np.empty(n, dtype=np.int64)
+        u = rng.random(n) * self.total
+        blocks = np.searchsorted(np.asarray(self.cum), u, side="right")
+        for b in np.unique(blocks).tolist():
+            idx = np.flatnonzero(blocks == b)
+            if b < len(self.tables):
+                out[idx] = self.starts[b] + self.tables[b].draws(rng, len(idx))
+                continue
+            start = self.starts[-1]
+            top = (start + 1.0) ** -self.skew
+            while len(idx):
+                j = start + (rng.random(len(idx)) * (self.size - start)).astype(np.int64)
+                ok = rng.random(len(idx)) * top < (j + 1.0) ** -self.skew
+                out[idx[ok]] = j[ok]
+                idx = idx[~ok]
+        return out
+
+
+class Sampling:
+    """
+    The weighted fields of one domain, configured from its YAML `sampling`
+    section: {field: spec}, see Choice.configure and EntitySampler. Each
+    domain module builds one at import and registers every draw the
+    section can weight, entity picks and categorical choices alike.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+
+    def choice(self, name: str, values: Sequence[Any]) -> Choice:
+        self.fields[name] = Choice(name, values)
+        return self.fields[name]
+
+    def entities(self, name: str) -> EntitySampler:
+        self.fields[name] = EntitySampler(name)
+        return self.fields[name]
+
+    def configure(self, settings: Optional[Dict[str, Any]]):
+        settings = settings or {}
+        unknown = sorted(set(settings) - set(self.fields))
+        if unknown:
+            raise ValueError(f"unknown sampling field(s) {', '.join(unknown)}; "
+                             f"this domain has {', '.join(sorted(self.fields))}")
+        for name, field in self.fields.items():
+            field.configure(settings.get(name))
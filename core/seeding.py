@@ -0,0 +1,158 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import fields
+from itertools import zip_longest
+from typing import Dict, Any, Iterable, Iterator, Tuple
+
+from core.db_utils import count_rows, insert_columns
+from core.sheets_append import UPLOAD_ROWS, iter_csv_into_sheet_if_empty
+
+# rows per CSV chunk; memory used by seeding is bounded by this
+SEED_CHUNK_ROWS = 50_000
+
+# read_csv dtype per dataclass annotation, everything else is read as text;
+# nullable "Int64" so blank cells load (see iter_csv_into_sheet_if_empty)
+PANDAS_DTYPES = {int: "Int64", float: "float64"}
+
+_DONE = object()
+
+
+class Prefetch:
+    """
+    Runs an iterator on a pool thread, at most `depth` items ahead of the
+    consumer, so several slow iterators (sheet probes and uploads) make
+    progress at once while one thread consumes them in order. An exception
+    in the iterator is re-raised to the consumer. cancel() stops the
+    thread at its next item when the consumer gives up early.
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor, items: Iterable[Any], depth: int = 1):
+        self.queue: queue.Queue = queue.Queue(depth)
+        self.cancelled = threading.Event()
+        pool.submit(self._run, items)
+
+    def _put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _run(self, items: Iterable[Any]):
+        try:
+            for item in items:
+                self._put((item, None))
+                if self.cancelled.is_set():
+                    return
+        except BaseException as exc:
+            self._put((None, exc))
+            return
+        self._put((_DONE, None))
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            item, exc = self.queue.get()
+            if exc is not None:
+                raise exc
+            if item is _DONE:
+                return
+            yield item
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+def csv_dtypes(columns: Dict[str, str], model) -> Dict[str, Any]:
+    """
+    Explicit read_csv dtypes for the CSV headers in `columns` (CSV header ->
+    field of `model`), so chunks never re-infer types.
+    """
+    types = {f.name: f.type for f in fields(model)}
+    return {header: PANDAS_DTYPES.get(types.get(name), str) for header, name in columns.items()}
+
+
+def seed_table(conn, chunks: Iterable[Any], table: str, columns: Dict[str, str]) -> int:
+    """
+    Insert the mapped columns of every CSV chunk (as yielded by
+    iter_csv_into_sheet_if_empty) into `table` with executemany, all in one
+    transaction. Returns the number of rows seeded.
+    """
+    n = 0
+    for chunk in chunks:
+        insert_columns(conn, table, {name: chunk[header].values for header, name in columns.items()},
+                       commit=False)
+        n += len(chunk)
+    conn.commit()
+    return n
+
+
+def seed_mapping(conn, left: Tuple[Iterable[Any], str, str], right: Tuple[Iterable[Any], str, str],
+                 table: str, done: int = 0) -> int:
+    """
+    Seed a mem table pairing the ID columns of two CSVs row by row.
+    left/right are (CSV chunks, CSV header, table column). Pairs are only
+    seeded when both sheets were empty, up to the shorter CSV. The first
+    `done` pairs are skipped: the table has no key to dedupe them, and a
+    resumed upload yields its chunks from the start again. Returns the
+    number of pairs inserted.
+    """
+    (chunks_a, header_a, col_a), (chunks_b, header_b, col_b) = left, right
+    n = 0
+    for a, b in zip_longest(chunks_a, chunks_b):
+        if a is None or b is None:
+            continue
+        k = min(len(a), len(b))
+        skip = min(max(done - n, 0), k)
+        if skip < k:
+            insert_columns(conn, table, {col_a: a[header_a].values[skip:k], col_b: b[header_b].values[skip:k]},
+                           commit=False)
+        n += k
+    conn.commit()
+    return max(n - done, 0)
+
+
+def seed_domain(config: Dict[str, Any], ws_map: Dict[str, Any], conn,
+                tables: Dict[str, Tuple[str, Any, Dict[str, str]]],
+                mapping: Tuple[str, Tuple[str, str, str], Tuple[str, str, str]],
+                upload: bool = True):
+    """
+    Seed a domain from its CSVs: `tables` maps worksheet key -> (table,
+    dataclass, {CSV header: column}) for the entity CSVs, `mapping` is
+    (mem table, (key, CSV header, column), (key, CSV header, column)) for
+    the two fact CSVs whose IDs pair up. YAML `seed_chunk_rows` sets the
+    chunk size and `sheet_upload_rows` the rows per Sheets request. With
+    upload=False (sinks other than sheets) the CSVs only seed SQLite, so
+    memory stays bounded by the chunk size.
+
+    Entity rows are keyed, so re-inserting a resumed upload's chunks
+    replaces them; the mem table skips the pairs it already has.
+
+    Every worksheet is probed and uploaded on its own pool thread, all at
+    once; the SQLite inserts stay on the calling thread (the connection
+    isn't shared), consuming the chunks table by table as they arrive.
+    """
+    paths = config["csv_paths"]
+    chunksize = config.get("seed_chunk_rows", SEED_CHUNK_ROWS)
+    upload_rows = config.get("sheet_upload_rows", UPLOAD_ROWS)
+    mem_table, (key_a, header_a, col_a), (key_b, header_b, col_b) = mapping
+    dtypes = {key: csv_dtypes(columns, model) for key, (_, model, columns) in tables.items()}
+    dtypes[key_a] = {header_a: str}
+    dtypes[key_b] = {header_b: str}
+    with ThreadPoolExecutor(max_workers=len(dtypes), thread_name_prefix="seed") as pool:
+        chunks = {
+            key: Prefetch(pool, iter_csv_into_sheet_if_empty(ws_map[key] if upload else None, paths[key],
+                                                             dtype, chunksize, upload_rows))
+            for key, dtype in dtypes.items()
+        }
+        try:
+            for key, (table, _, columns) in tables.items():
+                seed_table(conn, chunks[key], table, columns)
+            # rows of an interrupted earlier seeding; the generator only
+            # adds to the table once seeding is complete
+            seed_mapping(conn, (chunks[key_a], header_a, col_a), (chunks[key_b], header_b, col_b),
+                         mem_table, count_rows(conn, mem_table))
+        finally:
+            for prefetch in chunks.values():
+                prefetch.cancel()
@@ -0,0 +1,86 @@
+import copy
+import multiprocessing
+from typing import List, Dict, Any
+
+from core.db_utils import BatchWriter, fetch_since, max_rowid
+from core.entity_store import EntityStore
+
+
+class SharedPool:
+    """
+    Keeps one worker's EntityStore in step with the entity table, so
+    products/stores/... created by other workers become sampleable too.
+    Entities the store already holds (this worker's own) are skipped when
+    they come back from SQLite.
+    """
+
+    def __init__(self, conn, table: str, key: str, entities: EntityStore):
+        self.conn = conn
+        self.table = table
+        self.key = key
+        self.entities = entities
+        self.last_rowid = max_rowid(conn, table)
+
+    def refresh(self):
+        rows, self.last_rowid = fetch_since(self.conn, self.table, self.last_rowid)
+        for r in rows:
+            if r[self.key] not in self.entities:
+                self.entities.append(r)
+
+
+class SharedPools:
+    """
+    Refreshes a worker's SharedPools every `every` records. The worker's
+    own pending entity rows are flushed first so the others can see them.
+    """
+
+    def __init__(self, db: BatchWriter, pools: List[SharedPool], every: int = 1000):
+        self.db = db
+        self.pools = pools
+        self.every = every
+        self.count = 0
+
+    def tick(self):
+        self.count += 1
+        if self.pools and self.count % self.every == 0:
+            self.db.flush()
+            for pool in self.pools:
+                pool.refresh()
+
+
+def shard_args(args, shard: int, workers: int):
+    """
+    Per-worker copy of the CLI args: --count and --rate are split across
+    the workers, --duration applies to each of them as is.
+    """
+    sub = copy.copy(args)
+    if args.count is not None:
+        sub.count = args.count // workers + (1 if shard < args.count % workers else 0)
+    if args.rate > 0:
+        sub.rate = args.rate / workers
+    return sub
+
+
+def run_sharded(target, config: Dict[str, Any], args, workers: int):
+    """
+    Run target(config, args, shard) in `workers` processes and wait for all
+    of them. Ctrl+C reaches every worker (same process group), each one
+    flushes its own outputs before exiting.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(target=target, args=(config, shard_args(args, i, workers), i),
+                    name=f"worker-{i}")
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.join()
+    failed = [p.name for p in procs if p.exitcode != 0]
+    if failed:
+        raise RuntimeError(f"Workers failed: {', '.join(failed)}")
@@ -1,33 +1,415 @@
+import functools
 import os
-from typing import Dict, List, Any
-import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 
+from core import metrics
+from core.pacing import RateLimiter
+from core.resume import batch_landed, last_row, reconcile
+from core.sinks import Sink
+from tenacity import (
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 
-class SheetBuffer:
-    def __init__(self, worksheet, buffer_size: int = 5):
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# rows per values.update request when uploading a seed CSV, well under the
+# API's payload limit for typical row widths
+UPLOAD_ROWS = 10_000
+
+
+def _api_status(exc: BaseException) -> Optional[int]:
+    """
+    HTTP status of a gspread APIError, else None. gspread and requests are
+    only imported once a real spreadsheet is opened (see authorize), and
+    until then no exception can be one of theirs.
+    """
+    gspread = sys.modules.get("gspread")
+    if gspread is not None and isinstance(exc, gspread.exceptions.APIError):
+        return exc.response.status_code
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = _api_status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    requests = sys.modules.get("requests")
+    return requests is not None and isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+def may_have_landed(exc: BaseException) -> bool:
+    """
+    Retryable errors after which the request may still have been applied
+    (5xx, dropped connections, timeouts); a 429 never was.
+    """
+    status = _api_status(exc)
+    if status is not None:
+        return status != 429
+    return is_retryable(exc)
+
+
+def call_with_retry(fn, *args, max_attempts: int = 8, landed=None):
+    """
+    fn(*args) with exponential backoff + jitter on 429/5xx and connection
+    errors. Other errors (bad range, auth) are raised at once. For appends,
+    landed() tells whether an attempt that failed ambiguously was applied
+    after all, in which case it isn't repeated.
+    """
+    check = False
+    for attempt in Retrying(
+        retry=retry_if_exception(is_retryable),
+        wait=wait_random_exponential(multiplier=0.5, max=60),
+        stop=stop_after_attempt(max_attempts),
+        reraise=True,
+    ):
+        with attempt:
+            if attempt.retry_state.attempt_number > 1:
+                metrics.SHEETS_RETRIES.inc()
+            if check and landed():
+                return None
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            except Exception as e:
+                check = landed is not None and may_have_landed(e)
+                raise
+            finally:
+                metrics.SHEETS_REQUEST_SECONDS.observe(time.perf_counter() - start)
+
+
+def append_rows_with_retry(ws, rows: List[List[str]], max_attempts: int = 8):
+    call_with_retry(ws.append_rows, rows, max_attempts=max_attempts)
+
+
+class SheetWriter:
+    """
+    Background writer for one spreadsheet. Flushed batches go through a
+    bounded queue to a single daemon thread, so appends stay in order while
+    the generation loop never waits on the network. submit() blocks when
+    the queue is full, which is the backpressure on the producer. With a
+    `quota` (requests per minute) requests are paced to stay within it;
+    one writer shared by several domains shares the quota between them in
+    submission order.
+    """
+
+    def __init__(self, max_queue: int = 100, max_attempts: int = 8, quota: Optional[float] = None):
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.max_attempts = max_attempts
+        self.limiter = RateLimiter(quota / 60.0 if quota else 0)
+        metrics.SHEETS_QUEUE.track(self.queue.qsize)
+        self.failed: List[tuple] = []
+        self.thread = threading.Thread(target=self._run, name="sheet-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, ws, rows: List[List[str]], on_done=None, landed=None):
+        self.submit_call(getattr(ws, "title", str(ws)), len(rows), ws.append_rows, rows,
+                         on_done=on_done, landed=landed)
+
+    def submit_call(self, label: str, n_rows: int, fn, *args, on_done=None, landed=None):
+        """
+        Queue fn(*args) (one API request, retried, see call_with_retry)
+        writing n_rows rows. on_done(delivered: bool) is called once the
+        request succeeded or was given up on.
+        """
+        self.queue.put((label, n_rows, fn, args, on_done, landed))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                label, n_rows, fn, args, on_done, landed = item
+                self.limiter.acquire()
+                try:
+                    call_with_retry(fn, *args, max_attempts=self.max_attempts, landed=landed)
+                except Exception as e:
+                    # keep the batch so the caller can see what was lost
+                    self.failed.append((label, args, e))
+                    metrics.SHEETS_FAILED.inc()
+                    print(f"Sheet write to {label} failed after retries "
+                          f"({n_rows} rows): {e}", file=sys.stderr)
+                    delivered = False
+                else:
+                    delivered = True
+                if on_done is not None:
+                    on_done(delivered)
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """
+        Block until every submitted batch has been written (or given up on).
+        """
+        self.queue.join()
+
+    def close(self):
+        self.flush()
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        metrics.SHEETS_QUEUE.untrack(self.queue.qsize)
+
+
+class WriterDrain:
+    """
+    Shutdown entry for a SheetWriter shared with other domains: close()
+    waits for the queue to drain without stopping the writer.
+    """
+
+    def __init__(self, writer: SheetWriter):
+        self.writer = writer
+
+    def close(self):
+        self.writer.flush()
+
+
+def observe_flush(start: float, rows: int, payload_bytes: int):
+    metrics.SHEETS_FLUSH_SECONDS.observe(time.perf_counter() - start)
+    metrics.SHEETS_FLUSH_ROWS.observe(rows)
+    metrics.SHEETS_FLUSH_BYTES.observe(payload_bytes)
+
+
+def spool_hooks(spool, ws, rows: List[List[str]], counts: Dict[str, int]):
+    """
+    (on_done, landed) for a batch of spooled rows: on_done settles the rows
+    in `counts` (worksheet title -> rows), landed checks the batch's last
+    row against `ws`'s tail. (None, None) without a spool.
+    """
+    if spool is None:
+        return None, None
+    spool.flush()
+    on_done = functools.partial(spool.settle, counts)
+    landed = functools.partial(batch_landed, ws, rows[-1][0], spool.marks.get(ws.title), len(rows))
+    return on_done, landed
+
+
+def send_spooled(spool, counts: Dict[str, int], landed, send, *args):
+    """
+    send(*args) synchronously, settling the spooled rows in `counts`
+    with the outcome.
+    """
+    try:
+        call_with_retry(send, *args, landed=landed)
+    except Exception:
+        if spool is not None:
+            spool.settle(counts, False)
+        raise
+    if spool is not None:
+        spool.settle(counts, True)
+
+
+class SheetBuffer(Sink):
+    def __init__(self, worksheet, buffer_size: int = 5, writer: Optional[SheetWriter] = None,
+                 spool=None):
         self.ws = worksheet
         self.buffer_size = buffer_size
+        self.writer = writer
+        self.spool = spool
         self.rows: List[List[str]] = []
 
     def add(self, row: List[Any]):
-        self.rows.append([str(x) for x in row])
+        cells = [str(x) for x in row]
+        if self.spool is not None:
+            self.spool.append(self.ws.title, cells)
+        self.rows.append(cells)
         if len(self.rows) >= self.buffer_size:
             self.flush()
 
     def flush(self):
         if self.rows:
-            self.ws.append_rows(self.rows)
+            start = time.perf_counter()
+            n_rows = len(self.rows)
+            # estimated from the first row, rows of one tab are alike
+            first = self.rows[0]
+            payload = (sum(map(len, first)) + SpreadsheetBuffer.CELL_OVERHEAD * len(first)) * n_rows
+            counts = {self.ws.title: n_rows}
+            on_done, landed = spool_hooks(self.spool, self.ws, self.rows, counts)
+            if self.writer is not None:
+                self.writer.submit(self.ws, self.rows, on_done, landed)
+            else:
+                send_spooled(self.spool, counts, landed, self.ws.append_rows, self.rows)
             self.rows = []
+            observe_flush(start, n_rows, payload)
 
 
-def get_sheets_client(service_json: str, sheet_url: str):
+class SpreadsheetBuffer:
+    """
+    Collects pending rows for every tab of one spreadsheet and writes them
+    with a single spreadsheets.batchUpdate (one appendCells request per tab),
+    instead of one append_rows call per tab. Flushes once `max_rows` rows or
+    ~`max_bytes` of payload are pending, or the oldest pending row is
+    `max_latency` seconds old. Cells are sent as string values, matching the
+    RAW append_rows path. With a spool, rows are journaled on add() and
+    acknowledged per tab once their batchUpdate succeeded.
+    """
+
+    # rough JSON overhead per cell: {"userEnteredValue": {"stringValue": ""}}
+    CELL_OVERHEAD = 45
+
+    def __init__(self, spread, writer: Optional[SheetWriter] = None,
+                 max_rows: int = 500, max_bytes: int = 2_000_000, max_latency: float = 5.0,
+                 spool=None):
+        self.spread = spread
+        self.writer = writer
+        self.spool = spool
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.pending: Dict[int, Tuple[Any, List[List[str]]]] = {}
+        self.n_rows = 0
+        self.n_bytes = 0
+        self.oldest: Optional[float] = None
+
+    def tab(self, worksheet) -> "TabBuffer":
+        return TabBuffer(self, worksheet)
+
+    def add(self, ws, row: List[Any]):
+        cells = [str(x) for x in row]
+        if self.spool is not None:
+            self.spool.append(ws.title, cells)
+        self.pending.setdefault(ws.id, (ws, []))[1].append(cells)
+        self.n_rows += 1
+        self.n_bytes += sum(len(c) for c in cells) + self.CELL_OVERHEAD * len(cells)
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.poll()
+
+    def poll(self):
+        if self.n_rows >= self.max_rows or self.n_bytes >= self.max_bytes or (
+            self.oldest is not None and time.monotonic() - self.oldest >= self.max_latency
+        ):
+            self.flush()
+
+    def flush(self):
+        if not self.n_rows:
+            return
+        start = time.perf_counter()
+        body = {"requests": [
+            {"appendCells": {
+                "sheetId": sheet_id,
+                "rows": [{"values": [{"userEnteredValue": {"stringValue": c}} for c in r]}
+                         for r in rows],
+                "fields": "userEnteredValue",
+            }}
+            for sheet_id, (ws, rows) in self.pending.items()
+        ]}
+        label = ", ".join(ws.title for ws, _ in self.pending.values())
+        counts = {ws.title: len(rows) for ws, rows in self.pending.values()}
+        # one batchUpdate is applied whole, so checking one tab is enough
+        ws, rows = next(iter(self.pending.values()))
+        on_done, landed = spool_hooks(self.spool, ws, rows, counts)
+        if self.writer is not None:
+            self.writer.submit_call(label, self.n_rows, self.spread.batch_update, body,
+                                    on_done=on_done, landed=landed)
+        else:
+            send_spooled(self.spool, counts, landed, self.spread.batch_update, body)
+        observe_flush(start, self.n_rows, self.n_bytes)
+        self.pending = {}
+        self.n_rows = 0
+        self.n_bytes = 0
+        self.oldest = None
+
+    def close(self):
+        self.flush()
+
+
+class TabBuffer(Sink):
+    """
+    SheetBuffer-compatible view of one tab of a SpreadsheetBuffer.
+    """
+
+    def __init__(self, parent: SpreadsheetBuffer, worksheet):
+        self.parent = parent
+        self.ws = worksheet
+
+    def add(self, row: List[Any]):
+        self.parent.add(self.ws, row)
+
+    def flush(self):
+        self.parent.flush()
+
+
+def make_sheet_writer(config: Dict[str, Any]) -> Optional[SheetWriter]:
+    """
+    Background writer per the YAML config (async_flush, flush_queue_size,
+    flush_max_attempts, write_quota), or None for synchronous flushing.
+    """
+    if not config.get("async_flush", True):
+        return None
+    return SheetWriter(config.get("flush_queue_size", 100), config.get("flush_max_attempts", 8),
+                       config.get("write_quota"))
+
+
+def make_sheet_buffers(spread, ws_map: Dict[str, Any], config: Dict[str, Any], spool=None,
+                       writer: Optional[SheetWriter] = None):
+    """
+    Buffers for every worksheet key plus the objects to flush at shutdown,
+    in order. With coalesce_tabs (default) all tabs share one
+    SpreadsheetBuffer, so a flush is one API request for the whole sheet.
+    With a spool, rows it recovered from an earlier run that the sheet's
+    tail doesn't already hold are re-sent first, and the spool is closed
+    (compacted) last. A `writer` passed in is shared with other domains:
+    it is drained at shutdown but left running.
+    """
+    drain = None
+    if writer is None:
+        writer = make_sheet_writer(config)
+    else:
+        drain = WriterDrain(writer)
+    if config.get("coalesce_tabs", True):
+        sheet_buf = SpreadsheetBuffer(
+            spread, writer,
+            config.get("flush_rows", 500),
+            config.get("flush_bytes", 2_000_000),
+            config.get("flush_latency", 5.0),
+            spool,
+        )
+        buffers = {key: sheet_buf.tab(ws) for key, ws in ws_map.items()}
+        flushers = [sheet_buf, drain or writer]
+    else:
+        buffers = {key: SheetBuffer(ws, config["buffer_size"], writer, spool) for key, ws in ws_map.items()}
+        flushers = list(buffers.values()) + [drain or writer]
+    if spool is not None:
+        for ws in ws_map.values():
+            if ws.title in spool.recovered:
+                missing, mark = reconcile(ws, spool.recovered[ws.title], spool.marks.get(ws.title))
+                spool.recovered[ws.title] = missing
+                spool.set_mark(ws.title, mark)
+            elif ws.title not in spool.marks:
+                spool.set_mark(ws.title, last_row(ws))
+        n = spool.replay({ws.title: buffers[key].add for key, ws in ws_map.items()})
+        if n:
+            print(f"Replaying {n} unsent rows from {spool.path}")
+        flushers.append(spool)
+    return buffers, flushers
+
+
+@functools.lru_cache(maxsize=None)
+def authorize(service_json: str):
+    """
+    One authorized gspread client per service account and process, shared
+    by every domain run in it.
+    """
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     creds = Credentials.from_service_account_file(
         service_json,
         scopes=["https://www.googleapis.com/auth/spreadsheets"]
     )
-    client = gspread.authorize(creds)
+    return gspread.authorize(creds)
+
+
+def get_sheets_client(service_json: str, sheet_url: str):
+    client = authorize(service_json)
     spread = client.open_by_url(sheet_url)
     return client, spread
 
@@ -36,20 +418,86 @@ def load_worksheets(spread, worksheet_map: Dict[str, str]):
     """
     worksheet_map: {"product": "Product_Master", ...}
     returns: {"product": Worksheet, ...}
+    All tabs come from one spreadsheet metadata fetch; a name it doesn't
+    list falls back to spread.worksheet(name) (which raises for a missing
+    tab of a real spreadsheet).
     """
-    ws = {}
-    for key, name in worksheet_map.items():
-        ws[key] = spread.worksheet(name)
-    return ws
+    by_title = {ws.title: ws for ws in spread.worksheets()}
+    return {key: by_title[name] if name in by_title else spread.worksheet(name)
+            for key, name in worksheet_map.items()}
 
 
-def init_sheet_from_csv_if_empty(ws, csv_path: str):
+def probe_sheet(ws) -> str:
+    """
+    Classify a worksheet from its first two rows only, so the check costs
+    one small request however large the sheet is: "empty" (no rows, or a
+    header alone), "partial" (data under an empty row 1, an interrupted
+    upload, see iter_csv_into_sheet_if_empty) or "filled".
+    """
+    head = call_with_retry(ws.get_values, "1:2")
+    has_header = bool(head) and any(head[0])
+    has_data = len(head) > 1 and any(head[1])
+    if not has_data:
+        return "empty"
+    return "filled" if has_header else "partial"
+
+
+def iter_csv_into_sheet_if_empty(ws: Optional[Any], csv_path: str, dtype: Optional[Dict[str, Any]] = None,
+                                 chunksize: int = 50_000,
+                                 rows_per_request: int = UPLOAD_ROWS) -> Iterator[Any]:
+    """
+    If the worksheet is effectively empty (<= 1 row), stream the CSV into
+    it and yield each chunk of `chunksize` rows after it is written, so
+    callers can seed SQLite from the same pass. Yields nothing when the
+    sheet already has data or the CSV doesn't exist.
+
+    Data rows are written from row 2 down, at most `rows_per_request` rows
+    per request, and the header goes into row 1 last. A sheet with data but
+    no header is therefore an interrupted upload: it is resumed after the
+    last written row (found from column A) while every chunk is still
+    yielded. Chunks are pandas DataFrames; nullable "Int64" columns come
+    back as int64, or float64 (blanks as NaN) in a chunk with blank cells;
+    blank cells are uploaded as empty strings. With ws=None nothing is
+    uploaded and the chunks are only read and yielded.
+    """
+    if not os.path.exists(csv_path):
+        return
+    import pandas as pd
+
+    state = probe_sheet(ws) if ws is not None else "empty"
+    if state == "filled":
+        return
+    written = len(call_with_retry(ws.col_values, 1)) - 1 if state == "partial" else 0
+    row = 2
+    header = None
+    for chunk in pd.read_csv(csv_path, dtype=dtype, chunksize=chunksize):
+        header = chunk.columns.tolist()
+        rows = chunk.astype(object).where(chunk.notna(), "").astype(str).values.tolist() if ws is not None else []
+        for i in range(0, len(rows), rows_per_request):
+            part = rows[i:i + rows_per_request]
+            end = row + len(part) - 1
+            if end - 1 > written:
+                skip = max(0, written - (row - 2))
+                if end > ws.row_count:
+                    call_with_retry(functools.partial(ws.resize, rows=end))
+                call_with_retry(functools.partial(ws.update, part[skip:], f"A{row + skip}"))
+            row = end + 1
+        for col in header:
+            if chunk[col].dtype == "Int64":
+                chunk[col] = chunk[col].astype("float64" if chunk[col].hasnans else "int64")
+        yield chunk
+    if ws is None:
+        return
+    if header is None:
+        header = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    call_with_retry(functools.partial(ws.update, [header], "A1"))
+
+
+def init_sheet_from_csv_if_empty(ws, csv_path: str, rows_per_request: int = UPLOAD_ROWS):
     """
     If the worksheet is effectively empty (<= 1 row), load the CSV into it.
     """
-    values = ws.get_all_values()
-    if len(values) <= 1 and os.path.exists(csv_path):
-        df = pd.read_csv(csv_path)
-        ws.update([df.columns.tolist()] + df.astype(str).values.tolist())
-        return df
-    return None
+    import pandas as pd
+
+    chunks = list(iter_csv_into_sheet_if_empty(ws, csv_path, rows_per_request=rows_per_request))
+    return pd.concat(chunks, ignore_index=True) if chunks else None
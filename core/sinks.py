@@ -0,0 +1,478 @@
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import fields
+from typing import Dict, List, Any, Optional, Tuple
+
+from core import metrics
+from core.resume import file_tail
+
+# Output type per dataclass annotation, for sinks that keep typed columns
+SQLITE_TYPES = {int: "INTEGER", float: "REAL", str: "TEXT"}
+
+
+def table_columns(model) -> List[str]:
+    return [f.name for f in fields(model)]
+
+
+class Sink:
+    """
+    One output table. add() takes a row in dataclass field order, flush()
+    pushes buffered rows to the destination, close() flushes and releases
+    the destination. SheetBuffer is the Google Sheets implementation.
+    """
+
+    def add(self, row: List[Any]):
+        raise NotImplementedError
+
+    def add_columns(self, columns: Dict[str, Any]):
+        """
+        Add a column-oriented batch (as returned by generate_batch).
+        """
+        values = [c.tolist() if hasattr(c, "tolist") else list(c) for c in columns.values()]
+        for row in zip(*values):
+            self.add(list(row))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class MeteredSink(Sink):
+    """
+    Counts the rows going into a sink (metrics sink_rows_total{table}) and
+    passes everything through.
+    """
+
+    def __init__(self, sink: Sink, table: str):
+        self.sink = sink
+        self.rows = metrics.SINK_ROWS.labels(table)
+
+    def add(self, row: List[Any]):
+        self.rows.inc()
+        self.sink.add(row)
+
+    def add_columns(self, columns: Dict[str, Any]):
+        for values in columns.values():
+            self.rows.inc(len(values))
+            break
+        self.sink.add_columns(columns)
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+
+
+class CSVSink(Sink):
+    """
+    Appends rows to a CSV file through a large write buffer; the header
+    (dataclass field names) is written when the file is new. A partial last
+    line left by a crash is cut off first, so appends start on a clean row;
+    `last_id` is the ID (first column) of the last row already in the file,
+    the high-water mark resume_files() continues from.
+    """
+
+    def __init__(self, path: str, columns: List[str], buffer_bytes: int = 1 << 20):
+        self.path = path
+        self.created = not os.path.exists(path)
+        tail = file_tail(path)
+        new = tail is None
+        last = next(csv.reader([tail])) if tail else None
+        self.last_id: Optional[str] = last[0] if last and last != columns else None
+        self.f = open(path, "a", newline="", buffering=buffer_bytes)
+        self.writer = csv.writer(self.f)
+        if new:
+            self.writer.writerow(columns)
+
+    def add(self, row: List[Any]):
+        self.writer.writerow(row)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+
+class NDJSONSink(Sink):
+    """
+    Appends one JSON object per row to a newline-delimited JSON file, after
+    cutting off a partial last line left by a crash; `last_id` as in
+    CSVSink.
+    """
+
+    def __init__(self, path: str, columns: List[str], buffer_bytes: int = 1 << 20):
+        self.path = path
+        self.created = not os.path.exists(path)
+        tail = file_tail(path)
+        last = json.loads(tail) if tail else None
+        self.last_id: Optional[str] = str(next(iter(last.values()))) if last else None
+        self.columns = columns
+        self.f = open(path, "a", buffering=buffer_bytes)
+
+    def add(self, row: List[Any]):
+        self.f.write(json.dumps(dict(zip(self.columns, row)), default=str))
+        self.f.write("\n")
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+
+class SQLiteSink(Sink):
+    """
+    Appends rows to a fact table (created from the dataclass annotations)
+    with one executemany + commit per `buffer_size` rows.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, table: str, model, buffer_size: int = 5000):
+        self.conn = conn
+        self.buffer_size = buffer_size
+        self.rows: List[tuple] = []
+        cols = ", ".join(f"{f.name} {SQLITE_TYPES.get(f.type, 'TEXT')}" for f in fields(model))
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols})")
+        conn.commit()
+        names = table_columns(model)
+        self.sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join(['?'] * len(names))})"
+
+    def add(self, row: List[Any]):
+        self.rows.append(tuple(x if isinstance(x, (int, float, str)) or x is None else str(x) for x in row))
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.conn.executemany(self.sql, self.rows)
+            self.conn.commit()
+            self.rows = []
+
+
+class ParquetSink(Sink):
+    """
+    Accumulates typed columns (from the dataclass annotations) and writes
+    them as Parquet row groups of `row_group_size` rows. A new file
+    <dir>/<key>-<timestamp>-<seq>.parquet is started once the current one
+    holds `rollover_rows` rows. With `rollover_seconds`, the file is also
+    closed, with its pending rows as a short row group, once its first row
+    is that old (checked on every add and flush, so slow streams roll over
+    too).
+    """
+
+    def __init__(self, out_dir: str, key: str, model, row_group_size: int = 100_000,
+                 compression: str = "zstd", rollover_rows: Optional[int] = None,
+                 rollover_seconds: Optional[float] = None):
+        if row_group_size <= 0:
+            raise ValueError(f"sink.row_group_size must be positive, not {row_group_size!r}")
+        if rollover_rows is not None and rollover_rows <= 0:
+            raise ValueError(f"sink.rollover_rows must be positive, not {rollover_rows!r}")
+        if rollover_seconds is not None and rollover_seconds <= 0:
+            raise ValueError(f"sink.rollover_seconds must be positive, not {rollover_seconds!r}")
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.pq = pq
+        self.out_dir = out_dir
+        self.key = key
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.rollover_rows = rollover_rows
+        self.rollover_seconds = rollover_seconds
+        arrow_types = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+        self.schema = pa.schema([(f.name, arrow_types.get(f.type, pa.string())) for f in fields(model)])
+        self.str_cols = {f.name for f in fields(model) if arrow_types.get(f.type, pa.string()) == pa.string()}
+        self.columns: Dict[str, List[Any]] = {name: [] for name in self.schema.names}
+        self.n_pending = 0
+        self.writer = None
+        self.file = None
+        self.file_rows = 0
+        # arrival of the current file's first row, None before it
+        self.file_started: Optional[float] = None
+        self.seq = 0
+
+    def add(self, row: List[Any]):
+        self._check_age()
+        for name, x in zip(self.schema.names, row):
+            if name in self.str_cols and not isinstance(x, str):
+                x = str(x)
+            self.columns[name].append(x)
+        self.n_pending += 1
+        if self.file_started is None:
+            self.file_started = time.monotonic()
+        if self.n_pending >= self.row_group_size:
+            self._write_group()
+
+    def add_columns(self, columns: Dict[str, Any]):
+        self._check_age()
+        n = 0
+        for name, values in columns.items():
+            values = values.tolist() if hasattr(values, "tolist") else list(values)
+            if name in self.str_cols:
+                values = [x if isinstance(x, str) else str(x) for x in values]
+            self.columns[name].extend(values)
+            n = len(values)
+        self.n_pending += n
+        if n and self.file_started is None:
+            self.file_started = time.monotonic()
+        while self.n_pending >= self.row_group_size:
+            self._write_group()
+
+    def _open(self):
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        # exclusive create: a restart within the same second skips the
+        # previous run's files instead of overwriting them
+        while True:
+            path = os.path.join(self.out_dir, f"{self.key}-{stamp}-{self.seq:05d}.parquet")
+            self.seq += 1
+            try:
+                self.file = open(path, "xb")
+                break
+            except FileExistsError:
+                continue
+        self.writer = self.pq.ParquetWriter(self.file, self.schema, compression=self.compression)
+        self.file_rows = 0
+
+    def _close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.file.close()
+
+    def _check_age(self):
+        """
+        Close the current file, pending rows included, once its first row
+        is `rollover_seconds` old.
+        """
+        if (self.rollover_seconds is None or self.file_started is None
+                or time.monotonic() - self.file_started < self.rollover_seconds):
+            return
+        while self.n_pending:
+            self._write_group()
+        self._close()
+        self.file_started = None
+
+    def _write_group(self):
+        n = min(self.n_pending, self.row_group_size)
+        if n == 0:
+            return
+        if self.writer is not None and self.rollover_rows is not None and self.file_rows >= self.rollover_rows:
+            self._close()
+            self.file_started = time.monotonic()
+        if self.writer is None:
+            self._open()
+        if self.rollover_rows is not None:
+            n = min(n, self.rollover_rows - self.file_rows)
+        table = self.pa.table(
+            {name: self.pa.array(vals[:n], type=self.schema.field(name).type)
+             for name, vals in self.columns.items()},
+            schema=self.schema,
+        )
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+        for vals in self.columns.values():
+            del vals[:n]
+        self.n_pending -= n
+        self.file_rows += n
+
+    def flush(self):
+        """
+        Write pending rows as a (possibly short) row group. Only called at
+        shutdown by the run loop, so row groups otherwise stay full size.
+        """
+        self._check_age()
+        while self.n_pending:
+            self._write_group()
+
+    def close(self):
+        self.flush()
+        self._close()
+        self.file_started = None
+
+
+class FakeWorksheet:
+    """
+    In-memory stand-in for a gspread Worksheet covering the calls this
+    project makes, for offline runs and benchmarks of the Sheets path.
+    """
+
+    def __init__(self, sheet_id: int, title: str, row_count: int = 1000):
+        self.id = sheet_id
+        self.title = title
+        self.row_count = row_count
+        self.values: List[List[str]] = []
+
+    def get_all_values(self) -> List[List[str]]:
+        return [list(r) for r in self.values]
+
+    def get_values(self, range_name: str) -> List[List[str]]:
+        """
+        Row ranges ("1:2") and column A ranges ("A5:A10") only.
+        """
+        first, last = (int(x.lstrip("A")) for x in range_name.split(":"))
+        rows = self.values[first - 1:last]
+        if range_name[0] == "A":
+            rows = [r[:1] for r in rows]
+        while rows and not any(rows[-1]):
+            rows.pop()
+        return [list(r) for r in rows]
+
+    def col_values(self, col: int) -> List[str]:
+        column = [r[col - 1] if len(r) >= col else "" for r in self.values]
+        while column and not column[-1]:
+            column.pop()
+        return column
+
+    def resize(self, rows: Optional[int] = None, cols: Optional[int] = None):
+        if rows is not None:
+            self.row_count = rows
+
+    def update(self, values: List[List[Any]], range_name: Optional[str] = None, **kwargs):
+        """
+        Writes rows starting at column A of `range_name` ("A5"; default A1),
+        failing past the grid like the API does.
+        """
+        start = int((range_name or "A1")[1:]) - 1
+        if start + len(values) > self.row_count:
+            raise ValueError(f"Range {range_name} exceeds grid limits. Max rows: {self.row_count}")
+        if len(self.values) < start + len(values):
+            self.values.extend([] for _ in range(start + len(values) - len(self.values)))
+        for i, r in enumerate(values):
+            self.values[start + i] = [str(x) for x in r]
+
+    def append_rows(self, values: List[List[Any]], **kwargs):
+        self.values.extend([str(x) for x in r] for r in values)
+        self.row_count = max(self.row_count, len(self.values))
+
+
+class FakeSpreadsheet:
+    """
+    In-memory stand-in for a gspread Spreadsheet; worksheets are created on
+    first access and batch_update understands appendCells requests.
+    """
+
+    def __init__(self):
+        self.sheets: Dict[str, FakeWorksheet] = {}
+        self.requests = 0
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        if title not in self.sheets:
+            self.sheets[title] = FakeWorksheet(len(self.sheets), title)
+        return self.sheets[title]
+
+    def worksheets(self) -> List[FakeWorksheet]:
+        return list(self.sheets.values())
+
+    def batch_update(self, body: Dict[str, Any]):
+        self.requests += 1
+        by_id = {ws.id: ws for ws in self.sheets.values()}
+        for req in body.get("requests", []):
+            append = req.get("appendCells")
+            if append is None:
+                continue
+            by_id[append["sheetId"]].values.extend(
+                [v["userEnteredValue"]["stringValue"] for v in r["values"]] for r in append["rows"]
+            )
+        return {}
+
+
+def sink_type(config: Dict[str, Any]) -> str:
+    return (config.get("sink") or {}).get("type", "sheets")
+
+
+def shard_path(path: str, shard: Optional[int]) -> str:
+    """
+    Per-worker variant of an output file path: out/sales.csv -> out/sales.w3.csv
+    """
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.w{shard}{ext}"
+
+
+def build_sinks(config: Dict[str, Any], tables: Dict[str, Any], spread, ws_map: Dict[str, Any],
+                shard: Optional[int] = None, writer=None) -> Tuple[Dict[str, Sink], List[Any]]:
+    """
+    Output sink per table key (tables: key -> dataclass) for the `sink`
+    section of the YAML config, plus the objects to close at shutdown in
+    order. `sheets` and `fake` go through the Sheets buffers (`fake`
+    against a FakeSpreadsheet); `csv`/`ndjson` write one file per key under
+    sink.dir; `parquet` writes rolling <key>-*.parquet files under sink.dir;
+    `sqlite` writes one fact table per key into sink.db_path. Rows for real
+    sheets go through the crash-safe spool (core/spool.py).
+    Sharded workers (shard given) write their own csv/ndjson/parquet files,
+    see merge_shard_outputs; sheets and sqlite destinations are shared.
+    `writer` is a SheetWriter shared by several domains (see
+    make_sheet_buffers). Every sink counts its rows in the metrics.
+    """
+    kind = sink_type(config)
+    opts = config.get("sink") or {}
+
+    if kind in ("sheets", "fake"):
+        from core.sheets_append import make_sheet_buffers
+        from core.spool import make_spool
+        # only real sheets are worth journaling: a fake one is gone with the process
+        spool = make_spool(config, shard) if kind == "sheets" else None
+        buffers, flushers = make_sheet_buffers(spread, ws_map, config, spool, writer)
+        return {key: MeteredSink(buf, key) for key, buf in buffers.items()}, flushers
+
+    sinks: Dict[str, Sink] = {}
+    if kind in ("csv", "ndjson"):
+        out_dir = opts.get("dir", "output")
+        os.makedirs(out_dir, exist_ok=True)
+        cls = CSVSink if kind == "csv" else NDJSONSink
+        for key, model in tables.items():
+            path = shard_path(os.path.join(out_dir, f"{key}.{kind}"), shard)
+            sinks[key] = cls(path, table_columns(model), opts.get("buffer_bytes", 1 << 20))
+    elif kind == "parquet":
+        out_dir = opts.get("dir", "output")
+        os.makedirs(out_dir, exist_ok=True)
+        for key, model in tables.items():
+            sinks[key] = ParquetSink(
+                out_dir, key if shard is None else f"{key}-w{shard}", model,
+                opts.get("row_group_size", 100_000),
+                opts.get("compression", "zstd"),
+                opts.get("rollover_rows"),
+                opts.get("rollover_seconds"),
+            )
+    elif kind == "sqlite":
+        conn = sqlite3.connect(opts.get("db_path", config["sqlite"]["db_path"]), timeout=60)
+        for key, model in tables.items():
+            table = f"{opts.get('table_prefix', 'sink_')}{key}"
+            sinks[key] = SQLiteSink(conn, table, model, opts.get("buffer_size", 5000))
+    else:
+        raise ValueError(f"Unknown sink type: {kind}")
+    return {key: MeteredSink(sink, key) for key, sink in sinks.items()}, list(sinks.values())
+
+
+def merge_shard_outputs(config: Dict[str, Any], tables: Dict[str, Any], workers: int):
+    """
+    Append each worker's csv/ndjson file onto the main <key>.<type> file
+    (CSV headers are kept once) and remove the shard files. Parquet shard
+    files are left as they are: together they already form one dataset.
+    """
+    kind = sink_type(config)
+    if kind not in ("csv", "ndjson"):
+        return
+    out_dir = (config.get("sink") or {}).get("dir", "output")
+    for key in tables:
+        path = os.path.join(out_dir, f"{key}.{kind}")
+        for shard in range(workers):
+            part = shard_path(path, shard)
+            if not os.path.exists(part):
+                continue
+            has_header = kind == "csv" and os.path.exists(path) and os.path.getsize(path) > 0
+            with open(part, "rb") as src, open(path, "ab") as dst:
+                if has_header:
+                    src.readline()
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.remove(part)
@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
+
+from core import metrics
+from core.sinks import shard_path
+
+
+class Spool:
+    """
+    Append-only local journal of outgoing rows, so rows buffered for a
+    remote sink survive a crash. Every row is written here (buffered I/O,
+    fsync every `fsync_seconds`) before it is handed to the sink, and
+    acknowledged once the sink confirms the write. Rows never acknowledged
+    are replayed on the next start; the file is compacted down to the
+    unacknowledged rows on start, at close and whenever it outgrows
+    `compact_bytes`.
+
+    Records are JSON lines: {"k": key, "s": seq, "r": row} for a row and
+    {"k": key, "a": [first, last], "w": mark, "id": last_id} acknowledging
+    seqs first..last of key. Rows of one key are delivered in the order
+    they were added, so settle() always concerns the oldest outstanding
+    rows of each key.
+
+    Per key the spool also keeps high-water marks: the ID (first column)
+    of the last acknowledged row and, once known, a row number of the
+    destination at or above its last row (see core/resume.py), so
+    recovered rows can be checked against just the destination's tail
+    and only the missing ones re-sent.
+    """
+
+    def __init__(self, path: str, fsync_seconds: float = 1.0, compact_bytes: int = 64 << 20,
+                 buffer_bytes: int = 1 << 20):
+        self.path = path
+        self.fsync_seconds = fsync_seconds
+        self.compact_bytes = compact_bytes
+        self.buffer_bytes = buffer_bytes
+        self.lock = threading.Lock()
+        # key -> {seq: journal line} for rows not yet acknowledged
+        self.pending: Dict[str, Dict[int, str]] = {}
+        # key -> seqs handed to the sink and not yet settled, oldest first
+        self.outstanding: Dict[str, deque] = {}
+        self.next_seq: Dict[str, int] = {}
+        self.recovered: Dict[str, List[List[Any]]] = {}
+        self.recovered_seqs: Dict[str, List[int]] = {}
+        self.marks: Dict[str, int] = {}
+        self.last_ids: Dict[str, str] = {}
+        self.f = None
+        self.last_sync = time.monotonic()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._recover()
+        self.gauge = lambda: sum(len(rows) for rows in list(self.pending.values()))
+        metrics.SPOOL_PENDING.track(self.gauge)
+
+    def _recover(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break  # torn tail of the last write before a crash
+                    rows = self.pending.setdefault(rec["k"], {})
+                    if "w" in rec:
+                        self.marks[rec["k"]] = rec["w"]
+                    if "id" in rec:
+                        self.last_ids[rec["k"]] = rec["id"]
+                    if "a" in rec:
+                        first, last = rec["a"]
+                        for seq in range(first, last + 1):
+                            rows.pop(seq, None)
+                    elif "s" in rec:
+                        rows[rec["s"]] = line if line.endswith("\n") else line + "\n"
+        for key, rows in self.pending.items():
+            if rows:
+                self.recovered_seqs[key] = sorted(rows)
+                self.recovered[key] = [json.loads(rows[seq])["r"] for seq in self.recovered_seqs[key]]
+        self._compact()
+
+    def _compact(self):
+        """
+        Rewrite the journal with just the unacknowledged rows (atomically,
+        via a temp file) and reopen it for appending.
+        """
+        if self.f is not None:
+            self.f.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for key in set(self.marks) | set(self.last_ids):
+                f.write(json.dumps(self._mark_record(key)) + "\n")
+            for rows in self.pending.values():
+                f.writelines(line for _, line in sorted(rows.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        for key, rows in self.pending.items():
+            self.next_seq[key] = max(self.next_seq.get(key, 0), max(rows, default=-1) + 1)
+        self.f = open(self.path, "a", encoding="utf-8", buffering=self.buffer_bytes)
+        self.last_sync = time.monotonic()
+
+    def _mark_record(self, key: str) -> Dict[str, Any]:
+        rec: Dict[str, Any] = {"k": key}
+        if key in self.marks:
+            rec["w"] = self.marks[key]
+        if key in self.last_ids:
+            rec["id"] = self.last_ids[key]
+        return rec
+
+    def set_mark(self, key: str, row: int):
+        """
+        Record that the destination of `key` has data up to at least `row`.
+        """
+        with self.lock:
+            self.marks[key] = row
+            self.f.write(json.dumps(self._mark_record(key)) + "\n")
+
+    def _maybe_sync(self):
+        if time.monotonic() - self.last_sync >= self.fsync_seconds:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.last_sync = time.monotonic()
+
+    def append(self, key: str, row: List[Any]):
+        """
+        Journal a row that is about to be buffered for `key`.
+        """
+        with self.lock:
+            seq = self.next_seq.get(key, 0)
+            self.next_seq[key] = seq + 1
+            line = json.dumps({"k": key, "s": seq, "r": row}, default=str) + "\n"
+            self.f.write(line)
+            self.pending.setdefault(key, {})[seq] = line
+            self.outstanding.setdefault(key, deque()).append(seq)
+            self._maybe_sync()
+
+    def flush(self):
+        """
+        Hand journaled rows to the OS. Called before a batch goes to the
+        sink, so a killed process never loses rows the sink hasn't seen.
+        """
+        with self.lock:
+            self.f.flush()
+
+    def settle(self, counts: Dict[str, int], delivered: bool):
+        """
+        The oldest counts[key] outstanding rows of each key were written to
+        the sink (delivered) or given up on. Delivered rows are
+        acknowledged; the others stay in the journal for the next start.
+        """
+        with self.lock:
+            for key, n in counts.items():
+                queue = self.outstanding[key]
+                seqs = [queue.popleft() for _ in range(n)]
+                if not delivered or not seqs:
+                    continue
+                rows = self.pending[key]
+                self.last_ids[key] = str(json.loads(rows[seqs[-1]])["r"][0])
+                for seq in seqs:
+                    rows.pop(seq, None)
+                if key in self.marks:
+                    self.marks[key] += n
+                rec = self._mark_record(key)
+                rec["a"] = [seqs[0], seqs[-1]]
+                self.f.write(json.dumps(rec) + "\n")
+            if self.f.tell() >= self.compact_bytes:
+                self._compact()
+            else:
+                self._maybe_sync()
+
+    def replay(self, add_by_key: Dict[str, Any]) -> int:
+        """
+        Re-send the rows recovered on open (callers may first narrow
+        self.recovered[key] to the rows their destination is missing):
+        add_by_key maps key -> add(row), which journals them again. All old
+        journal entries of those keys are then acknowledged. Keys with no
+        add function stay in the journal. Returns the number of rows
+        re-sent.
+        """
+        n = 0
+        for key, rows in self.recovered.items():
+            add = add_by_key.get(key)
+            if add is None:
+                continue
+            for row in rows:
+                add(row)
+            old = self.recovered_seqs[key]
+            with self.lock:
+                for first, last in _ranges(old):
+                    self.f.write(json.dumps({"k": key, "a": [first, last]}) + "\n")
+                for seq in old:
+                    self.pending[key].pop(seq, None)
+            n += len(rows)
+        self.recovered = {}
+        self.recovered_seqs = {}
+        return n
+
+    def close(self):
+        metrics.SPOOL_PENDING.untrack(self.gauge)
+        with self.lock:
+            if self.f is None:
+                return
+            self._compact()
+            self.f.close()
+            self.f = None
+        if os.path.getsize(self.path) == 0:
+            os.remove(self.path)
+
+
+def _ranges(seqs: List[int]) -> List[Tuple[int, int]]:
+    """
+    Sorted seqs as (first, last) runs of consecutive numbers.
+    """
+    runs: List[Tuple[int, int]] = []
+    for seq in seqs:
+        if runs and seq == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], seq)
+        else:
+            runs.append((seq, seq))
+    return runs
+
+
+def make_spool(config: Dict[str, Any], shard: Optional[int] = None) -> Optional[Spool]:
+    """
+    Spool per the YAML `spool` section (enabled unless `enabled: false`):
+    path (default <sqlite db_path>.spool, one per worker), fsync_seconds,
+    compact_bytes.
+    """
+    opts = config.get("spool") or {}
+    if not opts.get("enabled", True):
+        return None
+    path = opts.get("path") or config["sqlite"]["db_path"] + ".spool"
+    return Spool(shard_path(path, shard), opts.get("fsync_seconds", 1.0), opts.get("compact_bytes", 64 << 20))
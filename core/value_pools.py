@@ -0,0 +1,146 @@
+import json
+import os
+from typing import Dict, Any, Iterable, List, Optional
+
+import numpy as np
+
+# Settings shared by every pool, set from the YAML `value_pools` section
+POOL_SETTINGS = {
+    "size": 20_000,        # values generated per Faker pool
+    "cache_dir": None,     # keep generated pools here and reuse them across runs
+    "unique_phones": False,
+}
+
+
+def configure(settings: Optional[Dict[str, Any]] = None):
+    """
+    Apply the YAML `value_pools` section. Pools built after this use it.
+    """
+    POOL_SETTINGS.update(settings or {})
+
+
+class FakerPool:
+    """
+    A pool of values from one Faker method (e.g. "name"), loaded from the
+    cache dir or filled as it is drawn from: the first `size` draws are
+    Faker calls whose values join the pool, later draws sample the pool
+    uniformly, one index lookup instead of a Faker call. Filling as it goes
+    keeps the cost of a fresh pool off startup. Pool values are themselves
+    Faker draws, so the output distribution is the same up to the pool's
+    sampling of it.
+    """
+
+    def __init__(self, faker, method: str):
+        self.faker = faker
+        self.method = method
+        self.values: List[str] = []
+        self.size: Optional[int] = None
+        # set once the pool is complete
+        self.array: Optional[np.ndarray] = None
+        # seed of the Faker instance (--seed); seeded pools skip the cache
+        self.seed: Optional[int] = None
+
+    def reset(self, seed: Optional[int] = None):
+        """
+        Drop the pool so it is refilled from the Faker instance, re-seeded
+        with `seed`. A seeded pool neither reads nor writes the cache: how
+        it fills depends on the run's own draws, so a cached pool (even one
+        from the same seed) would change the output.
+        """
+        self.values = []
+        self.size = None
+        self.array = None
+        self.seed = seed
+
+    def _cache_path(self, size: int) -> Optional[str]:
+        cache_dir = POOL_SETTINGS["cache_dir"]
+        if not cache_dir or self.seed is not None:
+            return None
+        locale = "-".join(self.faker.locales)
+        return os.path.join(cache_dir, f"{locale}-{self.method}-{size}.json")
+
+    def _start(self):
+        self.size = int(POOL_SETTINGS["size"])
+        path = self._cache_path(self.size)
+        if path is not None and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.values = json.load(f)
+            self.array = np.array(self.values, dtype=str)
+
+    def _finish(self):
+        path = self._cache_path(self.size)
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.values, f)
+        self.array = np.array(self.values, dtype=str)
+
+    def build(self):
+        """
+        Complete the pool at once.
+        """
+        if self.size is None:
+            self._start()
+        if self.array is None:
+            gen = getattr(self.faker, self.method)
+            self.values.extend(gen() for _ in range(self.size - len(self.values)))
+            self._finish()
+
+    def draw(self, rand) -> str:
+        if self.array is None:
+            if self.size is None:
+                self._start()
+            if self.array is None:
+                value = getattr(self.faker, self.method)()
+                self.values.append(value)
+                if len(self.values) >= self.size:
+                    self._finish()
+                return value
+        return self.values[int(rand.random() * len(self.values))]
+
+    def draws(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        if self.array is None:
+            self.build()
+        return self.array[rng.integers(0, len(self.values), n)]
+
+
+class PhoneNumbers:
+    """
+    10-digit phone numbers, first digit 6-9, the other nine uniform: the
+    distribution of the old digit-by-digit loop, built from two integer
+    draws. With unique_phones, numbers already handed out (or marked used
+    via mark_used) are redrawn; that guarantee is per process.
+    """
+
+    def __init__(self):
+        self.used = set()
+
+    def mark_used(self, phones: Iterable[Any]):
+        self.used.update(str(p) for p in phones)
+
+    def draw(self, rand) -> str:
+        while True:
+            phone = f"{rand.randint(6, 9)}{rand.randrange(10**9):09d}"
+            if not POOL_SETTINGS["unique_phones"]:
+                return phone
+            if phone not in self.used:
+                self.used.add(phone)
+                return phone
+
+    def draws(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        phones = (rng.integers(6, 10, n) * 10**9 + rng.integers(0, 10**9, n)).astype(str)
+        if not POOL_SETTINGS["unique_phones"]:
+            return phones
+        # collisions are rare in 4e9 numbers: redraw only the clashing slots
+        while True:
+            taken = np.fromiter((p in self.used for p in phones.tolist()), dtype=bool, count=n)
+            _, first = np.unique(phones, return_index=True)
+            dup = np.ones(n, dtype=bool)
+            dup[first] = False
+            bad = taken | dup
+            if not bad.any():
+                break
+            k = int(bad.sum())
+            phones[bad] = (rng.integers(6, 10, k) * 10**9 + rng.integers(0, 10**9, k)).astype(str)
+        self.used.update(phones.tolist())
+        return phones
@@ -1,16 +1,26 @@
 import random
-import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import Dict, Any, Optional
 
 from faker import Faker
-import pandas as pd
+import numpy as np
+from core.batch_utils import (
+    format_ids,
+    id_array,
+    rand_dates,
+    pick_entities,
+)
+from core.clock import SimClock
+from core.rng import derive_streams
+from core.sampling import Sampling
+from core.entity_store import EntityStore
+from core.value_pools import FakerPool
 from core.db_utils import (
-    fetch_all,
-    insert_row,
-    insert_many,
+    BatchWriter,
+    IdAllocator,
+    lookup_one,
 )
-from core.sheets_append import SheetBuffer, init_sheet_from_csv_if_empty
+from core.seeding import seed_domain
 from models.education_models import  Student, Progress, ResourceUsage, Module
 
 GENDER = ["Male", "Female"]
@@ -23,167 +33,263 @@ COMPLETION_STATUS = ["In Progress", "Not Started", "Completed"]
 COURSE_NAME = ["English", "Maths", "Science", "Social Science", "Computer"]
 MODULE_TYPE = ["Quiz", "Video", "PDF", "Assignment"]
 
+# worksheet/sink key -> dataclass of the rows written there
+TABLES = {
+    "student": Student,
+    "module": Module,
+    "progress": Progress,
+    "resource": ResourceUsage,
+}
+
+# key -> (table, column, prefix) backing each ID sequence
+ID_SEQUENCES = {
+    "student": ("edu_students", "sid", "S"),
+    "module": ("edu_modules", "mid", "M"),
+    "record": ("edu_mem", "record_id", "R"),
+    "resource": ("edu_mem", "resource_id", "RU"),
+}
+
+# worksheet key -> (table, dataclass, {CSV header: column}) seeded from CSV
+SEED_TABLES = {
+    "student": ("edu_students", Student, {
+        "Student_ID": "sid",
+        "Name": "name",
+        "Age": "age",
+        "Gender": "gender",
+        "Course_Enrolled": "course",
+        "Enrollment_Date": "enroll_date",
+        "Learning_Style": "style",
+        "Prior_Grade": "grade",
+    }),
+    "module": ("edu_modules", Module, {
+        "Module_ID": "mid",
+        "Module_Name": "mname",
+        "Course_Name": "cname",
+        "Difficulty_Level": "diff",
+        "Module_Type": "mtype",
+    }),
+}
+# LEARNING_PROGRESS & RESOURCE_USAGE → just sheet, plus edu_mem pairing their IDs
+SEED_MAPPING = ("edu_mem", ("progress", "Record_ID", "record_id"), ("resource", "Resource_ID", "resource_id"))
+
+rand = random.Random()
 fake = Faker()
+np_rng = np.random.default_rng()
+# event times, advanced with draws from rand / np_rng
+clock = SimClock("education")
+male_names = FakerPool(fake, "first_name_male")
+female_names = FakerPool(fake, "first_name_female")
 PROB_NEW = 0.30
 
+sampling = Sampling()
+student_popularity = sampling.entities("student")
+module_popularity = sampling.entities("module")
+gender_choice = sampling.choice("gender", GENDER)
+course_enrolled_choice = sampling.choice("course_enrolled", COURSE_ENROLLED)
+learning_style_choice = sampling.choice("learning_style", LEARNING_STYLE)
+prior_grade_choice = sampling.choice("prior_grade", PRIOR_GRADE)
+course_name_choice = sampling.choice("course_name", COURSE_NAME)
+module_type_choice = sampling.choice("module_type", MODULE_TYPE)
+resource_type_choice = sampling.choice("resource_type", RESOURCE_TYPE)
+completion_status_choice = sampling.choice("completion_status", COMPLETION_STATUS)
+
 # ID POOLS
 student_ids = [f"S{str(i).zfill(4)}" for i in range(1, 5000)]
 record_ids  = [f"R{str(i).zfill(4)}" for i in range(1, 8000)]
 resource_ids = [f"RU{str(i).zfill(4)}" for i in range(1, 8000)]
 module_ids = [f"M{str(i).zfill(3)}" for i in range(1, 2000)]
 
+def seed_streams(seed: int, shard: int = None):
+    """
+    Reseed this module's random, Faker and NumPy streams from `seed`.
+    """
+    global np_rng
+    py_seed, faker_seed, np_rng = derive_streams(seed, "education", shard)
+    rand.seed(py_seed)
+    fake.seed_instance(faker_seed)
+    male_names.reset(faker_seed)
+    female_names.reset(faker_seed)
+
 def rand_date() -> str:
-    return (datetime(2023, 1, 1) + timedelta(days=random.randint(0, 600))).strftime("%Y-%m-%d")
+    return (datetime(2023, 1, 1) + timedelta(days=rand.randint(0, 600))).strftime("%Y-%m-%d")
 
 def init_from_csv_and_seed_db(config: Dict[str, Any],
                               ws_map: Dict[str, Any],
-                              conn):
+                              conn, upload: bool = True):
     """
-    Equivalent to your initialize_from_csv() for retail:
-    - Load CSVs into Sheets (if empty)
-    - Seed SQLite tables from CSV
+    Equivalent to your initialize_from_csv() for education:
+    - Stream each CSV into its sheet (if empty), chunk by chunk
+    - Seed SQLite tables from the same chunks (only these with upload=False)
     """
-    # STUDENT
-    dfst = init_sheet_from_csv_if_empty(ws_map["student"], config["csv_paths"]["student"])
-    if dfst is not None:
-        rows = []
-        for _, row in dfst.iterrows():
-            rows.append({
-                "sid": row["Student_ID"],
-                "name": row["Name"],
-                "age": row["Age"],
-                "gender": row["Gender"],
-                "course": row["Course_Enrolled"],
-                "enroll_date": row["Enrollment_Date"],
-                "style": row["Learning_Style"],
-                "grade": row["Prior_Grade"]
-            })
-        insert_many(conn, "edu_students", rows)
+    seed_domain(config, ws_map, conn, SEED_TABLES, SEED_MAPPING, upload)
 
-    # MODULE
-    dfm = init_sheet_from_csv_if_empty(ws_map["module"], config["csv_paths"]["module"])
-    if dfm is not None:
-        rows = []
-        for _, row in dfm.iterrows():
-            rows.append({
-                "mid": row["Module_ID"],
-                "mname": row["Module_Name"],
-                "cname": row["Course_Name"],
-                "diff": row["Difficulty_Level"],
-                "mtype": row["Module_Type"]
-            })
-        insert_many(conn, "edu_modules", rows)
+def load_edu_memory(conn) -> (EntityStore, EntityStore):
+    students = EntityStore.load(conn, "edu_students", Student, "sid")
+    modules = EntityStore.load(conn, "edu_modules", Module, "mid", text=("mname",))
+    return students, modules
 
-    # LEARNING_PROGRESS & RESOURCE_USAGE
-    dfp = init_sheet_from_csv_if_empty(ws_map["progress"], config["csv_paths"]["progress"])
-    dfr = init_sheet_from_csv_if_empty(ws_map["resource"], config["csv_paths"]["resource"])
-
-    mem_rows = []
-    if dfp is not None and dfr is not None:
-        for i in range(min(len(dfp), len(dfr))):
-            mem_rows.append({
-                "record_id": dfp.iloc[i]["Record_ID"],
-                "resource_id": dfr.iloc[i]["Resource_ID"]
-            })
-        insert_many(conn, "edu_mem", mem_rows)
-
-def load_edu_memory(conn) -> (List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]):
-    students = fetch_all(conn, "edu_students")
-    modules = fetch_all(conn, "edu_modules")
-    mem = fetch_all(conn, "edu_mem")
-    return students, modules, mem
-
-def get_or_create_student(students: List[Dict[str, Any]], conn) -> (Student, bool):
-    if random.random() < PROB_NEW or len(students) == 0:
-        next_num = (
-            max(int(s["sid"][1:]) for s in students)
-            + 1
-            if students else 1
-        )
+def resource_for_record(conn, record_id: str) -> Optional[str]:
+    """
+    Resource usage ID generated with a progress record (edu_mem lookup).
+    """
+    return lookup_one(conn, "edu_mem", "record_id", "resource_id", record_id)
+
+def init_edu_ids(db_path: str, block_size: int = 100, shard: int = 0,
+                 workers: int = 1, bases: Dict[str, int] = None) -> IdAllocator:
+    ids = IdAllocator(db_path, block_size, shard, workers, bases)
+    for key, (table, column, prefix) in ID_SEQUENCES.items():
+        ids.register(key, table, column, prefix)
+    return ids
+
+def get_or_create_student(students: EntityStore, db: BatchWriter, ids: IdAllocator) -> (Student, bool):
+    if rand.random() < PROB_NEW or len(students) == 0:
+        next_num = ids.next("student")
         stid = f"S{next_num:04d}"
-        gender = random.choice(GENDER)
+        gender = gender_choice.draw(rand)
 
         st = Student(
             sid=stid,
-            name= fake.first_name_male() if gender == "Male" else fake.first_name_female(),
-            age= random.randint(14,18),
+            name= male_names.draw(rand) if gender == "Male" else female_names.draw(rand),
+            age= rand.randint(14,18),
             gender=gender,
-            course=random.choice(COURSE_ENROLLED),
+            course=course_enrolled_choice.draw(rand),
             enroll_date=rand_date(),
-            style=random.choice(LEARNING_STYLE),
-            grade= random.choice(PRIOR_GRADE)
+            style=learning_style_choice.draw(rand),
+            grade= prior_grade_choice.draw(rand)
         )
         data = st.__dict__
-        insert_row(conn, "edu_students", data)
+        db.insert("edu_students", data)
         students.append(data)
         return st, True
     else:
-        st = random.choice(students)
-        return Student(**st), False
-
-def get_or_create_module(modules: List[Dict[str, Any]], conn) -> (Module, bool):
-    if random.random() < PROB_NEW or len(modules) == 0:
-        next_num = (
-            max(int(m["mid"][1:]) for m in modules)
-            + 1
-            if modules else 1
-        )
+        return student_popularity.pick(rand, students), False
+
+def get_or_create_module(modules: EntityStore, db: BatchWriter, ids: IdAllocator) -> (Module, bool):
+    if rand.random() < PROB_NEW or len(modules) == 0:
+        next_num = ids.next("module")
         mid = f"M{next_num:03d}"
         m = Module(
             mid= mid,
             mname= f"Module{next_num}",
-            cname= random.choice(COURSE_NAME),
-            diff= random.randint(1,10),
-            mtype=random.choice(MODULE_TYPE)
+            cname= course_name_choice.draw(rand),
+            diff= rand.randint(1,10),
+            mtype=module_type_choice.draw(rand)
         )
         data = m.__dict__
-        insert_row(conn, "edu_modules", data)
+        db.insert("edu_modules", data)
         modules.append(data)
         return m, True
     else:
-        m = random.choice(modules)
-        return Module(**m), False
+        return module_popularity.pick(rand, modules), False
 
-def generate_records(students, modules, edu_mem, conn):
-    student, new_s = get_or_create_student(students, conn)
-    module, new_m = get_or_create_module(modules, conn)
+def generate_records(students, modules, db: BatchWriter, ids: IdAllocator):
+    student, new_s = get_or_create_student(students, db, ids)
+    module, new_m = get_or_create_module(modules, db, ids)
 
-    next_num = (
-        max(int(rc["record_id"][1:]) for rc in edu_mem)
-        + 1
-        if edu_mem else 1
-    )
-    rcid = f"R{next_num:04d}"
-    next_num = (
-        max(int(rs["resource_id"][2:]) for rs in edu_mem)
-        + 1
-        if edu_mem else 1
-    )
-    rsid = f"RU{next_num:04d}"
+    rcid = f"R{ids.next('record'):04d}"
+    rsid = f"RU{ids.next('resource'):04d}"
 
     mem_row = {"record_id": rcid, "resource_id": rsid}
-    insert_row(conn, "edu_mem", mem_row)
-    edu_mem.append(mem_row)
+    db.insert("edu_mem", mem_row)
 
+    # one event: the progress record and the resource use share its time
+    stamp = clock.stamp(rand)
     progress = Progress(
         rid= rcid,
         sid= student.sid,
         mid= module.mid,
         mname= module.mname,
-        completion= random.randint(10,100),
-        time_spent= random.randint(60,400),
-        quiz= random.randint(1,100),
-        difficulty=random.randint(1,5),
-        date= rand_date()
+        completion= rand.randint(10,100),
+        time_spent= rand.randint(60,400),
+        quiz= rand.randint(1,100),
+        difficulty=rand.randint(1,5),
+        date= stamp
     )
 
     resource = ResourceUsage(
         rid= rsid,
         sid= student.sid,
-        rtype= random.choice(RESOURCE_TYPE),
-        spent= random.randint(5,300),
-        status= random.choice(COMPLETION_STATUS),
-        adate= rand_date()
+        rtype= resource_type_choice.draw(rand),
+        spent= rand.randint(5,300),
+        status= completion_status_choice.draw(rand),
+        adate= stamp
     )
     return student, module, progress, resource, new_s, new_m
 
+def generate_batch(n: int, students, modules, db: Optional[BatchWriter], ids: IdAllocator,
+                   rng: np.random.Generator = None,
+                   prob_new: float = PROB_NEW) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Vectorized generate_records for n progress/resource pairs. Returns
+    column-oriented batches keyed like the worksheet map: {"student",
+    "module", "progress", "resource"}. db=None skips the SQLite rows (new
+    students/modules, edu_mem) as in retail's generate_batch.
+    """
+    rng = rng if rng is not None else np_rng
+
+    # STUDENT
+    s_idx, s_new = pick_entities(rng, n, len(students), prob_new, student_popularity)
+    k = int(s_new.sum())
+    s_nums = id_array(ids.take("student", k))
+    gender = gender_choice.draws(rng, k)
+    new_students = {
+        "sid": format_ids("S", s_nums, 4),
+        "name": np.where(gender == "Male", male_names.draws(rng, k), female_names.draws(rng, k)),
+        "age": rng.integers(14, 19, k),
+        "gender": gender,
+        "course": course_enrolled_choice.draws(rng, k),
+        "enroll_date": rand_dates(rng, k),
+        "style": learning_style_choice.draws(rng, k),
+        "grade": prior_grade_choice.draws(rng, k),
+    }
+
+    # MODULE
+    m_idx, m_new = pick_entities(rng, n, len(modules), prob_new, module_popularity)
+    k = int(m_new.sum())
+    m_nums = id_array(ids.take("module", k))
+    new_modules = {
+        "mid": format_ids("M", m_nums, 3),
+        "mname": format_ids("Module", m_nums, 0),
+        "cname": course_name_choice.draws(rng, k),
+        "diff": rng.integers(1, 11, k),
+        "mtype": module_type_choice.draws(rng, k),
+    }
+
+    if db is not None:
+        db.insert_columns("edu_students", new_students)
+        db.insert_columns("edu_modules", new_modules)
+    # new entities land at the indexes pick_entities gave them
+    students.extend_columns({**new_students, "sid": s_nums}, id_format=("S", 4))
+    modules.extend_columns({**new_modules, "mid": m_nums}, id_format=("M", 3))
+
+    # LEARNING_PROGRESS & RESOURCE_USAGE
+    rc_ids = format_ids("R", id_array(ids.take("record", n)), 4)
+    rs_ids = format_ids("RU", id_array(ids.take("resource", n)), 4)
+    if db is not None:
+        db.insert_columns("edu_mem", {"record_id": rc_ids, "resource_id": rs_ids})
+
+    sid = students.take("sid", s_idx)
+    stamps = clock.stamps(rng, n)
+    progress = {
+        "rid": rc_ids,
+        "sid": sid,
+        "mid": modules.take("mid", m_idx),
+        "mname": modules.take("mname", m_idx),
+        "completion": rng.integers(10, 101, n),
+        "time_spent": rng.integers(60, 401, n),
+        "quiz": rng.integers(1, 101, n),
+        "difficulty": rng.integers(1, 6, n),
+        "date": stamps,
+    }
+
+    resource = {
+        "rid": rs_ids,
+        "sid": sid,
+        "rtype": resource_type_choice.draws(rng, n),
+        "spent": rng.integers(5, 301, n),
+        "status": completion_status_choice.draws(rng, n),
+        "adate": stamps,
+    }
+
+    return {"student": new_students, "module": new_modules,
+            "progress": progress, "resource": resource}
@@ -1,16 +1,26 @@
 import random
-import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import Dict, Any, Optional
 
 from faker import Faker
-import pandas as pd
+import numpy as np
+from core.batch_utils import (
+    format_ids,
+    id_array,
+    rand_dates,
+    pick_entities,
+)
+from core.clock import SimClock, format_time, format_times
+from core.rng import derive_streams
+from core.sampling import Sampling
+from core.entity_store import EntityStore
+from core.value_pools import FakerPool, PhoneNumbers
 from core.db_utils import (
-    fetch_all,
-    insert_row,
-    insert_many,
+    BatchWriter,
+    IdAllocator,
+    lookup_one,
 )
-from core.sheets_append import SheetBuffer, init_sheet_from_csv_if_empty
+from core.seeding import seed_domain
 from models.manufacturing_models import Equipment, Technician, Downtime, Maintenance
 
 # ---------------- CONSTANT DATA ---------------- #
@@ -30,158 +40,172 @@ REMARKS = ["Needs follow-up", "Operational", "Issue resolved"]
 
 LEVELS = ["Senior", "Assistant", "Junior"]
 
+# worksheet/sink key -> dataclass of the rows written there
+TABLES = {
+    "equipment": Equipment,
+    "technician": Technician,
+    "downtime": Downtime,
+    "maintenance": Maintenance,
+}
+
+# key -> (table, column, prefix) backing each ID sequence
+ID_SEQUENCES = {
+    "equipment": ("mfg_equipments", "eq_id", "EQT"),
+    "technician": ("mfg_technicians", "tid", "T"),
+    "downtime": ("mfg_mem", "downtime_id", "DT"),
+    "maintenance": ("mfg_mem", "maintenance_id", "MT"),
+}
+
+# worksheet key -> (table, dataclass, {CSV header: column}) seeded from CSV
+SEED_TABLES = {
+    "equipment": ("mfg_equipments", Equipment, {
+        "Equipment_ID": "eq_id",
+        "Equipment_Name": "name",
+        "Equipment_Type": "etype",
+        "Manufacturer": "manufacturer",
+        "Installation_Date": "install_date",
+        "Maintenance_Cycle_Days": "cycle_days",
+        "Location": "location",
+        "Capacity_per_Hour": "capacity",
+        "Criticality_Score": "criticality",
+    }),
+    "technician": ("mfg_technicians", Technician, {
+        "Technician_ID": "tid",
+        "Name": "name",
+        "Age": "age",
+        "Phone": "phone",
+        "Level": "level",
+    }),
+}
+# DOWNTIME & MAINTAINENCE → just sheet, plus mfg_mem pairing their IDs
+SEED_MAPPING = ("mfg_mem", ("downtime", "Downtime_ID", "downtime_id"),
+                ("maintenance", "Maintenance_ID", "maintenance_id"))
+
+rand = random.Random()
 fake = Faker()
+np_rng = np.random.default_rng()
+# event times, advanced with draws from rand / np_rng
+clock = SimClock("manufacturing")
+tech_names = FakerPool(fake, "name")
+phones = PhoneNumbers()
 PROB_NEW = 0.30
 
-def rand_date() -> datetime:
-    return (datetime(2023, 1, 1) + timedelta(days=random.randint(0,600)))
+sampling = Sampling()
+equipment_popularity = sampling.entities("equipment")
+technician_popularity = sampling.entities("technician")
+equipment_type_choice = sampling.choice("equipment_type", EQUIPMENT_TYPE)
+manufacturer_choice = sampling.choice("manufacturer", MANUFACTURERS)
+cycle_days_choice = sampling.choice("cycle_days", CYCLE_DAYS)
+location_choice = sampling.choice("location", LOCATIONS)
+level_choice = sampling.choice("level", LEVELS)
+root_cause_choice = sampling.choice("root_cause", ROOT_CAUSE)
+comments_choice = sampling.choice("comments", COMMENTS)
+maint_type_choice = sampling.choice("maint_type", MAINT_TYPE)
+parts_replaced_choice = sampling.choice("parts_replaced", PARTS_REPLACED)
+remarks_choice = sampling.choice("remarks", REMARKS)
 
-def rand_end_date(start_date) -> datetime:
-    return (start_date + timedelta(minutes=random.randint(20,800)))
+def seed_streams(seed: int, shard: int = None):
+    """
+    Reseed this module's random, Faker and NumPy streams from `seed`.
+    """
+    global np_rng
+    py_seed, faker_seed, np_rng = derive_streams(seed, "manufacturing", shard)
+    rand.seed(py_seed)
+    fake.seed_instance(faker_seed)
+    tech_names.reset(faker_seed)
+
+def rand_date() -> str:
+    return (datetime(2023, 1, 1) + timedelta(days=rand.randint(0,600))).strftime("%Y-%m-%d %H:%M:%S")
 
 def generate_random_phone_number():
     # Generate a 10-digit number with the first digit from 6-9
-    number = str(random.randint(6, 9))
-    for _ in range(9):
-        number += str(random.randint(0, 9))
-    return number
+    return phones.draw(rand)
 
 def init_from_csv_and_seed_db(config: Dict[str, Any],
                               ws_map: Dict[str, Any],
-                              conn):
+                              conn, upload: bool = True):
     """
-    Equivalent to your initialize_from_csv() for retail:
-    - Load CSVs into Sheets (if empty)
-    - Seed SQLite tables from CSV
+    Equivalent to your initialize_from_csv() for manufacturing:
+    - Stream each CSV into its sheet (if empty), chunk by chunk
+    - Seed SQLite tables from the same chunks (only these with upload=False)
     """
-    # EQUIPMENT
-    dfe = init_sheet_from_csv_if_empty(ws_map["equipment"], config["csv_paths"]["equipment"])
-    if dfe is not None:
-        rows = []
-        for _, row in dfe.iterrows():
-            rows.append({
-                "eq_id": row["Equipment_ID"],
-                "name": row["Equipment_Name"],
-                "etype": row["Equipment_Type"],
-                "manufacturer": row["Manufacturer"],
-                "install_date": row["Installation_Date"],
-                "cycle_days": row["Maintenance_Cycle_Days"],
-                "location": row["Location"],
-                "capacity": row["Capacity_per_Hour"],
-                "criticality": row["Criticality_Score"]
-            })
-        insert_many(conn, "mfg_equipments", rows)
+    seed_domain(config, ws_map, conn, SEED_TABLES, SEED_MAPPING, upload)
 
-    # TECHNICIAN
-    dft = init_sheet_from_csv_if_empty(ws_map["technician"], config["csv_paths"]["technician"])
-    if dft is not None:
-        rows = []
-        for _, row in dft.iterrows():
-            rows.append({
-                "tid": row["Technician_ID"],
-                "name": row["Name"],
-                "age": row["Age"],
-                "phone": row["Phone"],
-                "level": row["Level"]
-            })
-        insert_many(conn, "mfg_technicians", rows)
-
-    # DOWNTIME & MAINTAINENCE 
-    dfdown = init_sheet_from_csv_if_empty(ws_map["downtime"], config["csv_paths"]["downtime"])
-    dfmain = init_sheet_from_csv_if_empty(ws_map["maintenance"], config["csv_paths"]["maintenance"])
-
-    mem_rows = []
-    if dfdown is not None and dfmain is not None:
-        for i in range(min(len(dfdown), len(dfmain))):
-            mem_rows.append({
-                "downtime_id": dfdown.iloc[i]["Downtime_ID"],
-                "maintenance_id": dfmain.iloc[i]["Maintenance_ID"]
-            })
-        insert_many(conn, "mfg_mem", mem_rows)
-
-def load_mfg_memory(conn) -> (List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]):
-    equipments = fetch_all(conn, "mfg_equipments")
-    technicians = fetch_all(conn, "mfg_technicians")
-    mem = fetch_all(conn, "mfg_mem")
-    return equipments, technicians, mem
-
-def get_or_create_equipment(equipments: List[Dict[str, Any]], conn) -> (Equipment, bool):
-    if random.random() < PROB_NEW or len(equipments) == 0:
-        next_num = (
-            max(int(e["eq_id"][3:]) for e in equipments)
-            + 1
-            if equipments else 1
-        )
+def load_mfg_memory(conn) -> (EntityStore, EntityStore):
+    equipments = EntityStore.load(conn, "mfg_equipments", Equipment, "eq_id", text=("name",))
+    technicians = EntityStore.load(conn, "mfg_technicians", Technician, "tid", text=("phone",))
+    # only consulted with value_pools.unique_phones
+    phones.mark_used(technicians.texts["phone"])
+    return equipments, technicians
+
+def maintenance_for_downtime(conn, downtime_id: str) -> Optional[str]:
+    """
+    Maintenance ID logged with a downtime event (mfg_mem lookup).
+    """
+    return lookup_one(conn, "mfg_mem", "downtime_id", "maintenance_id", downtime_id)
+
+def init_mfg_ids(db_path: str, block_size: int = 100, shard: int = 0,
+                 workers: int = 1, bases: Dict[str, int] = None) -> IdAllocator:
+    ids = IdAllocator(db_path, block_size, shard, workers, bases)
+    for key, (table, column, prefix) in ID_SEQUENCES.items():
+        ids.register(key, table, column, prefix)
+    return ids
+
+def get_or_create_equipment(equipments: EntityStore, db: BatchWriter, ids: IdAllocator) -> (Equipment, bool):
+    if rand.random() < PROB_NEW or len(equipments) == 0:
+        next_num = ids.next("equipment")
         eid = f"EQT{next_num:03d}"
 
         e = Equipment(
             eq_id=eid,
             name=f"Machine_{next_num}",
-            etype=random.choice(EQUIPMENT_TYPE),
-            manufacturer=random.choice(MANUFACTURERS),
+            etype=equipment_type_choice.draw(rand),
+            manufacturer=manufacturer_choice.draw(rand),
             install_date=rand_date(),
-            cycle_days=random.choice(CYCLE_DAYS),
-            location=random.choice(LOCATIONS),
-            capacity=random.randint(80,500),
-            criticality=random.randint(1,10)
+            cycle_days=cycle_days_choice.draw(rand),
+            location=location_choice.draw(rand),
+            capacity=rand.randint(80,500),
+            criticality=rand.randint(1,10)
         )
         data = e.__dict__
-        insert_row(conn, "mfg_equipments", data)
+        db.insert("mfg_equipments", data)
         equipments.append(data)
         return e, True
     else:
-        e = random.choice(equipments)
-        return Equipment(**e), False
-
-def get_or_create_tech(tech: List[Dict[str, Any]], conn) -> (Technician, bool):
-    if random.random() < PROB_NEW or len(tech) == 0:
-        next_num = (
-            max(int(t["tid"][1:]) for t in tech)
-            + 1
-            if tech else 1
-        )
+        return equipment_popularity.pick(rand, equipments), False
+
+def get_or_create_tech(tech: EntityStore, db: BatchWriter, ids: IdAllocator) -> (Technician, bool):
+    if rand.random() < PROB_NEW or len(tech) == 0:
+        next_num = ids.next("technician")
         tid = f"T{next_num:03d}"
         t = Technician(
             tid=tid,
-            name=fake.name(),
-            age=random.randint(20,60),
+            name=tech_names.draw(rand),
+            age=rand.randint(20,60),
             phone=generate_random_phone_number(),
-            level=random.choice(LEVELS)
+            level=level_choice.draw(rand)
         )
         data = t.__dict__
-        insert_row(conn, "mfg_technicians", data)
+        db.insert("mfg_technicians", data)
         tech.append(data)
         return t, True
     else:
-        t = random.choice(tech)
-        return Technician(**t), False
+        return technician_popularity.pick(rand, tech), False
 
-def generate_records(equipments, tech, mfg_mem, conn):
-    equip, new_e = get_or_create_equipment(equipments, conn)
-    techs, new_t = get_or_create_tech(tech, conn)
+def generate_records(equipments, tech, db: BatchWriter, ids: IdAllocator):
+    equip, new_e = get_or_create_equipment(equipments, db, ids)
+    techs, new_t = get_or_create_tech(tech, db, ids)
 
-    next_num = (
-        max(int(d["downtime_id"][2:]) for d in mfg_mem)
-        + 1
-        if mfg_mem else 1
-    )
-    dtid = f"DT{next_num:03d}"
-    next_num = (
-        max(int(m["maintenance_id"][2:]) for m in mfg_mem)
-        + 1
-        if mfg_mem else 1
-    )
-    mid = f"MT{next_num:03d}"
+    dtid = f"DT{ids.next('downtime'):03d}"
+    mid = f"MT{ids.next('maintenance'):03d}"
 
     mem_row = {"downtime_id": dtid, "maintenance_id": mid} 
-    insert_row(conn, "mfg_mem", mem_row)
-    mfg_mem.append(mem_row)
+    db.insert("mfg_mem", mem_row)
 
-    start= rand_date()
-    end = rand_end_date(start)
-    dur = int((end - start).total_seconds() / 60)
-    start_str = start.strftime("%Y-%m-%d")
-    end_str = end.strftime("%Y-%m-%d")
+    start = clock.tick(rand)
+    dur = rand.randint(20, 800)
+    start_str = format_time(start)
+    end_str = format_time(start + dur * 60)
 
     downtime = Downtime(
         dt_id=dtid,
@@ -189,22 +213,105 @@ def generate_records(equipments, tech, mfg_mem, conn):
         start=start_str,
         end=end_str,
         duration=dur,
-        root=random.choice(ROOT_CAUSE),
+        root=root_cause_choice.draw(rand),
         tech=techs.tid,
-        comments=random.choice(COMMENTS)
+        comments=comments_choice.draw(rand)
     )
 
     main = Maintenance(
         mt_id=mid,
         eq_id=equip.eq_id,
-        date=rand_date(),
-        mtype=random.choice(MAINT_TYPE),
-        parts=random.choice(PARTS_REPLACED),
+        date=start_str,
+        mtype=maint_type_choice.draw(rand),
+        parts=parts_replaced_choice.draw(rand),
         tech= techs.tid,
-        cost=round(random.uniform(300.0, 5000.0), 2),
-        mttr=random.randint(60,400),
-        remarks=random.choice(REMARKS)
+        cost=round(rand.uniform(300.0, 5000.0), 2),
+        mttr=rand.randint(60,400),
+        remarks=remarks_choice.draw(rand)
     )
 
     return equip, techs, downtime, main, new_e, new_t
 
+def generate_batch(n: int, equipments, tech, db: Optional[BatchWriter], ids: IdAllocator,
+                   rng: np.random.Generator = None,
+                   prob_new: float = PROB_NEW) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Vectorized generate_records for n downtime/maintenance pairs. Returns
+    column-oriented batches keyed like the worksheet map: {"equipment",
+    "technician", "downtime", "maintenance"}. install_date is rendered like
+    the scalar path's, "%Y-%m-%d 00:00:00". db=None skips the SQLite rows
+    (new equipment/technicians, mfg_mem) as in retail's generate_batch.
+    """
+    rng = rng if rng is not None else np_rng
+
+    # EQUIPMENT
+    e_idx, e_new = pick_entities(rng, n, len(equipments), prob_new, equipment_popularity)
+    k = int(e_new.sum())
+    e_nums = id_array(ids.take("equipment", k))
+    new_equipments = {
+        "eq_id": format_ids("EQT", e_nums, 3),
+        "name": format_ids("Machine_", e_nums, 0),
+        "etype": equipment_type_choice.draws(rng, k),
+        "manufacturer": manufacturer_choice.draws(rng, k),
+        "install_date": np.char.add(rand_dates(rng, k), " 00:00:00"),
+        "cycle_days": cycle_days_choice.draws(rng, k),
+        "location": location_choice.draws(rng, k),
+        "capacity": rng.integers(80, 501, k),
+        "criticality": rng.integers(1, 11, k),
+    }
+
+    # TECHNICIAN
+    t_idx, t_new = pick_entities(rng, n, len(tech), prob_new, technician_popularity)
+    k = int(t_new.sum())
+    t_nums = id_array(ids.take("technician", k))
+    new_techs = {
+        "tid": format_ids("T", t_nums, 3),
+        "name": tech_names.draws(rng, k),
+        "age": rng.integers(20, 61, k),
+        "phone": phones.draws(rng, k),
+        "level": level_choice.draws(rng, k),
+    }
+
+    if db is not None:
+        db.insert_columns("mfg_equipments", new_equipments)
+        db.insert_columns("mfg_technicians", new_techs)
+    # new entities land at the indexes pick_entities gave them
+    equipments.extend_columns({**new_equipments, "eq_id": e_nums}, id_format=("EQT", 3))
+    tech.extend_columns({**new_techs, "tid": t_nums}, id_format=("T", 3))
+
+    # DOWNTIME & MAINTENANCE
+    dt_ids = format_ids("DT", id_array(ids.take("downtime", n)), 3)
+    mt_ids = format_ids("MT", id_array(ids.take("maintenance", n)), 3)
+    if db is not None:
+        db.insert_columns("mfg_mem", {"downtime_id": dt_ids, "maintenance_id": mt_ids})
+
+    eq_id = equipments.take("eq_id", e_idx)
+    tid = tech.take("tid", t_idx)
+
+    start = clock.ticks(rng, n)
+    minutes = rng.integers(20, 801, n)
+    downtime = {
+        "dt_id": dt_ids,
+        "eq_id": eq_id,
+        "start": format_times(start),
+        "end": format_times(start + minutes * 60),
+        "duration": minutes,
+        "root": root_cause_choice.draws(rng, n),
+        "tech": tid,
+        "comments": comments_choice.draws(rng, n),
+    }
+
+    maintenance = {
+        "mt_id": mt_ids,
+        "eq_id": eq_id,
+        "date": format_times(start),
+        "mtype": maint_type_choice.draws(rng, n),
+        "parts": parts_replaced_choice.draws(rng, n),
+        "tech": tid,
+        "cost": np.round(rng.uniform(300.0, 5000.0, n), 2),
+        "mttr": rng.integers(60, 401, n),
+        "remarks": remarks_choice.draws(rng, n),
+    }
+
+    return {"equipment": new_equipments, "technician": new_techs,
+            "downtime": downtime, "maintenance": maintenance}
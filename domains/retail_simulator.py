@@ -1,17 +1,26 @@
 import random
-import time
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import Dict, Any, Optional
 
 from faker import Faker
-import pandas as pd
+import numpy as np
 
+from core.batch_utils import (
+    format_ids,
+    id_array,
+    pick_entities,
+)
+from core.clock import SimClock
+from core.inventory import InventoryLedger
+from core.rng import derive_streams
+from core.sampling import Sampling
+from core.entity_store import EntityStore
+from core.value_pools import FakerPool
 from core.db_utils import (
-    fetch_all,
-    insert_row,
-    insert_many,
+    BatchWriter,
+    IdAllocator,
+    lookup_one,
 )
-from core.sheets_append import SheetBuffer, init_sheet_from_csv_if_empty
+from core.seeding import seed_domain
 from models.retail_models import Product, Store, Sale, Inventory
 
 
@@ -36,151 +45,168 @@ LOCATION = [
     "Visakhapatnam", "Nagpur", "Gurugram", "Noida", "Mysore", "Coimbatore", "Thiruvananthapuram"
 ]
 
+# worksheet/sink key -> dataclass of the rows written there
+TABLES = {
+    "product": Product,
+    "store": Store,
+    "sales": Sale,
+    "inventory": Inventory,
+}
+
+# key -> (table, column, prefix) backing each ID sequence
+ID_SEQUENCES = {
+    "product": ("retail_products", "pid", "P"),
+    "store": ("retail_stores", "sid", "STR"),
+    "sale": ("retail_mem", "sale_id", "S"),
+    "inventory": ("retail_mem", "inv_id", "I"),
+}
+
+# worksheet key -> (table, dataclass, {CSV header: column}) seeded from CSV
+SEED_TABLES = {
+    "product": ("retail_products", Product, {
+        "Product_ID": "pid",
+        "Product_Name": "name",
+        "Category": "category",
+        "Sub_Category": "subcat",
+        "Brand": "brand",
+        "Cost_Price": "cost",
+        "Selling_Price": "selling",
+        "Shelf_Life_Days": "shelf_life",
+    }),
+    "store": ("retail_stores", Store, {
+        "Store_ID": "sid",
+        "Store_Name": "name",
+        "Location": "location",
+        "Manager_Name": "manager",
+        "Store_Type": "stype",
+    }),
+}
+# SALES & INVENTORY → just sheet, plus retail_mem pairing their IDs
+SEED_MAPPING = ("retail_mem", ("sales", "Sale_ID", "sale_id"), ("inventory", "Inventory_ID", "inv_id"))
+
+rand = random.Random()
 fake = Faker()
+np_rng = np.random.default_rng()
+# event times, advanced with draws from rand / np_rng
+clock = SimClock("retail")
+# stock per (product, store), carried from each sale to the next
+ledger = InventoryLedger()
+manager_names = FakerPool(fake, "name")
 PROB_NEW = 0.30
 
+sampling = Sampling()
+product_popularity = sampling.entities("product")
+store_popularity = sampling.entities("store")
+category_choice = sampling.choice("category", CATEGORY)
+brand_choice = sampling.choice("brand", BRAND)
+store_name_choice = sampling.choice("store_name", STORE_NAME)
+location_choice = sampling.choice("location", LOCATION)
+store_type_choice = sampling.choice("store_type", STORE_TYPE)
 
-def rand_date() -> str:
-    return (datetime(2023, 1, 1) + timedelta(days=random.randint(0, 600))).strftime("%Y-%m-%d")
+
+def seed_streams(seed: int, shard: int = None):
+    """
+    Reseed this module's random, Faker and NumPy streams from `seed`.
+    """
+    global np_rng
+    py_seed, faker_seed, np_rng = derive_streams(seed, "retail", shard)
+    rand.seed(py_seed)
+    fake.seed_instance(faker_seed)
+    manager_names.reset(faker_seed)
 
 
 def init_from_csv_and_seed_db(config: Dict[str, Any],
                               ws_map: Dict[str, Any],
-                              conn):
+                              conn, upload: bool = True):
     """
     Equivalent to your initialize_from_csv() for retail:
-    - Load CSVs into Sheets (if empty)
-    - Seed SQLite tables from CSV
+    - Stream each CSV into its sheet (if empty), chunk by chunk
+    - Seed SQLite tables from the same chunks (only these with upload=False)
     """
-    # PRODUCT
-    dfp = init_sheet_from_csv_if_empty(ws_map["product"], config["csv_paths"]["product"])
-    if dfp is not None:
-        rows = []
-        for _, row in dfp.iterrows():
-            rows.append({
-                "pid": row["Product_ID"],
-                "name": row["Product_Name"],
-                "category": row["Category"],
-                "subcat": row["Sub_Category"],
-                "brand": row["Brand"],
-                "cost": float(row["Cost_Price"]),
-                "selling": float(row["Selling_Price"]),
-                "shelf_life": int(row["Shelf_Life_Days"])
-            })
-        insert_many(conn, "retail_products", rows)
-
-    # STORE
-    dfs = init_sheet_from_csv_if_empty(ws_map["store"], config["csv_paths"]["store"])
-    if dfs is not None:
-        rows = []
-        for _, row in dfs.iterrows():
-            rows.append({
-                "sid": row["Store_ID"],
-                "name": row["Store_Name"],
-                "location": row["Location"],
-                "manager": row["Manager_Name"],
-                "stype": row["Store_Type"]
-            })
-        insert_many(conn, "retail_stores", rows)
-
-    # SALES & INVENTORY → just sheet, plus retail_mem
-    dfsales = init_sheet_from_csv_if_empty(ws_map["sales"], config["csv_paths"]["sales"])
-    dfinv = init_sheet_from_csv_if_empty(ws_map["inventory"], config["csv_paths"]["inventory"])
-
-    mem_rows = []
-    if dfsales is not None and dfinv is not None:
-        for i in range(min(len(dfsales), len(dfinv))):
-            mem_rows.append({
-                "sale_id": dfsales.iloc[i]["Sale_ID"],
-                "inv_id": dfinv.iloc[i]["Inventory_ID"]
-            })
-        insert_many(conn, "retail_mem", mem_rows)
-
-
-def load_retail_memory(conn) -> (List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]):
-    products = fetch_all(conn, "retail_products")
-    stores = fetch_all(conn, "retail_stores")
-    mem = fetch_all(conn, "retail_mem")
-    return products, stores, mem
-
-
-def get_or_create_product(products: List[Dict[str, Any]], conn) -> (Product, bool):
-    if random.random() < PROB_NEW or len(products) == 0:
-        next_num = (
-            max(int(p["pid"][1:]) for p in products)
-            + 1
-            if products else 1
-        )
+    seed_domain(config, ws_map, conn, SEED_TABLES, SEED_MAPPING, upload)
+
+def load_retail_memory(conn) -> (EntityStore, EntityStore):
+    products = EntityStore.load(conn, "retail_products", Product, "pid", text=("name",))
+    stores = EntityStore.load(conn, "retail_stores", Store, "sid")
+    return products, stores
+
+
+def inventory_for_sale(conn, sale_id: str) -> Optional[str]:
+    """
+    Inventory ID generated together with `sale_id`, read back from the
+    retail_mem mapping (generate_records only ever appends to it).
+    """
+    return lookup_one(conn, "retail_mem", "sale_id", "inv_id", sale_id)
+
+
+def init_retail_ids(db_path: str, block_size: int = 100, shard: int = 0,
+                    workers: int = 1, bases: Dict[str, int] = None) -> IdAllocator:
+    ids = IdAllocator(db_path, block_size, shard, workers, bases)
+    for key, (table, column, prefix) in ID_SEQUENCES.items():
+        ids.register(key, table, column, prefix)
+    return ids
+
+
+def get_or_create_product(products: EntityStore, db: BatchWriter, ids: IdAllocator) -> (Product, bool):
+    if rand.random() < PROB_NEW or len(products) == 0:
+        next_num = ids.next("product")
         pid = f"P{next_num:04d}"
-        cat = random.choice(CATEGORY)
-        sub = random.choice(SUB_CATEGORY[cat])
+        cat = category_choice.draw(rand)
+        sub = rand.choice(SUB_CATEGORY[cat])
 
         p = Product(
             pid=pid,
             name=f"{sub}_{next_num}",
             category=cat,
             subcat=sub,
-            brand=random.choice(BRAND),
-            cost=round(random.uniform(20.0, 200.0), 2),
-            selling=round(random.uniform(200.0, 800.0), 2),
-            shelf_life=random.randint(60, 365)
+            brand=brand_choice.draw(rand),
+            cost=round(rand.uniform(20.0, 200.0), 2),
+            selling=round(rand.uniform(200.0, 800.0), 2),
+            shelf_life=rand.randint(60, 365)
         )
         data = p.__dict__
-        insert_row(conn, "retail_products", data)
+        db.insert("retail_products", data)
         products.append(data)
         return p, True
     else:
-        d = random.choice(products)
-        return Product(**d), False
+        return product_popularity.pick(rand, products), False
 
 
-def get_or_create_store(stores: List[Dict[str, Any]], conn) -> (Store, bool):
-    if random.random() < PROB_NEW or len(stores) == 0:
-        next_num = (
-            max(int(s["sid"][3:]) for s in stores)
-            + 1
-            if stores else 1
-        )
+def get_or_create_store(stores: EntityStore, db: BatchWriter, ids: IdAllocator) -> (Store, bool):
+    if rand.random() < PROB_NEW or len(stores) == 0:
+        next_num = ids.next("store")
         sid = f"STR{next_num:03d}"
         s = Store(
             sid=sid,
-            name=random.choice(STORE_NAME),
-            location=random.choice(LOCATION),
-            manager=fake.name(),
-            stype=random.choice(STORE_TYPE)
+            name=store_name_choice.draw(rand),
+            location=location_choice.draw(rand),
+            manager=manager_names.draw(rand),
+            stype=store_type_choice.draw(rand)
         )
         data = s.__dict__
-        insert_row(conn, "retail_stores", data)
+        db.insert("retail_stores", data)
         stores.append(data)
         return s, True
     else:
-        d = random.choice(stores)
-        return Store(**d), False
+        return store_popularity.pick(rand, stores), False
 
 
-def generate_records(products, stores, retail_mem, conn):
-    product, new_p = get_or_create_product(products, conn)
-    store, new_s = get_or_create_store(stores, conn)
+def generate_records(products, stores, db: BatchWriter, ids: IdAllocator):
+    product, new_p = get_or_create_product(products, db, ids)
+    store, new_s = get_or_create_store(stores, db, ids)
 
-    next_num = (
-        max(int(sl["sale_id"][1:]) for sl in retail_mem)
-        + 1
-        if retail_mem else 1
-    )
-    saleid = f"S{next_num:04d}"
-    next_num = (
-        max(int(i["sale_id"][1:]) for i in retail_mem)
-        + 1
-        if retail_mem else 1
-    )
-    invid = f"I{next_num:04d}"
+    saleid = f"S{ids.next('sale'):04d}"
+    invid = f"I{ids.next('inventory'):04d}"
 
     mem_row = {"sale_id": saleid, "inv_id": invid}
-    insert_row(conn, "retail_mem", mem_row)
-    retail_mem.append(mem_row)
+    db.insert("retail_mem", mem_row)
 
-    units = random.randint(1, 20)
-    discount = round(random.uniform(0.10, 0.50), 2)
+    date = clock.stamp(rand)
+    # a stockout sells only what the store has; new entities were appended last
+    p_index = len(products) - 1 if new_p else product.index
+    s_index = len(stores) - 1 if new_s else store.index
+    opening, received, units, closing = ledger.move(rand, p_index, s_index, rand.randint(1, 20))
+    discount = round(rand.uniform(0.10, 0.50), 2)
     final_price = round(product.selling - discount, 2)
     revenue = round(units * final_price, 2)
 
@@ -188,25 +214,114 @@ def generate_records(products, stores, retail_mem, conn):
         sale_id=saleid,
         pid=product.pid,
         sid=store.sid,
-        date=rand_date(),
+        date=date,
         units=units,
         discount=discount,
         final_price=final_price,
         revenue=revenue
     )
 
-    opening = random.randint(50, 200)
-    received = random.randint(10, 50)
-    sold = units
-    closing = opening + received - sold
-
     inv = Inventory(
         inv_id=invid,
         pid=product.pid,
         opening=opening,
         receieved=received,
-        sold=sold,
+        sold=units,
         closing=closing
     )
 
     return product, store, sale, inv, new_p, new_s
+
+
+def generate_batch(n: int, products, stores, db: Optional[BatchWriter], ids: IdAllocator,
+                   rng: np.random.Generator = None,
+                   prob_new: float = PROB_NEW) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Vectorized generate_records for n sales. Returns column-oriented batches
+    keyed like the worksheet map: {"product", "store", "sales", "inventory"},
+    each a dict of field name -> NumPy array in dataclass field order.
+    New products/stores and the retail_mem rows are queued on `db` and
+    appended to `products`/`stores`, same as the scalar path. With db=None
+    nothing is written to SQLite: the stores and `ids` still advance, so
+    a caller that persists the returned columns itself (or not at all)
+    skips the executemany that otherwise takes about half the batch time.
+    """
+    rng = rng if rng is not None else np_rng
+
+    # PRODUCTS
+    p_idx, p_new = pick_entities(rng, n, len(products), prob_new, product_popularity)
+    k = int(p_new.sum())
+    p_nums = id_array(ids.take("product", k))
+    cat_idx = category_choice.indexes(rng, k)
+    sub_lens = np.array([len(SUB_CATEGORY[c]) for c in CATEGORY])
+    width = sub_lens.max()
+    sub_table = np.array([SUB_CATEGORY[c] + [""] * (width - len(SUB_CATEGORY[c])) for c in CATEGORY])
+    name_table = np.array([[s + "_" for s in row] for row in sub_table.tolist()])
+    sub_idx = (rng.random(k) * sub_lens[cat_idx]).astype(np.int64)
+    sub = sub_table[cat_idx, sub_idx]
+    new_products = {
+        "pid": format_ids("P", p_nums, 4),
+        "name": format_ids(name_table[cat_idx, sub_idx], p_nums, 0),
+        "category": np.asarray(CATEGORY)[cat_idx],
+        "subcat": sub,
+        "brand": brand_choice.draws(rng, k),
+        "cost": np.round(rng.uniform(20.0, 200.0, k), 2),
+        "selling": np.round(rng.uniform(200.0, 800.0, k), 2),
+        "shelf_life": rng.integers(60, 366, k),
+    }
+
+    # STORES
+    s_idx, s_new = pick_entities(rng, n, len(stores), prob_new, store_popularity)
+    k = int(s_new.sum())
+    s_nums = id_array(ids.take("store", k))
+    new_stores = {
+        "sid": format_ids("STR", s_nums, 3),
+        "name": store_name_choice.draws(rng, k),
+        "location": location_choice.draws(rng, k),
+        "manager": manager_names.draws(rng, k),
+        "stype": store_type_choice.draws(rng, k),
+    }
+
+    if db is not None:
+        db.insert_columns("retail_products", new_products)
+        db.insert_columns("retail_stores", new_stores)
+    # new entities land at the indexes pick_entities gave them
+    products.extend_columns({**new_products, "pid": p_nums}, id_format=("P", 4))
+    stores.extend_columns({**new_stores, "sid": s_nums}, id_format=("STR", 3))
+
+    # SALES & INVENTORY
+    sale_ids = format_ids("S", id_array(ids.take("sale", n)), 4)
+    inv_ids = format_ids("I", id_array(ids.take("inventory", n)), 4)
+    if db is not None:
+        db.insert_columns("retail_mem", {"sale_id": sale_ids, "inv_id": inv_ids})
+
+    pid = products.take("pid", p_idx)
+    sid = stores.take("sid", s_idx)
+    date = clock.stamps(rng, n)
+    stock = ledger.moves(rng, p_idx, s_idx, rng.integers(1, 21, n))
+    units = stock["sold"]
+    discount = np.round(rng.uniform(0.10, 0.50, n), 2)
+    final_price = np.round(products.take("selling", p_idx) - discount, 2)
+    revenue = np.round(units * final_price, 2)
+
+    sales = {
+        "sale_id": sale_ids,
+        "pid": pid,
+        "sid": sid,
+        "date": date,
+        "units": units,
+        "discount": discount,
+        "final_price": final_price,
+        "revenue": revenue,
+    }
+
+    inventory = {
+        "inv_id": inv_ids,
+        "pid": pid,
+        "opening": stock["opening"],
+        "receieved": stock["received"],
+        "sold": units,
+        "closing": stock["closing"],
+    }
+
+    return {"product": new_products, "store": new_stores, "sales": sales, "inventory": inventory}
@@ -1,14 +1,28 @@
 import argparse
+import asyncio
+import functools
+import importlib
+import os
+import signal
 import time
 import yaml
 
 from core.db_utils import (
+    BatchWriter,
+    IdAllocator,
     get_connection,
     init_retail_schema,
     init_mfg_schema,
     init_edu_schema,
+    table_is_empty,
 )
-from core.sheets_append import get_sheets_client, load_worksheets, SheetBuffer
+from core.inventory import INVENTORY_SETTINGS
+from core.pacing import POLL_SECONDS, RateLimiter, ProgressReporter, poll_buffers, sleep_polling
+from core.resume import resume_files
+from core.sharding import SharedPool, SharedPools, run_sharded
+from core.sheets_append import WriterDrain, get_sheets_client, load_worksheets, make_sheet_writer
+from core.sinks import FakeSpreadsheet, build_sinks, merge_shard_outputs, sink_type
+from core import metrics, profiling, value_pools
 
 
 def load_config(path: str):
@@ -16,146 +30,351 @@ def load_config(path: str):
         return yaml.safe_load(f)
 
 
-def run_retail(config):
-    from domains import retail_simulator as sim
-
-    conn = get_connection(config["sqlite"]["db_path"])
-    init_retail_schema(conn)
-
-    client, spread = get_sheets_client(config["service_json"], config["sheet_url"])
-    ws_map = load_worksheets(spread, config["worksheets"])
+def open_spreadsheet(config, sim, conn, seed: bool = True):
+    """
+    Open the spreadsheet (an in-memory FakeSpreadsheet unless sink.type is
+    sheets) and, if `seed`, seed the sheets and SQLite from CSV if needed.
+    Without a real spreadsheet to inspect, seeding happens when the
+    domain's tables in SQLite are still empty.
+    """
+    if sink_type(config) == "sheets":
+        client, spread = get_sheets_client(config["service_json"], config["sheet_url"])
+    else:
+        spread = FakeSpreadsheet()
+        seed = seed and all(table_is_empty(conn, t) for t, _, _ in sim.ID_SEQUENCES.values())
+    ws_map = load_worksheets(spread, config.get("worksheets") or {k: k for k in sim.TABLES})
 
     # Initialize from CSV if sheets empty & seed DB
-    sim.init_from_csv_and_seed_db(config, ws_map, conn)
-
-    # Load in-memory state
-    products, stores, retail_mem = sim.load_retail_memory(conn)
-
-    buf_prod = SheetBuffer(ws_map["product"], config["buffer_size"])
-    buf_store = SheetBuffer(ws_map["store"], config["buffer_size"])
-    buf_sales = SheetBuffer(ws_map["sales"], config["buffer_size"])
-    buf_inv = SheetBuffer(ws_map["inventory"], config["buffer_size"])
-
-    print("Retail simulation started... Ctrl+C to stop.")
+    if seed:
+        # only a real spreadsheet keeps the seed rows
+        sim.init_from_csv_and_seed_db(config, ws_map, conn, upload=sink_type(config) == "sheets")
+    return spread, ws_map
+
+
+def open_outputs(config, sim, conn, shard=None, writer=None):
+    """
+    Spreadsheet + sinks for one run. Sharded workers skip seeding, the
+    parent process has done it before starting them. A single process
+    continues CSV/NDJSON files from their last row (core/resume.py); shard
+    files only get their torn last line cut off.
+    """
+    spread, ws_map = open_spreadsheet(config, sim, conn, seed=shard is None)
+    sinks, flushers = build_sinks(config, sim.TABLES, spread, ws_map, shard, writer)
+    if shard is None and sink_type(config) in ("csv", "ndjson"):
+        n = resume_files(conn, sim, sinks)
+        if n:
+            print(f"Re-emitted {n} rows missing from the {sink_type(config)} files after a crash")
+    return sinks, flushers
+
+
+def prepare_worker(sim, config, args, conn, shard=None):
+    """
+    Apply the value pool settings, start metrics and --profile, reseed the
+    domain's random streams for --seed, apply its `sampling` weights, set
+    up its event clock (continuing from the time saved in `conn`) and
+    return the IdAllocator stride settings of a sharded worker
+    (see run_workers).
+    """
+    value_pools.configure(config.get("value_pools"))
+    metrics.start(config.get("metrics"), shard)
+    if args.profile is not None:
+        profiling.install(sim)
+        if args.profile:
+            profiling.capture(args.profile, shard)
+    if args.seed is not None:
+        sim.seed_streams(args.seed, shard)
+    sim.sampling.configure(config.get("sampling"))
+    sim.clock.configure(config.get("clock"), 1 if shard is None else args.workers)
+    sim.clock.open(conn)
+    if shard is None:
+        return {}
+    return {"shard": shard, "workers": args.workers, "bases": args.id_bases}
+
+
+class RecordLoop:
+    """
+    What run_loop and run_loop_async share: the rate limiter, the --count /
+    --duration stop, timing, counting and (with --verbose) printing each
+    `step` call, and the progress and --profile reports at the end.
+    """
+
+    def __init__(self, name: str, step, args, rate: float):
+        self.name = name
+        self.args = args
+        self.limiter = RateLimiter(rate)
+        self.progress = ProgressReporter(name, args.progress_every)
+        self.generate = metrics.GENERATE_SECONDS.labels(name)
+        self.step = profiling.PROFILER.record(name, step) if args.profile is not None else step
+        self.deadline = time.monotonic() + args.duration if args.duration else None
+        self.done = 0
+
+    def more(self) -> bool:
+        if self.args.count is not None and self.done >= self.args.count:
+            return False
+        return self.deadline is None or time.monotonic() < self.deadline
+
+    def record(self):
+        start = time.perf_counter()
+        line = self.step()
+        self.generate.observe(time.perf_counter() - start)
+        self.done += 1
+        self.progress.tick()
+        if self.args.verbose:
+            print(line)
+
+    def finish(self):
+        self.progress.done()
+        if self.args.profile is not None:
+            print(profiling.PROFILER.report(self.name))
+
+
+def run_loop(name: str, step, buffers, args):
+    """
+    Drive `step` (one record per call, returns a log line) until --count or
+    --duration is reached or Ctrl+C, paced by --rate; while it waits for the
+    next record the buffers' time-based flushes are polled (sleep_polling),
+    so flush_latency holds at low rates too. Buffers (the SQLite
+    BatchWriter, the sinks, then the background SheetWriter so it drains
+    what the others just handed it) are always closed on the way out;
+    SIGTERM takes the same path as Ctrl+C.
+    """
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    loop = RecordLoop(name, step, args, args.rate)
     try:
-        while True:
-            p, s, sale, inv, new_p, new_s = sim.generate_records(
-                products, stores, retail_mem, conn
-            )
-
-            if new_p:
-                buf_prod.add(list(p.__dict__.values()))
-            if new_s:
-                buf_store.add(list(s.__dict__.values()))
-            buf_sales.add(list(sale.__dict__.values()))
-            buf_inv.add(list(inv.__dict__.values()))
-
-            print(f"Added sale {sale.sale_id} for product {p.pid} at store {s.sid}")
-            time.sleep(0.5)
+        while loop.more():
+            sleep_polling(loop.limiter.reserve(), buffers)
+            loop.record()
     except KeyboardInterrupt:
-        buf_prod.flush()
-        buf_store.flush()
-        buf_sales.flush()
-        buf_inv.flush()
+        pass
+    finally:
+        for buf in buffers:
+            if buf is not None:
+                buf.close()
+        loop.finish()
         print("Stopped and flushed all buffers.")
 
 
-def run_manufacturing(config):
-    from domains import manufacturing_simulator as sim
-
-    conn = get_connection(config["sqlite"]["db_path"])
-    init_mfg_schema(conn)
-
-    client, spread = get_sheets_client(config["service_json"], config["sheet_url"])
-    ws_map = load_worksheets(spread, config["worksheets"])
-
-    sim.init_from_csv_and_seed_db(config, ws_map, conn)
-    equipments, technicians, mfg_mem = sim.load_mfg_memory(conn)
-
-    buf_equip = SheetBuffer(ws_map["equipment"], config["buffer_size"])
-    buf_down = SheetBuffer(ws_map["downtime"], config["buffer_size"])
-    buf_maint = SheetBuffer(ws_map["maintenance"], config["buffer_size"])
-    buf_tech = SheetBuffer(ws_map["technician"], config["buffer_size"])
-
-    print("Manufacturing simulation started... Ctrl+C to stop.")
+async def run_loop_async(name: str, step, buffers, args, rate: float):
+    """
+    run_loop as a task on a shared event loop: waits for the rate limiter
+    with asyncio.sleep, so the other domains' tasks run in the meantime
+    (and between records when unpaced). Cancellation (Ctrl+C, SIGTERM)
+    closes the buffers like Ctrl+C does in run_loop.
+    """
+    loop = RecordLoop(name, step, args, rate)
     try:
-        while True:
-            eq, tech, down, maint, new_e, new_t = sim.generate_records(
-                equipments, technicians, mfg_mem, conn
-            )
-
-            if new_e:
-                buf_equip.add(list(eq.__dict__.values()))
-            if new_t:
-                buf_tech.add(list(tech.__dict__.values()))
-            buf_down.add(list(down.__dict__.values()))
-            buf_maint.add(list(maint.__dict__.values()))
-
-            print(f"DT {down.dt_id} | MT {maint.mt_id} | EQ {eq.eq_id} | TECH {tech.tid}")
-            time.sleep(0.5)
-    except KeyboardInterrupt:
-        buf_equip.flush()
-        buf_tech.flush()
-        buf_down.flush()
-        buf_maint.flush()
-        print("Stopped & flushed.")
-
-
-def run_education(config):
-    from domains import education_simulator as sim
-
-    conn = get_connection(config["sqlite"]["db_path"])
-    init_edu_schema(conn)
+        while loop.more():
+            # always yields once, even unpaced, so the other domains run
+            wait = loop.limiter.reserve()
+            await asyncio.sleep(min(wait, POLL_SECONDS))
+            while wait > POLL_SECONDS:
+                poll_buffers(buffers)
+                wait -= POLL_SECONDS
+                await asyncio.sleep(min(wait, POLL_SECONDS))
+            loop.record()
+    finally:
+        for buf in buffers:
+            if isinstance(buf, WriterDrain):
+                # waits on the shared writer, let the other domains run meanwhile
+                await asyncio.to_thread(buf.close)
+            elif buf is not None:
+                buf.close()
+        loop.finish()
+        print(f"[{name}] Stopped and flushed all buffers.")
+
+
+# domain -> (simulator module, schema init, its load_*_memory and init_*_ids
+# names, the --verbose line over the rows generate_records returns)
+DOMAINS = {
+    "retail": ("domains.retail_simulator", init_retail_schema, "load_retail_memory", "init_retail_ids",
+               "Added sale {2.sale_id} for product {0.pid} at store {1.sid}"),
+    "manufacturing": ("domains.manufacturing_simulator", init_mfg_schema, "load_mfg_memory", "init_mfg_ids",
+                      "DT {2.dt_id} | MT {3.mt_id} | EQ {0.eq_id} | TECH {1.tid}"),
+    "education": ("domains.education_simulator", init_edu_schema, "load_edu_memory", "init_edu_ids",
+                  "REC {2.rid} | RES {3.rid} | STUD {0.sid} | MOD {1.mid}"),
+}
+
+
+def setup_domain(domain, config, args, shard=None, writer=None):
+    """
+    Open the domain's DB, outputs and in-memory state; returns run_loop's
+    (name, step, buffers). Its simulator's generate_records returns a row
+    per TABLES key in order (two entities, then two events) and whether
+    each entity is new; the first two ID_SEQUENCES are the entity tables.
+    """
+    module, init_schema, load_memory, init_ids, line = DOMAINS[domain]
+    sim = importlib.import_module(module)
+
+    conn = get_connection(config["sqlite"]["db_path"], config["sqlite"].get("pragmas"))
+    init_schema(conn)
+    stride = prepare_worker(sim, config, args, conn, shard)
+
+    bufs, flushers = open_outputs(config, sim, conn, shard, writer)
 
-    client, spread = get_sheets_client(config["service_json"], config["sheet_url"])
-    ws_map = load_worksheets(spread, config["worksheets"])
-
-    sim.init_from_csv_and_seed_db(config, ws_map, conn)
-    students, modules, edu_mem = sim.load_edu_memory(conn)
-
-    buf_student = SheetBuffer(ws_map["student"], config["buffer_size"])
-    buf_module = SheetBuffer(ws_map["module"], config["buffer_size"])
-    buf_progress = SheetBuffer(ws_map["progress"], config["buffer_size"])
-    buf_resource = SheetBuffer(ws_map["resource"], config["buffer_size"])
+    # Load in-memory state
+    first, second = getattr(sim, load_memory)(conn)
+    # retail's stock ledger, keyed by the entity stores' indexes
+    ledger = getattr(sim, "ledger", None)
+    if ledger is not None:
+        ledger.configure(config.get("inventory"))
+        ledger.open(conn, first, second)
+    ids = getattr(sim, init_ids)(config["sqlite"]["db_path"], config["sqlite"].get("id_block_size", 100), **stride)
+    db = BatchWriter(conn, config["sqlite"].get("batch_rows", 500), config["sqlite"].get("batch_seconds", 1.0))
+    # other workers' new entities become sampleable every refresh_every records;
+    # not with --seed, where that would make the output timing dependent
+    entity_tables = list(sim.ID_SEQUENCES.values())[:2]
+    pools = SharedPools(db, [
+        SharedPool(conn, table, column, store) for (table, column, _), store in zip(entity_tables, (first, second))
+    ] if shard is not None and args.seed is None else [], config.get("refresh_every", 1000))
+
+    buf_first, buf_second, buf_event, buf_other = (bufs[key] for key in sim.TABLES)
+
+    def step():
+        pools.tick()
+        a, b, event, other, new_a, new_b = sim.generate_records(first, second, db, ids)
+
+        if new_a:
+            buf_first.add(list(a.__dict__.values()))
+        if new_b:
+            buf_second.add(list(b.__dict__.values()))
+        buf_event.add(list(event.__dict__.values()))
+        buf_other.add(list(other.__dict__.values()))
+
+        return line.format(a, b, event, other)
+
+    print(f"{domain.capitalize()} simulation started... Ctrl+C to stop.")
+    name = domain if shard is None else f"{domain}/w{shard}"
+    return name, step, [db, sim.clock] + ([ledger] if ledger is not None else []) + flushers
+
+
+def run_domain(domain, config, args, shard=None):
+    run_loop(*setup_domain(domain, config, args, shard), args)
+
+
+def parse_domains(value: str):
+    """
+    --domain: one domain, a comma-separated list, or "all".
+    """
+    names = list(DOMAINS) if value == "all" else [d.strip() for d in value.split(",") if d.strip()]
+    unknown = [d for d in names if d not in DOMAINS]
+    if unknown or not names:
+        raise argparse.ArgumentTypeError(
+            f"unknown domain {', '.join(unknown) or value!r}; choose from {', '.join(DOMAINS)} or all")
+    return names
+
+
+def domain_config(config, domain: str, multi: bool):
+    """
+    Config for one domain: the top-level keys, overridden by the domain's
+    entry under `domains` (dict-valued keys such as sqlite are merged one
+    level deep). Running several domains, one left on the shared
+    sqlite.db_path gets its own file next to it (retail.db -> retail.education.db).
+    """
+    merged = {k: v for k, v in config.items() if k != "domains"}
+    own = (config.get("domains") or {}).get(domain) or {}
+    for key, value in own.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = {**merged[key], **value}
+        merged[key] = value
+    if multi and "db_path" not in (own.get("sqlite") or {}):
+        root, ext = os.path.splitext(merged["sqlite"]["db_path"])
+        merged["sqlite"] = {**merged["sqlite"], "db_path": f"{root}.{domain}{ext}"}
+    return merged
+
+
+def run_domains(domains, config, args):
+    """
+    Several domains in one process, each a task on one asyncio event loop
+    at its own rate (`rate` in its `domains` entry, else --rate). They
+    share one Sheets client and one background SheetWriter, whose
+    write_quota (requests per minute) is the budget they split.
+    """
+    writer = make_sheet_writer(config)
+
+    async def main_task():
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:  # Windows event loops
+            pass
+        tasks = []
+        for domain in domains:
+            cfg = domain_config(config, domain, multi=True)
+            name, step, buffers = setup_domain(domain, cfg, args, writer=writer)
+            tasks.append(run_loop_async(name, step, buffers, args, cfg.get("rate", args.rate)))
+        await asyncio.gather(*tasks)
 
-    print("Education simulation started... Ctrl+C to stop.")
     try:
-        while True:
-            stu, mod, prog, res, new_s, new_m = sim.generate_records(
-                students, modules, edu_mem, conn
-            )
-
-            if new_s:
-                buf_student.add(list(stu.__dict__.values()))
-            if new_m:
-                buf_module.add(list(mod.__dict__.values()))
-            buf_progress.add(list(prog.__dict__.values()))
-            buf_resource.add(list(res.__dict__.values()))
-
-            print(f"REC {prog.rid} | RES {res.rid} | STUD {stu.sid} | MOD {mod.mid}")
-            time.sleep(0.5)
-    except KeyboardInterrupt:
-        buf_student.flush()
-        buf_module.flush()
-        buf_progress.flush()
-        buf_resource.flush()
-        print("Stopped & flushed.")
+        asyncio.run(main_task())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def run_workers(domain, config, args):
+    """
+    --workers N: seed once here, run N sharded copies of the domain loop in
+    separate processes, then merge their per-shard file outputs (in shard
+    order, so a seeded --count run merges to the same files every time).
+    """
+    module, init_schema = DOMAINS[domain][:2]
+    sim = importlib.import_module(module)
+
+    conn = get_connection(config["sqlite"]["db_path"], config["sqlite"].get("pragmas"))
+    init_schema(conn)
+    open_spreadsheet(config, sim, conn)
+    conn.close()
+
+    # workers draw strided IDs from these counters, so no two overlap
+    ids = IdAllocator(config["sqlite"]["db_path"])
+    for key, (table, column, prefix) in sim.ID_SEQUENCES.items():
+        ids.register(key, table, column, prefix)
+    args.id_bases = ids.snapshot()
+    ids.close()
+
+    run_sharded(functools.partial(run_domain, domain), config, args, args.workers)
+    merge_shard_outputs(config, sim.TABLES, args.workers)
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--domain", choices=["retail", "manufacturing", "education"], required=True)
+    parser.add_argument("--domain", type=parse_domains, required=True,
+                        help="retail, manufacturing, education, a comma-separated list or all")
     parser.add_argument("--config", type=str, help="Path to YAML config", required=True)
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="Records per second (token-bucket paced); 0 = as fast as possible")
+    parser.add_argument("--count", type=int, default=None, help="Stop after this many records")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--progress-every", type=float, default=5.0,
+                        help="Seconds between progress lines; 0 disables them")
+    parser.add_argument("--verbose", action="store_true", help="Print one line per record")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Generator processes; --count and --rate are split across them")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed all random streams for a reproducible run")
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="PREFIX",
+                        help="Time each pipeline stage and print percentiles at exit; with PREFIX "
+                             "also write PREFIX.pstats (cProfile) and PREFIX.collapsed (flamegraph stacks)")
     args = parser.parse_args()
 
     config = load_config(args.config)
 
-    if args.domain == "retail":
-        run_retail(config)
-    elif args.domain == "manufacturing":
-        run_manufacturing(config)
-    elif args.domain == "education":
-        run_education(config)
+    if len(args.domain) > 1:
+        if args.workers > 1:
+            parser.error("--workers runs a single --domain")
+        run_domains(args.domain, config, args)
+        return
+    domain = args.domain[0]
+    config = domain_config(config, domain, multi=False)
+    if args.workers > 1:
+        # every worker would keep its own balances and overwrite the others' saved ones
+        if domain == "retail" and {**INVENTORY_SETTINGS, **(config.get("inventory") or {})}["enabled"]:
+            parser.error("--workers with --domain retail needs `inventory: {enabled: false}`: "
+                         "the stock ledger runs in one process")
+        run_workers(domain, config, args)
+    else:
+        run_domain(domain, config, args)
 
 
 if __name__ == "__main__":
@@ -32,7 +32,7 @@ class Maintenance:
     mtype: str
     parts: str
     tech: str
-    cost: int
+    cost: float
     mttr: int
     remarks: str
 